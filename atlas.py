@@ -0,0 +1,94 @@
+import mmap
+import struct
+
+# Binary frame atlas. A header is followed by every frame's x, y, w, h as little-endian int32, so frame N is at
+# a fixed offset and can be read without parsing the rest. Names, when written, follow as a table of uint32
+# offsets into a block of UTF-8 strings, so they're found in constant time too.
+#
+#   header   magic 'SSA1', uint16 version, uint16 flags, uint32 frame count, uint32 names offset (0 if none)
+#   frames   count * 4 int32
+#   names    (count + 1) uint32 offsets relative to the string block, then the string block
+
+HEADER = struct.Struct('<4sHHII')
+MAGIC = b'SSA1'
+VERSION = 1
+FRAME = struct.Struct('<4i')
+
+# Writes frames from an iterable of (x, y, w, h) tuples or Rects, with an optional list of names, one per frame.
+# Frames are written as they come, so they can be streamed. Returns the number of frames.
+def writeAtlas(fileName, frames, names=None):
+    with open(fileName, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0))
+        count = 0
+        for frame in frames:
+            if hasattr(frame, 'Get'): frame = frame.Get()
+            file.write(FRAME.pack(*frame))
+            count += 1
+
+        namesOffset = 0
+        if names is not None:
+            if len(names) != count:
+                raise ValueError('Expected %d names, got %d' % (count, len(names)))
+            namesOffset = HEADER.size + count * FRAME.size
+            encoded = [name.encode('utf-8') for name in names]
+            offsets = [0]
+            for name in encoded:
+                offsets.append(offsets[-1] + len(name))
+            file.write(struct.pack('<%dI' % len(offsets), *offsets))
+            file.write(b''.join(encoded))
+
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, VERSION, 0, count, namesOffset))
+    return count
+
+# Memory-maps an atlas file for random access to its frames.
+class AtlasReader():
+    def __init__(self, fileName):
+        with open(fileName, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, flags, self.count, self.namesOffset = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('Not a version %d atlas file: %s' % (VERSION, fileName))
+        if HEADER.size + self.count * FRAME.size > len(self.data):
+            self.close()
+            raise ValueError('Atlas file is truncated: ' + fileName)
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def hasNames(self):
+        return self.namesOffset != 0
+
+    # Returns frame index as an (x, y, w, h) tuple.
+    def getFrame(self, index):
+        if not 0 <= index < self.count: raise IndexError(index)
+        return FRAME.unpack_from(self.data, HEADER.size + index * FRAME.size)
+
+    # Returns every frame as a list of (x, y, w, h) tuples.
+    def getFrames(self):
+        values = struct.unpack_from('<%di' % (self.count * 4), self.data, HEADER.size)
+        return [values[i:i + 4] for i in range(0, len(values), 4)]
+
+    # Returns the name of frame index, or None if the atlas has no names.
+    def getName(self, index):
+        if not self.namesOffset: return None
+        if not 0 <= index < self.count: raise IndexError(index)
+        start, end = struct.unpack_from('<2I', self.data, self.namesOffset + index * 4)
+        strings = self.namesOffset + (self.count + 1) * 4
+        return self.data[strings + start:strings + end].decode('utf-8')
+
+# Returns (frames, names) from an atlas file, where names is None if it has none.
+def readAtlas(fileName):
+    with AtlasReader(fileName) as reader:
+        names = [reader.getName(i) for i in range(len(reader))] if reader.hasNames() else None
+        return reader.getFrames(), names
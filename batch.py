@@ -0,0 +1,162 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from itertools import repeat
+
+import atlas
+import colorkey
+import dedup
+import exporter
+import imagebackend
+import instrument
+import spritefinder
+from detectcache import DetectionCache
+from model import framesToJson
+from pngio import PngReader
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None # Python 2 without the futures backport slices one sheet at a time.
+
+# Expands files, directories and glob patterns into a sorted list of PNG paths.
+def collectSheets(inputs):
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.update(glob.glob(os.path.join(item, '*.png')))
+        elif os.path.isfile(item):
+            paths.add(item)
+        else:
+            paths.update(glob.glob(item))
+    return sorted(paths)
+
+# Writes frames JSON like framesToJson, one frame at a time as rects come in, with the alias fields of any
+# duplicates from dedup.findDuplicates. Returns the number of frames.
+def writeFramesStreaming(file, rects, duplicates=None):
+    file.write('{"frames": {')
+    count = 0
+    for rect in rects:
+        frame = framesToJson([rect])['frames']['0']
+        if duplicates is not None: frame.update(dedup.getAliasFields(count, duplicates[count]))
+        file.write((', ' if count else '') + json.dumps(str(count)) + ': ' + json.dumps(frame))
+        count += 1
+    file.write('}}')
+    return count
+
+# Writes a sheet's frames to outDir as name.json, or name.atlas when outFormat is 'atlas'. Returns the number
+# of frames. Duplicates are only written to JSON.
+def writeFrames(outDir, name, rects, outFormat='json', duplicates=None):
+    if outFormat == 'atlas':
+        return atlas.writeAtlas(os.path.join(outDir, name + '.atlas'), rects)
+    with open(os.path.join(outDir, name + '.json'), 'w') as file:
+        return writeFramesStreaming(file, rects, duplicates)
+
+# Finds the sprites in one sheet while decoding it and writes its frames as they're found, without loading the
+# whole sheet. Returns (path, sprite count, pixel count).
+def streamSheet(path, outDir, outFormat='json', alphaThreshold=0, colorKey=None):
+    name = os.path.splitext(os.path.basename(path))[0]
+    count = writeFrames(outDir, name, spritefinder.findStreaming(path, 8, alphaThreshold, colorKey), outFormat)
+    with PngReader(path) as reader:
+        return path, count, reader.Width * reader.Height
+
+# Finds the sprites in one sheet and writes its frames in outFormat, plus a PNG per slice if writeSlices is set.
+# Detection results are reused from the cache unless useCache is False. With a dedupe mode from dedup.MODES, frames
+# matching an earlier frame are marked as its aliases and their slices aren't written. Slices are compressed at
+# pngLevel on sliceWorkers threads. alphaThreshold and colorKey choose the background as in spritefinder.find.
+# Returns (path, sprite count, pixel count, cache hits).
+def sliceSheet(path, outDir, writeSlices, stream=False, useCache=True, outFormat='json', dedupe=None, pngLevel=exporter.DEFAULT_LEVEL, sliceWorkers=None, alphaThreshold=0, colorKey=None):
+    if stream: return streamSheet(path, outDir, outFormat, alphaThreshold, colorKey) + (0,)
+    with instrument.span('load', file=os.path.basename(path)):
+        img = imagebackend.loadImage(path)
+    cache = DetectionCache() if useCache else None
+    spriteBounds = spritefinder.find(img, alphaThreshold=alphaThreshold, cache=cache, colorKey=colorKey)
+    duplicates = dedup.findDuplicates(img, spriteBounds, dedupe) if dedupe else None
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    writeFrames(outDir, name, spriteBounds, outFormat, duplicates)
+
+    if writeSlices:
+        sliceDir = os.path.join(outDir, name)
+        if not os.path.isdir(sliceDir): os.makedirs(sliceDir)
+        indices = dedup.getUnique(duplicates) if duplicates is not None else range(len(spriteBounds)) # Duplicates are written as their original.
+        filePaths = [os.path.join(sliceDir, str(i) + '_' + os.path.basename(path)) for i in indices]
+        exporter.exportSlices(img, [spriteBounds[i] for i in indices], filePaths, pngLevel, sliceWorkers)
+
+    return path, len(spriteBounds), img.Width * img.Height, cache.hits if cache is not None else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Find the sprites in PNG sheets and export them without the GUI.')
+    parser.add_argument('inputs', nargs='+', help='PNG files, directories of PNGs, or glob patterns')
+    parser.add_argument('-o', '--out', default='.', help='directory to write JSON (and slices) to')
+    parser.add_argument('-f', '--format', choices=['json', 'atlas'], default='json', help='frame file format')
+    parser.add_argument('-s', '--slices', action='store_true', help='also write a PNG per slice')
+    parser.add_argument('-j', '--workers', type=int, default=1, help='sheets to process in parallel')
+    parser.add_argument('-z', '--png-level', type=int, choices=range(10), default=exporter.DEFAULT_LEVEL, metavar='0-9', help='zlib level of slice PNGs; 1 is fast for test builds')
+    parser.add_argument('-a', '--alpha-threshold', type=int, default=0, metavar='0-255', help='treat pixels with alpha at or below this as background, to split sprites joined by faint haloes')
+    parser.add_argument('-k', '--color-key', metavar='COLOR[:TOLERANCE]', help='treat this color as background: a hex color like ff00ff, or a corner such as top-left to sample it from each sheet')
+    parser.add_argument('--stream', action='store_true', help='find sprites while decoding, for sheets too big to load; Paeth-filtered PNGs decode at only about 3 Mpx/s with NumPy and 0.5 Mpx/s without')
+    parser.add_argument('--dedupe', choices=dedup.MODES, help='mark frames matching an earlier frame as its aliases and write its slice once; flips also matches flipped and rotated copies')
+    parser.add_argument('--trace', metavar='FILE', help='write a Chrome trace of loading, searching and writing each sheet to FILE')
+    parser.add_argument('--profile', metavar='SPAN=FILE', help='profile the first span called SPAN, such as detect or export, into FILE')
+    parser.add_argument('--no-cache', dest='cache', action='store_false', help='search every sheet even if it was searched before')
+    args = parser.parse_args(argv)
+    if args.stream and args.slices:
+        parser.error('--stream can\'t be combined with --slices')
+    if args.dedupe and (args.stream or args.format != 'json'):
+        parser.error('--dedupe needs whole sheets and JSON frames')
+    colorKey = None
+    if args.color_key:
+        try:
+            colorKey = colorkey.parseColorKey(args.color_key)
+        except ValueError as error:
+            parser.error(str(error))
+    if args.stream and isinstance(colorKey, colorkey.CornerColorKey) and colorKey.corner.startswith('bottom'):
+        parser.error('--stream can only sample the top corners')
+    if (args.trace or args.profile) and args.workers > 1:
+        parser.error('--trace and --profile only see the main process, so need -j 1')
+    if args.trace: instrument.traceToFile(args.trace)
+    if args.profile:
+        name, separator, fileName = args.profile.partition('=')
+        instrument.profileNext(name, fileName or name + '.prof')
+
+    sheets = collectSheets(args.inputs)
+    if not sheets:
+        parser.error('no PNG sheets found')
+    if not os.path.isdir(args.out): os.makedirs(args.out)
+
+    start = time.time()
+    sprites = 0
+    pixels = 0
+    cached = 0
+    executor = None
+    if args.workers > 1 and ProcessPoolExecutor is not None:
+        executor = ProcessPoolExecutor(max_workers=args.workers)
+        # Each process writes its slices on one thread, since the processes already use the cores.
+        results = executor.map(sliceSheet, sheets, repeat(args.out), repeat(args.slices), repeat(args.stream), repeat(args.cache), repeat(args.format), repeat(args.dedupe), repeat(args.png_level), repeat(1), repeat(args.alpha_threshold), repeat(colorKey))
+    else:
+        results = (sliceSheet(path, args.out, args.slices, args.stream, args.cache, args.format, args.dedupe, args.png_level,
+            alphaThreshold=args.alpha_threshold, colorKey=colorKey) for path in sheets)
+    try:
+        for path, count, area, hits in results:
+            print('%s: %d sprites%s' % (path, count, ' (cached)' if hits else ''))
+            sprites += count
+            pixels += area
+            cached += hits
+    finally:
+        if executor is not None: executor.shutdown()
+    elapsed = max(time.time() - start, 1e-9)
+
+    print('%d sheets, %d sprites in %.2fs (%.2f sheets/s, %.0f pixels/s)' % (
+        len(sheets), sprites, elapsed, len(sheets) / elapsed, pixels / elapsed))
+    if args.cache and not args.stream:
+        stats = DetectionCache().getStats()
+        print('detection cache: %d of %d sheets found, %d entries, %.1f MB' % (
+            cached, len(sheets), stats['items'], stats['bytes'] / 1048576.0))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
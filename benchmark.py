@@ -0,0 +1,240 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Process, Queue, cpu_count
+
+import imagebackend
+import pngio
+import spritefinder
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # Sheets can't be generated.
+
+try:
+    import resource
+except ImportError:
+    resource = None # Peak memory isn't recorded on Windows.
+
+# Times each sprite finding backend on generated sheets, checks what they find against a reference, and writes
+# the results as JSON so runs on different commits can be compared. Every run happens in a new process so its
+# peak memory is its own.
+#
+#   python benchmark.py -o before.json
+#   python benchmark.py -o after.json --compare before.json
+
+BACKENDS = ['perpixel', 'vectorized', 'tiled', 'streaming']
+SHAPES = ['block', 'diagonal', 'ring', 'concave', 'blob']
+
+# findPerPixel is the reference, but it's too slow to run on sheets bigger than this. Bigger sheets are checked
+# against findBounds instead, which is checked against findPerPixel on the smaller ones.
+REFERENCE_MAX_PIXELS = 4096 * 4096
+
+# Returns a size by size mask of a shape: a filled block, an X of pixels touching only at their corners, a ring
+# with a hole, a block with a notch cut into it, or an ellipse.
+def makeShape(kind, size, rng):
+    width, height = rng.randint(1, size + 1), rng.randint(1, size + 1)
+    mask = np.zeros((size, size), bool)
+    if kind == 'block':
+        mask[:height, :width] = True
+    elif kind == 'diagonal':
+        steps = np.arange(min(width, height))
+        mask[steps, steps] = True
+        mask[steps, steps[::-1]] = True
+    elif kind == 'ring':
+        mask[:height, :width] = True
+        thickness = rng.randint(1, 4)
+        mask[thickness:height - thickness, thickness:width - thickness] = False
+    elif kind == 'concave':
+        mask[:height, :width] = True
+        mask[:height * 2 // 3, width // 3:width * 2 // 3] = False
+    else:
+        y, x = np.ogrid[:height, :width]
+        mask[:height, :width] = ((x - (width - 1) / 2.0) / (width / 2.0)) ** 2 + ((y - (height - 1) / 2.0) / (height / 2.0)) ** 2 <= 1
+    return mask
+
+# Returns a reproducible RgbaImage of sprites, one in each cell of a grid with probability density, each a random
+# shape that leaves a transparent gap to its neighbours. noise is the share of pixels set at random on top.
+def generateSheet(width, height, density=0.5, noise=0.0001, seed=0, cell=32):
+    rng = np.random.RandomState(seed)
+    alpha = np.zeros((height, width), np.uint8)
+    size = cell - 1
+    for top in range(0, height - size + 1, cell):
+        for left in range(0, width - size + 1, cell):
+            if rng.random_sample() >= density: continue
+            shape = makeShape(SHAPES[rng.randint(len(SHAPES))], size, rng)
+            alpha[top:top + size, left:left + size][shape] = rng.randint(1, 256)
+
+    count = int(noise * width * height)
+    alpha[rng.randint(0, height, count), rng.randint(0, width, count)] = 255
+
+    rgba = np.empty((height, width, 4), np.uint8)
+    rgba[:, :, 0] = alpha
+    rgba[:, :, 1] = alpha[:, ::-1]
+    rgba[:, :, 2] = 128
+    rgba[:, :, 3] = alpha
+    return imagebackend.RgbaImage(width, height, bytearray(rgba.tobytes()))
+
+# Returns the peak memory of this process in bytes, or None if it's unknown.
+def getPeakRss():
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # Kilobytes everywhere else.
+
+# Finds the sprites of a sheet with one backend. Returns the list of (x, y, w, h) bounds.
+def runBackend(backend, img, connectivity, workers, fileName=None):
+    if backend == 'perpixel':
+        return [rect.Get() for rect in spritefinder.findPerPixel(img, connectivity)]
+    if backend == 'vectorized':
+        return spritefinder.findBounds(spritefinder.getForegroundMask(img), connectivity)
+    if backend == 'tiled':
+        return spritefinder.findBoundsTiled(spritefinder.getForegroundMask(img), workers, connectivity)
+    return [rect.Get() for rect in spritefinder.findStreaming(fileName, connectivity)]
+
+# Process target. Writes a generated sheet as raw RGBA pixels to raw, for the backends that search a loaded
+# image, and as a PNG to png for the streaming backend unless it's None.
+def writeSheet(case, raw, png):
+    img = generateSheet(case['size'], case['size'], case['density'], case['noise'], case['seed'])
+    with open(raw, 'wb') as file:
+        file.write(img.data)
+    if png is not None:
+        pngio.writePng(png, img.Width, img.Height, img.data, 1)
+
+# Process target. Reads the sheet, times one backend on it and puts (seconds, peak RSS, count, digest) on queue.
+# Sheets are generated in a process of their own, so the peak is only what reading and searching one costs. The
+# streaming backend's time includes decoding the sheet, which it can't be separated from.
+def measure(queue, case, backend, workers, sheet):
+    raw, png = sheet
+    img = None
+    if backend != 'streaming':
+        with open(raw, 'rb') as file:
+            img = imagebackend.RgbaImage(case['size'], case['size'], bytearray(file.read()))
+    start = time.time()
+    spriteBounds = runBackend(backend, img, case['connectivity'], workers, png)
+    elapsed = time.time() - start
+    digest = hashlib.sha1(json.dumps([list(bounds) for bounds in spriteBounds]).encode('ascii')).hexdigest()
+    queue.put((elapsed, getPeakRss(), len(spriteBounds), digest))
+
+def runCase(case, backend, workers, sheet):
+    queue = Queue()
+    process = Process(target=measure, args=(queue, case, backend, workers, sheet))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+# Returns the id of the checked out commit, or None outside a git checkout.
+def getCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Runs every backend on every combination of sizes, densities and connectivities. Returns a list of result dicts.
+def benchmark(sizes, densities, backends=BACKENDS, connectivities=(8,), noise=0.0001, seed=0, workers=None, repeat=1):
+    workers = workers or cpu_count()
+    results = []
+    print('%-6s %-7s %-4s %-10s %9s %14s %9s %8s %s' % ('size', 'density', 'conn', 'backend', 'time', 'pixels/s', 'peak MB', 'sprites', 'check'))
+    for size in sizes:
+        for density in densities:
+            for connectivity in connectivities:
+                case = {'size': size, 'density': density, 'noise': noise, 'seed': seed, 'connectivity': connectivity}
+                directory = tempfile.mkdtemp()
+                try:
+                    sheet = (os.path.join(directory, 'sheet.rgba'), os.path.join(directory, 'sheet.png') if 'streaming' in backends else None)
+                    process = Process(target=writeSheet, args=(case,) + sheet)
+                    process.start()
+                    process.join()
+                    # The reference checks the others, so it runs first whatever the order of backends, and even when
+                    # it isn't one of them.
+                    referenceBackend = 'perpixel' if size * size <= REFERENCE_MAX_PIXELS else 'vectorized'
+                    runs = {referenceBackend: [runCase(case, referenceBackend, workers, sheet) for i in range(repeat if referenceBackend in backends else 1)]}
+                    reference = runs[referenceBackend][0][3]
+                    for backend in backends:
+                        if backend in runs or backend == 'perpixel': continue
+                        runs[backend] = [runCase(case, backend, workers, sheet) for i in range(repeat)]
+                finally:
+                    shutil.rmtree(directory)
+
+                for backend in backends:
+                    if backend not in runs: continue
+                    elapsed = min(run[0] for run in runs[backend])
+                    peak, count, digest = runs[backend][0][1:]
+
+                    result = dict(case)
+                    result.update({
+                        'backend': backend,
+                        'seconds': elapsed,
+                        'pixelsPerSecond': size * size / max(elapsed, 1e-9),
+                        'peakRss': peak,
+                        'sprites': count,
+                        'reference': referenceBackend,
+                        'matchesReference': digest == reference,
+                    })
+                    results.append(result)
+                    check = 'ok' if result['matchesReference'] else 'MISMATCH'
+                    if referenceBackend != 'perpixel': check += ' vs ' + referenceBackend
+                    print('%-6d %-7g %-4d %-10s %8.3fs %14.0f %9s %8d %s' % (size, density, connectivity, backend, elapsed,
+                        result['pixelsPerSecond'], '%.1f' % (peak / 1048576.0) if peak else '-', count, check))
+    return results
+
+# Prints how much faster each result is than the result for the same case and backend in an earlier run.
+def compare(results, previous):
+    key = lambda result: tuple(result[name] for name in ('size', 'density', 'noise', 'seed', 'connectivity', 'backend'))
+    before = dict((key(result), result) for result in previous['results'])
+    print('\ncompared with %s' % (previous.get('commit') or 'earlier run'))
+    for result in results:
+        old = before.get(key(result))
+        if old is None: continue
+        print('%-6d %-7g %-4d %-10s %6.2fx' % (result['size'], result['density'], result['connectivity'], result['backend'], old['seconds'] / max(result['seconds'], 1e-9)))
+
+def parseList(value, kind):
+    return [kind(item) for item in value.split(',') if item]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the sprite finding backends on generated sheets.')
+    parser.add_argument('--sizes', default='256,1024,4096', help='comma separated sheet sides, up to 16384')
+    parser.add_argument('--densities', default='0.05,0.5,1', help='comma separated shares of grid cells with a sprite')
+    parser.add_argument('--backends', default=','.join(BACKENDS), help='comma separated backends from ' + ', '.join(BACKENDS))
+    parser.add_argument('--connectivity', default='8', help='comma separated connectivities, 4 and/or 8')
+    parser.add_argument('--noise', type=float, default=0.0001, help='share of pixels set at random')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='processes for the tiled backend')
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='runs of each case, keeping the fastest')
+    parser.add_argument('-o', '--out', help='JSON file to write the results to')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    args = parser.parse_args(argv)
+    if np is None:
+        parser.error('generating sheets requires NumPy')
+    backends = parseList(args.backends, str)
+    for backend in backends:
+        if backend not in BACKENDS: parser.error('unknown backend: ' + backend)
+
+    results = benchmark(parseList(args.sizes, int), parseList(args.densities, float), backends,
+        parseList(args.connectivity, int), args.noise, args.seed, args.workers, args.repeat)
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump({
+                'commit': getCommit(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'cpus': cpu_count(),
+                'results': results,
+            }, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+    return 1 if any(not result['matchesReference'] for result in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
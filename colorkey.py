@@ -0,0 +1,123 @@
+import imagebackend
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # Foreground buffers are built one pixel at a time instead.
+
+# Background colors for sheets that mark empty space with a color, like magenta, instead of transparency.
+# A pixel is background if each of its channels is within tolerance of the key color, or its alpha is at or
+# below the alpha threshold. Sheets without an alpha channel are treated as opaque. The whole sheet is
+# classified in one pass before searching, so the flood fill only ever sees a foreground buffer or mask.
+
+MAGENTA = (255, 0, 255)
+CORNERS = ['top-left', 'top-right', 'bottom-left', 'bottom-right']
+
+# Masks are built this many pixels at a time, so huge sheets don't need full size temporaries.
+BAND_PIXELS = 1024 * 1024
+
+class ColorKey():
+    def __init__(self, color=MAGENTA, tolerance=0):
+        self.color = tuple(color)
+        self.tolerance = tolerance
+
+    # Returns a string naming the key, for detection cache keys.
+    def getKey(self):
+        return 'key %02x%02x%02x %d' % (self.color + (self.tolerance,))
+
+    # Returns the (r, g, b) color that is background in img.
+    def getColor(self, img):
+        return self.color
+
+    # Returns the inclusive (low, high) range of each channel that counts as background.
+    def getRanges(self, color):
+        return [(max(0, value - self.tolerance), min(255, value + self.tolerance)) for value in color]
+
+    # Returns a (height, width) boolean array of the foreground pixels of img. Requires NumPy.
+    def getMask(self, img, alphaThreshold=0):
+        rgba = imagebackend.getRgbaArray(img)
+        ranges = self.getRanges(self.getColor(img))
+        mask = np.empty((img.Height, img.Width), bool)
+        rows = max(1, BAND_PIXELS // max(1, img.Width))
+        for top in range(0, img.Height, rows):
+            band = rgba[top:top + rows]
+            background = np.ones(band.shape[:2], bool)
+            for channel, (low, high) in enumerate(ranges):
+                values = band[:, :, channel]
+                background &= (values >= low) & (values <= high)
+            if img.HasAlpha(): background |= band[:, :, 3] <= alphaThreshold
+            mask[top:top + rows] = ~background
+        return mask
+
+    # Returns a bytearray with one byte per pixel, 1 for foreground and 0 for background.
+    def getBytes(self, img, alphaThreshold=0):
+        data = imagebackend.toRgbaImage(img).data
+        return self.getRowBytes(data, self.getColor(img), alphaThreshold if img.HasAlpha() else -1)
+
+    # Returns the foreground bytes of a buffer of RGBA pixels. A negative alphaThreshold ignores alpha.
+    def getRowBytes(self, data, color, alphaThreshold=0):
+        if np is not None:
+            pixels = np.frombuffer(bytes(data), np.uint8).reshape(-1, 4)
+            background = np.ones(len(pixels), bool)
+            for channel, (low, high) in enumerate(self.getRanges(color)):
+                background &= (pixels[:, channel] >= low) & (pixels[:, channel] <= high)
+            if alphaThreshold >= 0: background |= pixels[:, 3] <= alphaThreshold
+            return bytearray((~background).astype(np.uint8).tobytes())
+
+        inRange = [bytearray(1 if low <= value <= high else 0 for value in range(256)) for low, high in self.getRanges(color)]
+        visible = bytearray(1 if value > alphaThreshold else 0 for value in range(256))
+        red, green, blue = inRange
+        out = bytearray(len(data) // 4)
+        for i in range(len(out)):
+            pixel = i * 4
+            if visible[data[pixel + 3]] and not (red[data[pixel]] and green[data[pixel + 1]] and blue[data[pixel + 2]]):
+                out[i] = 1
+        return out
+
+    # Yields the foreground bytes of each row of RGBA pixels, for searching while decoding.
+    def iterRowBytes(self, rows, width, alphaThreshold=0):
+        for row in rows:
+            yield self.getRowBytes(row, self.color, alphaThreshold)
+
+# A color key that takes its color from a corner pixel of each sheet, for sheets on a flat background of any color.
+class CornerColorKey(ColorKey):
+    def __init__(self, corner='top-left', tolerance=0):
+        if corner not in CORNERS: raise ValueError('Unknown corner: %r' % corner)
+        ColorKey.__init__(self, (0, 0, 0), tolerance)
+        self.corner = corner
+
+    def getKey(self):
+        return 'corner %s %d' % (self.corner, self.tolerance)
+
+    def getCornerX(self, width):
+        return width - 1 if self.corner.endswith('right') else 0
+
+    def getColor(self, img):
+        x = self.getCornerX(img.Width)
+        y = img.Height - 1 if self.corner.startswith('bottom') else 0
+        if isinstance(img, imagebackend.RgbaImage):
+            start = (y * img.Width + x) * 4
+            return tuple(bytearray(img.data[start:start + 3]))
+        return (img.GetRed(x, y), img.GetGreen(x, y), img.GetBlue(x, y))
+
+    # Only the top corners are known before the rest of the sheet is decoded.
+    def iterRowBytes(self, rows, width, alphaThreshold=0):
+        if self.corner.startswith('bottom'):
+            raise ValueError('The %s corner can\'t be sampled while streaming' % self.corner)
+        color = None
+        for row in rows:
+            if color is None:
+                start = self.getCornerX(width) * 4
+                color = tuple(bytearray(row[start:start + 3]))
+            yield self.getRowBytes(row, color, alphaThreshold)
+
+# Returns a color key from a command line spec: a hex color like ff00ff, or a corner name or 'corner' for the
+# top left, either optionally followed by :tolerance.
+def parseColorKey(spec):
+    name, separator, tolerance = spec.partition(':')
+    tolerance = int(tolerance) if tolerance else 0
+    if name == 'corner': name = CORNERS[0]
+    if name in CORNERS: return CornerColorKey(name, tolerance)
+    name = name.lstrip('#')
+    if len(name) != 6: raise ValueError('Not a color or corner: %r' % spec)
+    return ColorKey(tuple(bytearray.fromhex(name)), tolerance)
@@ -0,0 +1,182 @@
+import hashlib
+import struct
+import imagebackend
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # Slices are hashed one at a time with SHA-1 instead.
+
+# Slices match if their pixels are the same ('exact') or the same after flipping or rotating ('flips').
+# Fully transparent pixels match whatever their color.
+MODES = ['exact', 'flips']
+
+# Every way a slice can be flipped and rotated, as (clockwise quarter turns, flipped horizontally first).
+TRANSFORMS = [(turns, flip) for flip in (False, True) for turns in range(4)]
+
+# Slices of a size are copied out of the sheet and keyed this many bytes at a time.
+BATCH_BYTES = 16 * 1024 * 1024
+
+def hashPixels(width, height, data):
+    digest = hashlib.sha1(struct.pack('<II', width, height))
+    digest.update(data)
+    return digest.digest()
+
+# Random odd weights for the rows and columns of a slice, extended as bigger slices come along.
+keyWeights = [np.zeros(0, np.uint64)] * 2 if np is not None else None
+
+# Returns a (height, width) uint64 array of weights for getCheapKeys. With symmetric set, a pixel's weight only
+# depends on its distances from the nearest two edges in either order, so it's the same wherever a flip or a
+# quarter turn moves the pixel.
+def getKeyWeights(width, height, symmetric):
+    size = max(width, height)
+    if len(keyWeights[0]) < size:
+        random = np.random.RandomState(0)
+        keyWeights[:] = [random.randint(1, 1 << 62, size * 2, np.int64).astype(np.uint64) | np.uint64(1) for i in range(2)]
+    rowWeights, columnWeights = keyWeights
+    if not symmetric:
+        return rowWeights[:height, None] * columnWeights[None, :width]
+    ys = np.minimum(np.arange(height), np.arange(height)[::-1])[:, None]
+    xs = np.minimum(np.arange(width), np.arange(width)[::-1])[None, :]
+    return rowWeights[np.minimum(ys, xs)] * columnWeights[np.maximum(ys, xs)]
+
+# Returns a uint64 key for each of a (slices, height, width, 4) array of pixels, where fully transparent pixels
+# count as zero whatever their color. Equal pixels give equal keys, and with symmetric weights so do flipped
+# and turned copies. Different pixels almost always give different keys.
+def getCheapKeys(pixels, weights):
+    values = np.ascontiguousarray(pixels).view(np.uint32)[..., 0]
+    values = np.where(pixels[..., 3] == 0, np.uint32(0), values).astype(np.uint64)
+    values *= np.uint64(0x9E3779B97F4A7C15)
+    values ^= values >> np.uint64(32)
+    values *= np.uint64(0xBF58476D1CE4E5B9)
+    values ^= values >> np.uint64(29)
+    values *= weights
+    return values.sum(axis=(1, 2), dtype=np.uint64)
+
+# Returns a key for each rect that's the same for rects whose pixels match. With mode 'flips' it's also the same
+# for flipped and turned copies. Rects with different pixels can share a key, but rarely.
+def getSliceKeys(rgba, rects, mode='exact'):
+    symmetric = mode == 'flips'
+    keys = [None] * len(rects)
+    sizes = {}
+    for i, rect in enumerate(rects):
+        sizes.setdefault((rect.Width, rect.Height), []).append(i)
+
+    for (width, height), indices in sizes.items():
+        weights = getKeyWeights(width, height, symmetric)
+        size = (min(width, height), max(width, height)) if symmetric else (width, height)
+        # Every width by height window of the sheet, so a batch of slices is copied out in one step.
+        windows = np.lib.stride_tricks.as_strided(rgba, (rgba.shape[0] - height + 1, rgba.shape[1] - width + 1, height, width, 4),
+            rgba.strides[:2] + rgba.strides, writeable=False)
+        batch = max(1, BATCH_BYTES // max(1, width * height * 4))
+        for start in range(0, len(indices), batch):
+            chunk = indices[start:start + batch]
+            pixels = windows[[rects[i].Y for i in chunk], [rects[i].X for i in chunk]] # (slices, height, width, 4) copy.
+            for i, key in zip(chunk, getCheapKeys(pixels, weights).tolist()):
+                keys[i] = size + (key,)
+    return keys
+
+# Returns True if two (height, width, 4) arrays of pixels match, counting fully transparent pixels as equal
+# whatever their color.
+def pixelsMatch(a, b):
+    if a.shape != b.shape: return False
+    if np.array_equal(a, b): return True
+    if not np.array_equal(a[:, :, 3], b[:, :, 3]): return False
+    visible = a[:, :, 3] != 0
+    return np.array_equal(a[visible], b[visible])
+
+# Returns a (height, width, 4) array of pixels flipped and turned as one of TRANSFORMS.
+def transformPixels(pixels, turns, flip):
+    if flip: pixels = pixels[:, ::-1]
+    return np.rot90(pixels, -turns)
+
+# Returns the RGBA bytes of width by height pixels flipped and turned as one of TRANSFORMS.
+def transformBytes(data, width, height, turns, flip):
+    rows = [[data[(y * width + x) * 4:(y * width + x + 1) * 4] for x in range(width)] for y in range(height)]
+    if flip: rows = [row[::-1] for row in rows]
+    for turn in range(turns):
+        rows = [list(row) for row in zip(*rows[::-1])] # Clockwise.
+    return b''.join(b''.join(row) for row in rows)
+
+def getSliceHashesInPython(img, rects, mode='exact'):
+    hashes = []
+    for rect in rects:
+        data = bytearray(img.GetSubImage(rect).data)
+        for alpha in range(3, len(data), 4):
+            if data[alpha] == 0: data[alpha - 3:alpha] = b'\0\0\0'
+        data = bytes(data)
+        if mode != 'flips':
+            hashes.append(hashPixels(rect.Width, rect.Height, data))
+            continue
+        digests = []
+        for turns, flip in TRANSFORMS:
+            width, height = (rect.Height, rect.Width) if turns % 2 else (rect.Width, rect.Height)
+            digests.append(hashPixels(width, height, transformBytes(data, rect.Width, rect.Height, turns, flip)))
+        hashes.append(digests)
+    return hashes
+
+# Groups rects with matching pixels. Returns a (original, turns, flip) item for each rect, where original is the
+# index of the first rect that matches it, and the rect's pixels are the original's flipped horizontally (if flip)
+# and then turned clockwise by turns quarter turns. The first rect of each group is its own original.
+def findDuplicates(img, rects, mode='exact'):
+    if mode not in MODES: raise ValueError('Unknown dedupe mode: %r' % mode)
+    if np is None: return groupHashes(getSliceHashesInPython(img, rects, mode), mode)
+    rgba = imagebackend.getRgbaArray(img)
+    transforms = TRANSFORMS if mode == 'flips' else TRANSFORMS[:1]
+
+    # Only rects whose keys match an original's are compared pixel by pixel, and only then in every transform.
+    originals = {} # key: indices of originals with that key
+    duplicates = []
+    for i, key in enumerate(getSliceKeys(rgba, rects, mode)):
+        candidates = originals.setdefault(key, [])
+        match = None
+        rect = rects[i]
+        pixels = rgba[rect.Y:rect.Y + rect.Height, rect.X:rect.X + rect.Width]
+        for original in candidates:
+            rect = rects[original]
+            originalPixels = rgba[rect.Y:rect.Y + rect.Height, rect.X:rect.X + rect.Width]
+            for turns, flip in transforms:
+                if pixelsMatch(transformPixels(originalPixels, turns, flip), pixels):
+                    match = (original, turns, flip)
+                    break
+            if match is not None: break
+        if match is None:
+            candidates.append(i)
+            match = (i, 0, False)
+        duplicates.append(match)
+    return duplicates
+
+# Groups rects by getSliceHashesInPython's hashes, like findDuplicates.
+def groupHashes(hashes, mode='exact'):
+    originals = {}
+    duplicates = []
+    for i, digests in enumerate(hashes):
+        if mode != 'flips':
+            duplicates.append((originals.setdefault(digests, i), 0, False))
+            continue
+        # The smallest hash is the same for every transform of a slice, so it names the group.
+        original = originals.setdefault(min(digests), i)
+        transform = hashes[original].index(digests[0])
+        duplicates.append((original,) + TRANSFORMS[transform])
+    return duplicates
+
+# Returns the indices of the rects that are their own original.
+def getUnique(duplicates):
+    return [i for i, (original, turns, flip) in enumerate(duplicates) if original == i]
+
+# Returns the JSON fields marking frame index as a duplicate: an 'alias' of the original frame's key, and 'turns'
+# and 'flipped' if it's a transformed copy. Originals get no fields.
+def getAliasFields(index, duplicate):
+    original, turns, flip = duplicate
+    if original == index: return {}
+    fields = {'alias': str(original)}
+    if turns or flip:
+        fields['turns'] = turns
+        fields['flipped'] = flip
+    return fields
+
+# Adds the alias fields of every duplicate frame to framesToJson output.
+def addAliases(out, duplicates):
+    for i, duplicate in enumerate(duplicates):
+        out['frames'][str(i)].update(getAliasFields(i, duplicate))
+    return out
@@ -0,0 +1,64 @@
+import os
+import struct
+import diskcache
+
+# Sprite bounds found in earlier searches, kept on disk so the same sheet is never searched twice. Entries are
+# keyed by spritefinder.getDetectionKey, so any change to a sheet's alpha or the search parameters misses.
+# Each entry is a file of little-endian int32 x, y, w, h bounds. Once the files add up to more than maxBytes the
+# least recently used are deleted.
+class DetectionCache():
+    def __init__(self, cacheDir=None, maxBytes=64 * 1024 * 1024):
+        self.cacheDir = cacheDir or diskcache.getDefaultCacheDir('detect')
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def getPath(self, key):
+        return os.path.join(self.cacheDir, key + '.rects')
+
+    # Returns the cached list of (x, y, w, h) bounds for key, or None if it isn't cached.
+    def get(self, key):
+        path = self.getPath(key)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        if len(data) % 16:
+            self.misses += 1
+            return None
+
+        diskcache.touch(path)
+        self.hits += 1
+        values = struct.unpack('<%di' % (len(data) // 4), data)
+        return [values[i:i + 4] for i in range(0, len(values), 4)]
+
+    # Saves bounds under key.
+    def put(self, key, spriteBounds):
+        values = [value for bounds in spriteBounds for value in bounds]
+        diskcache.writeFile(self.getPath(key), [struct.pack('<%di' % len(values), *values)])
+        self.evict()
+
+    # Returns (last used time, size, path) for every entry.
+    def getEntries(self):
+        return diskcache.getEntries(self.cacheDir, '.rects')
+
+    # Deletes the least recently used entries until the cache fits in maxBytes.
+    def evict(self):
+        self.evictions += diskcache.evict(self.cacheDir, '.rects', self.maxBytes)
+
+    def clear(self):
+        for used, size, path in self.getEntries():
+            diskcache.removeFile(path)
+
+    def getStats(self):
+        entries = self.getEntries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'items': len(entries),
+            'bytes': sum(size for used, size, path in entries),
+        }
@@ -0,0 +1,66 @@
+import os
+import tempfile
+
+# Helpers shared by the on-disk caches. Each cache is a directory of entry files with one suffix, whose
+# modification times record when they were last used.
+
+# Returns the directory a cache of this name is kept in by default.
+def getDefaultCacheDir(name):
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'sprite-sheet-slicer', name)
+
+# Writes chunks of bytes to a file. The file is renamed into place once complete, so other processes never read
+# part of it.
+def writeFile(path, chunks):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory): os.makedirs(directory)
+    handle, tempPath = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            for chunk in chunks:
+                file.write(chunk)
+        getattr(os, 'replace', os.rename)(tempPath, path) # os.replace overwrites on Windows too.
+    except:
+        os.remove(tempPath)
+        raise
+
+# Marks an entry as recently used.
+def touch(path):
+    try:
+        os.utime(path, None)
+    except OSError: pass
+
+# Deletes a file if it's there. Returns True if it was deleted.
+def removeFile(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+# Returns (last used time, size, path) for every entry in cacheDir whose name ends with suffix.
+def getEntries(cacheDir, suffix):
+    entries = []
+    if not os.path.isdir(cacheDir): return entries
+    for name in os.listdir(cacheDir):
+        if not name.endswith(suffix): continue
+        path = os.path.join(cacheDir, name)
+        try:
+            stat = os.stat(path)
+        except OSError: continue # Evicted by another process.
+        entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+# Deletes the least recently used entries other than keep until the ones ending with suffix fit in maxBytes.
+# Entries another process still has open stay readable where the platform allows deleting them, and are skipped
+# where it doesn't. Returns the number deleted.
+def evict(cacheDir, suffix, maxBytes, keep=None):
+    entries = getEntries(cacheDir, suffix)
+    totalBytes = sum(size for used, size, path in entries)
+    evicted = 0
+    for used, size, path in sorted(entries):
+        if totalBytes <= maxBytes: break
+        if path == keep or not removeFile(path): continue
+        totalBytes -= size
+        evicted += 1
+    return evicted
@@ -0,0 +1,55 @@
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import imagebackend
+import instrument
+
+# Slices are cropped from the sheet and encoded as PNGs on a pool of threads. Most of the time goes to zlib,
+# which releases the GIL while compressing, so threads use every core without copying the sheet to other
+# processes.
+
+# zlib compression levels for PNGs. Fast exports are bigger but save several times quicker.
+DEFAULT_LEVEL = 6
+FAST_LEVEL = 1
+
+# Slices are handed to threads this many at a time, so small slices don't each pay for a task.
+SLICES_PER_TASK = 32
+
+# Crops each rect out of img and saves it to the matching file path. Returns the number of files written.
+def writeSlices(img, rects, filePaths, level=DEFAULT_LEVEL):
+    for rect, filePath in zip(rects, filePaths):
+        img.GetSubImage(rect).SaveFile(filePath, level)
+    return len(rects)
+
+# Saves the pixels of each rect of img, an RgbaImage or wx.Image, as a PNG at the matching file path, on
+# workers threads. Defaults to one per core. progress is called with the ratio of slices written so far and
+# cancels the export when it returns False; slices already being written are finished first. Returns the number
+# of files written, or None if cancelled.
+def exportSlices(img, rects, filePaths, level=DEFAULT_LEVEL, workers=None, progress=None):
+    with instrument.span('export', slices=len(rects), level=level):
+        written = exportSlicesOnPool(img, rects, filePaths, level, workers, progress)
+    if written is not None: instrument.count('slicesExported', written)
+    return written
+
+def exportSlicesOnPool(img, rects, filePaths, level, workers, progress):
+    img = imagebackend.toRgbaImage(img)
+    total = len(rects)
+    tasks = [(rects[i:i + SLICES_PER_TASK], filePaths[i:i + SLICES_PER_TASK]) for i in range(0, total, SLICES_PER_TASK)]
+    workers = min(workers or cpu_count(), len(tasks))
+
+    if workers <= 1:
+        results = (writeSlices(img, taskRects, taskPaths, level) for taskRects, taskPaths in tasks)
+        pool = None
+    else:
+        pool = ThreadPool(workers)
+        results = pool.imap_unordered(lambda task: writeSlices(img, task[0], task[1], level), tasks)
+
+    written = 0
+    try:
+        for count in results:
+            written += count
+            if progress is not None and not progress(written / float(total)): return None
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return written
@@ -0,0 +1,78 @@
+import wx
+import wx.lib.newevent
+from threading import Thread
+import exporter
+import imagebackend
+from throttle import Throttle
+
+onSlicesExportedEvent, EVT_SLICES_EXPORTED = wx.lib.newevent.NewEvent()
+onSliceExportUpdateEvent, EVT_SLICE_EXPORT_UPDATE = wx.lib.newevent.NewEvent()
+onSliceExportAbortEvent, EVT_SLICE_EXPORT_ABORT = wx.lib.newevent.NewEvent()
+
+class SliceExportThread(Thread):
+    def __init__(self, window, img, rects, filePaths, level=exporter.DEFAULT_LEVEL):
+        Thread.__init__(self)
+        self.img = img
+        self.rects = rects
+        self.filePaths = filePaths
+        self.level = level
+        self.window = window
+        self.abortStatus = False
+
+    def run(self):
+        throttle = Throttle()
+        def progress(ratio):
+            if throttle.ready(): wx.PostEvent(self.window, onSliceExportUpdateEvent(ratio=ratio))
+            return not self.abortStatus
+
+        count = exporter.exportSlices(self.img, self.rects, self.filePaths, self.level, progress=progress)
+        if count is None:
+            wx.PostEvent(self.window, onSliceExportAbortEvent())
+            return
+        wx.PostEvent(self.window, onSlicesExportedEvent(count=count))
+
+    def abort(self): self.abortStatus = True
+
+class SliceExportModal(wx.Dialog):
+    def __init__(self, parent, img, rects, filePaths, level=exporter.DEFAULT_LEVEL):
+        wx.Dialog.__init__(self, parent=parent, title='Export Slices', size=(320, 100))
+
+        panel = wx.Panel(self, style=wx.RAISED_BORDER)
+        self.infoText = wx.StaticText(panel, label='Exporting %d slices...' % len(rects))
+        self.progressBar = wx.Gauge(panel)
+
+        cancelButton = wx.Button(self, label='Cancel')
+        cancelButton.Bind(wx.EVT_BUTTON, self.onCancelButton)
+
+        self.Bind(wx.EVT_CLOSE, self.onCancelButton)
+        self.Bind(EVT_SLICES_EXPORTED, self.onSlicesExported)
+        self.Bind(EVT_SLICE_EXPORT_UPDATE, self.onSliceExportUpdate)
+        self.Bind(EVT_SLICE_EXPORT_ABORT, self.onSliceExportAbort)
+
+        panelSizer = wx.BoxSizer(wx.VERTICAL)
+        panelSizer.Add(self.infoText)
+        panelSizer.Add(self.progressBar, 0, wx.EXPAND)
+        panel.SetSizer(panelSizer)
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(panel, 1, wx.EXPAND)
+        sizer.Add(cancelButton)
+        self.SetSizer(sizer)
+
+        # wx.Images aren't safe to read from other threads, so the pixels are copied here first.
+        img = imagebackend.toRgbaImage(img)
+        self.exportThread = SliceExportThread(self, img, rects, filePaths, level)
+        self.exportThread.start()
+
+    def onCancelButton(self, e):
+        self.infoText.SetLabel('Aborting...')
+        self.exportThread.abort()
+
+    def onSlicesExported(self, e):
+        self.Destroy()
+
+    def onSliceExportAbort(self, e):
+        self.Destroy()
+
+    def onSliceExportUpdate(self, e):
+        self.progressBar.SetValue(e.ratio * 100)
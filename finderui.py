@@ -0,0 +1,147 @@
+import wx
+import wx.lib.newevent
+from threading import Thread
+from multiprocessing import cpu_count
+import spritefinder
+from model import Rect
+from detectcache import DetectionCache
+from throttle import Throttle
+import instrument
+
+onSpritesFoundEvent, EVT_SPRITES_FOUND = wx.lib.newevent.NewEvent()
+onSpriteFinderUpdateEvent, EVT_SPRITE_FINDER_UPDATE= wx.lib.newevent.NewEvent()
+onSpriteFinderAbortEvent, EVT_SPRITE_FINDER_ABORT = wx.lib.newevent.NewEvent()
+onSpriteBatchFoundEvent, EVT_SPRITE_BATCH_FOUND = wx.lib.newevent.NewEvent()
+
+# The per pixel search hands back control after this many transparent pixels, so abort is checked often even
+# where there's nothing to find.
+SCAN_CHUNK = 1024 * 1024
+
+# Shared by every search, so sheets searched before are found instantly.
+detectionCache = DetectionCache()
+
+class SpriteFinderThread(Thread):
+    # Large images are split into bands across workers processes. Defaults to one per core. Results are looked up
+    # in and saved to cache, a detectcache.DetectionCache, when given. alphaThreshold and colorKey choose the
+    # background as in spritefinder.find.
+    def __init__(self, window, img, workers=None, cache=None, alphaThreshold=0, colorKey=None):
+        Thread.__init__(self)
+        self.cwImage = img
+        self.alphaThreshold = alphaThreshold
+        self.colorKey = colorKey
+        self.window = window
+        self.workers = workers or cpu_count()
+        self.cache = cache
+        self.abortStatus = False
+        self.throttle = Throttle()
+        self.posted = 0 # Sprites already sent in batches.
+
+    def run(self):
+        key = None
+        if self.cache is not None:
+            key = spritefinder.getDetectionKey(self.cwImage, alphaThreshold=self.alphaThreshold, colorKey=self.colorKey)
+            spriteBounds = self.cache.get(key)
+            if spriteBounds is not None:
+                instrument.count('detectCacheHits')
+                wx.PostEvent(self.window, onSpritesFoundEvent(spriteBounds=[Rect(*bounds) for bounds in spriteBounds]))
+                return
+
+        with instrument.span('detect', width=self.cwImage.Width, height=self.cwImage.Height):
+            if spritefinder.np is None:
+                spriteBounds = self.runPerPixel()
+            elif spritefinder.shouldTile(self.cwImage.Width * self.cwImage.Height, self.workers):
+                spriteBounds = self.runInBands(self.workers)
+            else:
+                spriteBounds = self.runInBands(1)
+
+        if spriteBounds is None or self.abortStatus == True:
+            wx.PostEvent(self.window, onSpriteFinderAbortEvent())
+            return
+        if key is not None: self.cache.put(key, [rect.Get() for rect in spriteBounds])
+        wx.PostEvent(self.window, onSpritesFoundEvent(spriteBounds=spriteBounds[self.posted:]))
+
+    # The run methods return a list of Rect, or None if the search was aborted. Sprites sent in batches
+    # while searching are counted in self.posted.
+    def runInBands(self, workers):
+        mask = spritefinder.getForegroundMask(self.cwImage, self.alphaThreshold, self.colorKey)
+        spriteBounds = []
+        for rows, bounds in spritefinder.findBoundsInBands(mask, workers):
+            if self.abortStatus == True: return None
+
+            spriteBounds.extend(Rect(*sprite) for sprite in bounds)
+            self.postProgress(spriteBounds, rows)
+        return spriteBounds
+
+    def runPerPixel(self):
+        img = self.cwImage
+        pending = spritefinder.getForegroundBytes(img, self.alphaThreshold, self.colorKey)
+        spriteBounds = []
+        for index, bounds in spritefinder.scanForeground(pending, img.Width, img.Height, chunk=SCAN_CHUNK):
+            if self.abortStatus == True: return None
+
+            if bounds is not None: spriteBounds.append(Rect(*bounds))
+            self.postProgress(spriteBounds, index // img.Width)
+        return spriteBounds
+
+    # Sends the sprites found since the last batch, along with the rows searched, at most Throttle's rate.
+    def postProgress(self, spriteBounds, rows):
+        if not self.throttle.ready(): return
+        if self.posted < len(spriteBounds):
+            wx.PostEvent(self.window, onSpriteBatchFoundEvent(spriteBounds=spriteBounds[self.posted:]))
+            self.posted = len(spriteBounds)
+        wx.PostEvent(self.window, onSpriteFinderUpdateEvent(ratio=rows / float(self.cwImage.Height), rows=rows, sprites=len(spriteBounds)))
+
+    def abort(self): self.abortStatus = True
+
+class FinderModal(wx.Dialog):
+    def __init__(self, parent, doc):
+        wx.Dialog.__init__(self, parent=parent, title='Find Sprites', size=(320, 100))
+        self.doc = doc
+        self.img = doc.image
+
+        panel = wx.Panel(self, style=wx.RAISED_BORDER)
+        self.infoText = wx.StaticText(panel, label='Finding sprites...')
+        self.progressBar = wx.Gauge(panel)
+
+        cancelButton = wx.Button(self, label='Cancel')
+        cancelButton.Bind(wx.EVT_BUTTON, self.onCancelButton)
+
+        self.Bind(wx.EVT_CLOSE, self.onCancelButton)
+        self.Bind(EVT_SPRITES_FOUND, self.onSpritesFound)
+        self.Bind(EVT_SPRITE_FINDER_UPDATE, self.onSpriteFinderUpdate)
+        self.Bind(EVT_SPRITE_FINDER_ABORT, self.onSpriteFinderAbort)
+        self.Bind(EVT_SPRITE_BATCH_FOUND, self.onSpriteBatchFound)
+
+        panelSizer = wx.BoxSizer(wx.VERTICAL)
+        panelSizer.Add(self.infoText)
+        panelSizer.Add(self.progressBar, 0, wx.EXPAND)
+        panel.SetSizer(panelSizer)
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(panel, 1, wx.EXPAND)
+        sizer.Add(cancelButton)
+        self.SetSizer(sizer)
+
+        self.finderThread = SpriteFinderThread(self, self.img, cache=detectionCache, alphaThreshold=doc.alphaThreshold, colorKey=doc.colorKey)
+        self.finderThread.start()
+
+    def onCancelButton(self, e):
+        self.infoText.SetLabel('Aborting...')
+        self.finderThread.abort()
+
+    # Slices are added as batches arrive, so they show up while the search goes on. Aborting keeps the ones
+    # already added.
+    def onSpriteBatchFound(self, e):
+        self.doc.addSlicesFromSpriteBounds(e.spriteBounds)
+
+    def onSpritesFound(self, e):
+        self.doc.addSlicesFromSpriteBounds(e.spriteBounds)
+        self.Destroy()
+
+    def onSpriteFinderAbort(self, e):
+        self.Destroy()
+
+    def onSpriteFinderUpdate(self, e):
+        self.progressBar.SetValue(e.ratio * 100)
+        if hasattr(e, 'sprites') and not self.finderThread.abortStatus:
+            self.infoText.SetLabel('Found %d sprites in %d of %d rows...' % (e.sprites, e.rows, self.img.Height))
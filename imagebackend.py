@@ -0,0 +1,100 @@
+import pngio
+
+try:
+    from PIL import Image as PilImage
+except ImportError:
+    PilImage = None # PNGs are decoded with pngio instead.
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # getRgbaArray is unavailable.
+
+# An image held as a raw RGBA buffer. Implements the part of the wx.Image interface the slicing core uses,
+# so either can be passed to spritefinder and model.Document.
+class RgbaImage():
+    def __init__(self, width, height, data=None, hasAlpha=True):
+        self.Width = width
+        self.Height = height
+        self.data = data if data is not None else bytearray(width * height * 4)
+        self.hasAlpha = hasAlpha
+
+    def HasAlpha(self):
+        return self.hasAlpha
+
+    # Returns a copy of the alpha channel, one byte per pixel.
+    def GetAlphaBuffer(self):
+        return bytearray(self.data[3::4])
+
+    def GetAlpha(self, x, y):
+        return self.data[(y * self.Width + x) * 4 + 3]
+
+    def GetSubImage(self, rect):
+        rowLength = rect.Width * 4
+        data = bytearray(rowLength * rect.Height)
+        for row in range(rect.Height):
+            start = ((rect.Y + row) * self.Width + rect.X) * 4
+            data[row * rowLength:(row + 1) * rowLength] = self.data[start:start + rowLength]
+        return RgbaImage(rect.Width, rect.Height, data, self.hasAlpha)
+
+    # Saves as PNG. level is the zlib compression level, 0-9.
+    def SaveFile(self, fileName, level=6):
+        if PilImage is not None:
+            PilImage.frombuffer('RGBA', (self.Width, self.Height), bytes(self.data), 'raw', 'RGBA', 0, 1).save(fileName, compress_level=level)
+        else:
+            pngio.writePng(fileName, self.Width, self.Height, self.data, level)
+
+# Returns the pixels of an RgbaImage or wx.Image as a (height, width, 4) uint8 array. Requires NumPy.
+def getRgbaArray(img):
+    if isinstance(img, RgbaImage):
+        return np.frombuffer(img.data, np.uint8, img.Width * img.Height * 4).reshape(img.Height, img.Width, 4)
+
+    size = img.Width * img.Height
+    rgba = np.empty((img.Height, img.Width, 4), np.uint8)
+    if hasattr(img, 'GetDataBuffer'):
+        rgb = img.GetDataBuffer() # wxPython Phoenix
+    else:
+        rgb = img.GetData() # wxPython Classic
+    rgba[:, :, :3] = np.frombuffer(rgb, np.uint8, size * 3).reshape(img.Height, img.Width, 3)
+    if img.HasAlpha():
+        alpha = img.GetAlphaBuffer() if hasattr(img, 'GetAlphaBuffer') else img.GetAlphaData()
+        rgba[:, :, 3] = np.frombuffer(alpha, np.uint8, size).reshape(img.Height, img.Width)
+    else:
+        rgba[:, :, 3] = 255
+    return rgba
+
+# Returns an RgbaImage of an RgbaImage or wx.Image. wx.Image pixels are copied, so the result can be used from
+# other threads.
+def toRgbaImage(img):
+    if isinstance(img, RgbaImage): return img
+    size = img.Width * img.Height
+    rgb = img.GetDataBuffer() if hasattr(img, 'GetDataBuffer') else img.GetData()
+    data = bytearray(size * 4)
+    for channel in range(3):
+        data[channel::4] = bytes(rgb)[channel::3]
+    if img.HasAlpha():
+        alpha = img.GetAlphaBuffer() if hasattr(img, 'GetAlphaBuffer') else img.GetAlphaData()
+        data[3::4] = bytes(alpha)
+    else:
+        data[3::4] = b'\xff' * size
+    return RgbaImage(img.Width, img.Height, data, img.HasAlpha())
+
+# Loaders are tried in order. Each returns an RgbaImage, or None if it can't be used.
+def loadWithPil(fileName):
+    if PilImage is None: return None
+    img = PilImage.open(fileName)
+    hasAlpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+    img = img.convert('RGBA')
+    return RgbaImage(img.size[0], img.size[1], bytearray(img.tobytes()), hasAlpha)
+
+def loadWithPngio(fileName):
+    width, height, data, hasAlpha = pngio.readPng(fileName)
+    return RgbaImage(width, height, data, hasAlpha)
+
+LOADERS = [loadWithPil, loadWithPngio]
+
+def loadImage(fileName):
+    for loader in LOADERS:
+        img = loader(fileName)
+        if img is not None: return img
+    raise IOError('No image loader could read ' + fileName)
@@ -0,0 +1,182 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+try:
+    import cProfile
+except ImportError:
+    cProfile = None # Profiles can't be captured.
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None # Profiles are captured with cProfile.
+
+# Timers and counters around the slow paths: loading, detection, drawing and exporting. Everything is a no-op
+# until enable() is called, or the SPRITE_SLICER_TRACE environment variable names a file to write a Chrome
+# trace to on exit. SPRITE_SLICER_PROFILE=name=file profiles the next span called name into file, or name.prof
+# without one (see profileNext).
+#
+#   with instrument.span('detect', pixels=n):
+#       ...
+#
+#   @instrument.timed('paint')
+#   def onPaint(self, e):
+
+# Only this many spans are kept for the trace. Later spans still count in the timers.
+MAX_EVENTS = 200000
+
+enabled = False
+lock = threading.Lock()
+startTime = time.time()
+events = [] # Chrome trace 'complete' events.
+droppedEvents = 0
+timers = {} # name: [calls, total seconds, longest seconds]
+counters = {}
+profileTargets = {} # span name: file to profile its next call into.
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def reset():
+    global droppedEvents
+    with lock:
+        del events[:]
+        droppedEvents = 0
+        timers.clear()
+        counters.clear()
+
+# Times the code inside a with block, recorded under name along with any args.
+class Span():
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.profiler = None
+
+    def __enter__(self):
+        fileName = profileTargets.pop(self.name, None)
+        if fileName is not None: self.profiler = startProfile(fileName)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.time()
+        if self.profiler is not None: stopProfile(*self.profiler)
+        if enabled: record(self.name, self.start, end - self.start, self.args)
+
+# Used in place of a Span while disabled, so disabled spans cost a function call and nothing else.
+class NullSpan():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc): pass
+
+NULL_SPAN = NullSpan()
+
+def span(name, **args):
+    return Span(name, args) if enabled or profileTargets else NULL_SPAN
+
+# Decorator timing every call of a function as a span.
+def timed(name):
+    def decorate(function):
+        def wrapper(*args, **kwargs):
+            if not enabled and not profileTargets: return function(*args, **kwargs)
+            with Span(name, {}):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorate
+
+def count(name, amount=1):
+    if not enabled: return
+    with lock:
+        counters[name] = counters.get(name, 0) + amount
+
+def record(name, start, duration, args):
+    global droppedEvents
+    with lock:
+        timer = timers.setdefault(name, [0, 0.0, 0.0])
+        timer[0] += 1
+        timer[1] += duration
+        timer[2] = max(timer[2], duration)
+        if len(events) >= MAX_EVENTS:
+            droppedEvents += 1
+            return
+        events.append({
+            'name': name,
+            'ph': 'X',
+            'ts': int((start - startTime) * 1e6),
+            'dur': int(duration * 1e6),
+            'pid': os.getpid(),
+            'tid': threading.current_thread().ident,
+            'args': args,
+        })
+
+# Profiles the next span called name and saves the profile to fileName: an HTML report if pyinstrument is
+# installed and fileName ends in .html, otherwise cProfile stats that pstats and snakeviz can read. This works
+# whether or not instrumentation is enabled.
+def profileNext(name, fileName):
+    profileTargets[name] = fileName
+
+def startProfile(fileName):
+    if pyinstrument is not None and fileName.endswith('.html'):
+        profiler = pyinstrument.Profiler()
+    elif cProfile is not None:
+        profiler = cProfile.Profile()
+    else:
+        return None
+    if hasattr(profiler, 'output_html'):
+        profiler.start()
+    else:
+        profiler.enable()
+    return profiler, fileName
+
+def stopProfile(profiler, fileName):
+    if hasattr(profiler, 'output_html'):
+        profiler.stop()
+        with open(fileName, 'w') as file:
+            file.write(profiler.output_html())
+    else:
+        profiler.disable()
+        profiler.dump_stats(fileName)
+
+# Returns the timers and counters as a dict that can be written as JSON.
+def getStats():
+    with lock:
+        return {
+            'timers': dict((name, {'calls': calls, 'seconds': total, 'longest': longest})
+                for name, (calls, total, longest) in timers.items()),
+            'counters': dict(counters),
+            'droppedEvents': droppedEvents,
+        }
+
+def writeStats(fileName):
+    with open(fileName, 'w') as file:
+        json.dump(getStats(), file, indent=2, sort_keys=True)
+
+# Writes the spans in Chrome's trace event format, for chrome://tracing or Perfetto, with the timers and
+# counters under otherData.
+def writeTrace(fileName):
+    with lock:
+        traceEvents = list(events)
+    with open(fileName, 'w') as file:
+        json.dump({'traceEvents': traceEvents, 'displayTimeUnit': 'ms', 'otherData': getStats()}, file)
+
+# Turns instrumentation on and writes a trace to fileName when the program exits.
+def traceToFile(fileName):
+    enable()
+    atexit.register(writeTrace, fileName)
+
+if os.environ.get('SPRITE_SLICER_TRACE'):
+    traceToFile(os.environ['SPRITE_SLICER_TRACE'])
+if os.environ.get('SPRITE_SLICER_PROFILE'):
+    name, separator, fileName = os.environ['SPRITE_SLICER_PROFILE'].partition('=')
+    profileNext(name, fileName or name + '.prof')
@@ -0,0 +1,83 @@
+from collections import OrderedDict
+
+# Least recently used cache bounded by the total byte size of its values. Pinned keys are never evicted.
+class LruCache():
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.items = OrderedDict() # key: (value, size), oldest first.
+        self.pinned = set()
+        self.pinnedGroups = {} # group: keys pinned under it
+        self.totalBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Returns the cached value for key. On a miss the value is built with create() and sized with sizeOf(value).
+    def get(self, key, create, sizeOf):
+        item = self.items.pop(key, None)
+        if item is not None:
+            self.hits += 1
+            self.items[key] = item
+            return item[0]
+
+        self.misses += 1
+        value = create()
+        self.put(key, value, sizeOf(value))
+        return value
+
+    # Returns the cached value for key, or None if it isn't cached.
+    def lookup(self, key):
+        item = self.items.pop(key, None)
+        if item is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.items[key] = item
+        return item[0]
+
+    def put(self, key, value, size):
+        item = self.items.pop(key, None)
+        if item is not None:
+            self.totalBytes -= item[1]
+        self.items[key] = (value, size)
+        self.totalBytes += size
+        self.evict()
+
+    def discard(self, key):
+        item = self.items.pop(key, None)
+        if item is not None:
+            self.totalBytes -= item[1]
+        self.pinned.discard(key)
+        for keys in self.pinnedGroups.values():
+            keys.discard(key)
+
+    def clear(self):
+        self.items.clear()
+        self.pinned.clear()
+        self.pinnedGroups.clear()
+        self.totalBytes = 0
+
+    # Replaces the keys pinned under group, such as the slices one view has on screen. Keys stay pinned while any
+    # group has them.
+    def setPinned(self, keys, group=None):
+        self.pinnedGroups[group] = set(keys)
+        self.pinned = set().union(*self.pinnedGroups.values())
+        self.evict()
+
+    # Drops the oldest unpinned values until the cache fits in maxBytes.
+    def evict(self):
+        if self.totalBytes <= self.maxBytes: return
+        for key in list(self.items):
+            if self.totalBytes <= self.maxBytes: break
+            if key in self.pinned: continue
+            self.totalBytes -= self.items.pop(key)[1]
+            self.evictions += 1
+
+    def getStats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'items': len(self.items),
+            'bytes': self.totalBytes,
+        }
@@ -3,67 +3,87 @@ import wx.lib.scrolledpanel
 import wx.lib.newevent
 import json
 import os
+from collections import OrderedDict
+import model
+import exporter
+import exportui
+import finderui
 import spritefinder
-
-class Document(wx.EvtHandler):
+from lrucache import LruCache
+from spatialindex import GridIndex
+import colorkey
+import dedup
+import imagebackend
+import instrument
+import packer
+import rawcache
+import tilecache
+
+class Document(wx.EvtHandler, model.Document):
     onSlicesAddEvent, EVT_ON_SLICES_ADD = wx.lib.newevent.NewEvent()
     onSlicesRemoveEvent, EVT_ON_SLICES_REMOVE = wx.lib.newevent.NewEvent()
     onSliceSwapEvent, EVT_ON_SLICE_SWAP = wx.lib.newevent.NewEvent()
-    def __init__(self, fileName):
+    onImageChangeEvent, EVT_ON_IMAGE_CHANGE = wx.lib.newevent.NewEvent()
+    EVENTS = {
+        model.Document.SLICES_ADD: onSlicesAddEvent,
+        model.Document.SLICES_REMOVE: onSlicesRemoveEvent,
+        model.Document.SLICE_SWAP: onSliceSwapEvent,
+        model.Document.IMAGE_CHANGE: onImageChangeEvent,
+    }
+    def __init__(self, fileName, useRawCache=False):
         wx.EvtHandler.__init__(self)
-        self.setCurrentWorkingGraphic(fileName)
-
-        self.activeGroup = SpriteGroup()
-        self.spriteGroups = [self.activeGroup]
+        model.Document.__init__(self, fileName, sliceClass=Slice, useRawCache=useRawCache)
 
-    def addSlicesFromSpriteBounds(self, spriteBounds):
-        slices = []
-        for rect in spriteBounds:
-            slices.append(Slice(self, rect))
-        self.addSlices(slices)
-
-    def addSlices(self, slices):
-        if isinstance(slices, Slice): slices = [slices]
-        for slice in slices:
-            self.activeGroup.addSlice(slice)
-        wx.PostEvent(self, Document.onSlicesAddEvent(slices=slices))
+    # Posts model notifications as wx events.
+    def notify(self, event, **kwargs):
+        model.Document.notify(self, event, **kwargs)
+        wx.PostEvent(self, Document.EVENTS[event](**kwargs))
 
     def removeSlices(self, slices):
         if isinstance(slices, Slice): slices = [slices]
         for slice in slices:
-            self.activeGroup.removeSlice(slice)
-        wx.PostEvent(self, Document.onSlicesRemoveEvent(slices=slices))
-
-    def swapSlice(self, sliceA, sliceB):
-        indices = self.activeGroup.swapSlice(sliceA, sliceB)
-        if indices == False: return
-        wx.PostEvent(self, Document.onSliceSwapEvent(indexA=indices[0], indexB=indices[1]))
+            Slice.bitmapCache.discard(slice)
+        model.Document.removeSlices(self, slices)
 
     def setCurrentWorkingGraphic(self, fileName):
-        self.cwBitmap = wx.Bitmap(fileName)
-        self.cwImage = self.cwBitmap.ConvertToImage()
-
-    def importJson(self, jsonString):
-        sliceData = json.loads(jsonString)
-        frames = [None] * len(sliceData['frames'])
-        for key in sliceData['frames']:
-            frames[int(key)] = sliceData['frames'][key]['frame']
-        for frame in frames:
-            self.addSlices(Slice(self, wx.Rect(frame['x'], frame['y'], frame['w'], frame['h'])))
-
-    def exportJson(self):
-        out = {'frames': {}}
-        for i, slice in enumerate(self.activeGroup.slices):
-            rect = slice.rect
-            out['frames'][str(i)] = {
-                'frame': {
-                    'x': rect.X,
-                    'y': rect.Y,
-                    'w': rect.Width,
-                    'h': rect.Height,
-                }
-            }
-        return out
+        Slice.bitmapCache.clear()
+        self.wxImage = None
+        self.wxBitmap = None
+        model.Document.setCurrentWorkingGraphic(self, fileName)
+
+    def loadImage(self, fileName):
+        if self.useRawCache: return rawcache.loadImage(fileName)
+        return wx.Image(fileName)
+
+    # wx copies of the sheet are only made when something draws the whole sheet, since huge memory-mapped sheets
+    # are drawn from tiles instead.
+    @property
+    def cwImage(self):
+        if self.wxImage is None: self.wxImage = toWxImage(self.image)
+        return self.wxImage
+
+    @property
+    def cwBitmap(self):
+        if self.wxBitmap is None: self.wxBitmap = self.cwImage.ConvertToBitmap()
+        return self.wxBitmap
+
+# Returns a wx.Image of an RgbaImage, or the image itself if it's already one.
+def toWxImage(img):
+    if not isinstance(img, imagebackend.RgbaImage): return img
+    size = img.Width * img.Height
+    rgb = bytearray(size * 3)
+    for channel in range(3):
+        rgb[channel::3] = img.data[channel:size * 4:4]
+    image = wx.Image(img.Width, img.Height)
+    image.SetData(bytes(rgb))
+    if img.HasAlpha(): image.SetAlpha(bytes(img.data[3:size * 4:4]))
+    return image
+
+# Scaled copies of the sheet are cached per zoom level up to this many bytes. Larger zooms scale while drawing.
+SCALED_SHEET_CACHE_BYTES = 128 * 1024 * 1024
+# Sheets with at least this many pixels are drawn from a tile pyramid instead.
+TILE_PYRAMID_MIN_PIXELS = 4096 * 4096
+TILE_BITMAP_CACHE_BYTES = 128 * 1024 * 1024
 
 class Selector():
     def __init__(self, rect, slice):
@@ -75,30 +95,22 @@ class Selector():
         zoomedRect = wx.Rect(self.rect.X * zoom, self.rect.Y * zoom, self.rect.Width * zoom, self.rect.Height * zoom)
         return zoomedRect.ContainsXY(x, y)
 
-class SpriteGroup():
-    def __init__(self):
-        self.slices = []
-
-    def addSlice(self, slice):
-        self.slices.append(slice)
+# Slice bitmaps are created when first drawn and dropped when the cache grows past this many bytes.
+SLICE_BITMAP_CACHE_BYTES = 64 * 1024 * 1024
 
-    def removeSlice(self, slice):
-        self.slices.remove(slice)
+class Slice(model.Slice):
+    bitmapCache = LruCache(SLICE_BITMAP_CACHE_BYTES)
 
-    def swapSlice(self, sliceA, sliceB):
-        aIndex = self.slices.index(sliceA)
-        bIndex = self.slices.index(sliceB)
-        if aIndex < 0 or bIndex < 0: return False
+    @property
+    def bitmap(self):
+        return Slice.bitmapCache.get(self, self.createBitmap, lambda bitmap: bitmap.Width * bitmap.Height * 4)
 
-        self.slices[aIndex] = sliceB
-        self.slices[bIndex] = sliceA
-        return (aIndex, bIndex)
+    # Crops the slice out of the document's image.
+    def createImage(self):
+        return toWxImage(self.doc.image.GetSubImage(wx.Rect(*self.rect.Get())))
 
-class Slice():
-    def __init__(self, doc, sliceRect):
-        self.doc = doc
-        self.rect = sliceRect
-        self.bitmap = self.doc.cwImage.GetSubImage(self.rect).ConvertToBitmap()
+    def createBitmap(self):
+        return self.createImage().ConvertToBitmap()
 
 class SpriteSheetPanel(wx.Panel):
     def __init__(self, parent):
@@ -128,6 +140,15 @@ class SpriteSheetPanel(wx.Panel):
         self.controlMouseX = 0
         self.controlMouseY = 0
 
+        # Drawing objects are made once and reused for every paint.
+        self.selectorBackBrush = wx.Brush(wx.Colour(90, 200, 90, 0))
+        self.selectorActivePen = wx.Pen('red')
+        self.gridPen = wx.Pen(wx.Colour(20,20,80))
+        self.gridBrush = wx.Brush(wx.Colour(70,70,150))
+        self.scaledSheets = LruCache(SCALED_SHEET_CACHE_BYTES) # zoom: scaled sheet bitmap
+        self.tiles = None # TilePyramid for large sheets.
+        self.tileBitmaps = LruCache(TILE_BITMAP_CACHE_BYTES) # tile key: bitmap
+
         self.gridSelection = False
         self.gridWidth = 64
         self.gridHeight = 64
@@ -140,15 +161,36 @@ class SpriteSheetPanel(wx.Panel):
         self.doc = doc
         self.doc.Bind(Document.EVT_ON_SLICES_ADD, self.onDocAddSlices)
         self.doc.Bind(Document.EVT_ON_SLICES_REMOVE, self.onDocRemoveSlices)
+        self.doc.Bind(Document.EVT_ON_IMAGE_CHANGE, self.onDocImageChange)
 
-        self.selectors = []
+        self.resetSheet()
+        self.selectors = {} # slice: Selector
+        self.selectorIndex = GridIndex() # Selectors by their rects in image coordinates.
         self.activeSelector = None
         self.newSelection = wx.Rect()
 
         self.setZoom(1.0)
 
-        self.SetSize((self.doc.cwBitmap.Width, self.doc.cwBitmap.Height))
+        self.SetSize((self.doc.image.Width, self.doc.image.Height))
+        self.Refresh()
+
+    # Drops the scaled copies and tiles of the sheet, and starts a new tile pyramid for large sheets.
+    def resetSheet(self):
+        self.scaledSheets.clear()
+        self.tileBitmaps.clear()
+        if self.tiles is not None: self.tiles.stop()
+        self.tiles = None
+        if tilecache.np is not None and self.doc.image.Width * self.doc.image.Height >= TILE_PYRAMID_MIN_PIXELS:
+            # The pyramid builds tiles on its own thread, so redraw them back on the GUI thread.
+            onTileReady = lambda key: wx.CallAfter(self.onTileReady, key)
+            self.tiles = tilecache.TilePyramid(imagebackend.getRgbaArray(self.doc.image), onTileReady=onTileReady)
+
+    def onDocImageChange(self, e):
+        self.resetSheet()
+        self.SetSize((self.doc.image.Width, self.doc.image.Height))
+        self.setZoom(self.zoom)
         self.Refresh()
+        e.Skip()
 
     def onScroll(self, e):
         if not self.controlHeld:
@@ -179,11 +221,15 @@ class SpriteSheetPanel(wx.Panel):
             self.controlHeld = True
         elif keyCode == wx.WXK_SPACE:
             if self.gridSelection:
+                cells = []
                 for y in range(0, self.verCells):
                     for x in range(0, self.horCells):
-                        self.createSelection(wx.Rect(self.mouseX + (x * self.gridWidth), self.mouseY + (y * self.gridHeight), self.gridWidth, self.gridHeight))
-                        self.gridSelection = False
-                        self.Refresh()
+                        cells.append(wx.Rect(self.mouseX + (x * self.gridWidth), self.mouseY + (y * self.gridHeight), self.gridWidth, self.gridHeight))
+                slices = self.createSlices(cells)
+                # Add every cell at once so listeners handle a single event.
+                if self.doc != None and slices: self.doc.addSlices(slices)
+                self.gridSelection = False
+                self.Refresh()
         e.Skip()
 
     def onKeyUp(self, e):
@@ -194,60 +240,39 @@ class SpriteSheetPanel(wx.Panel):
 
     # Creates a selection: creates slice and adds to slice group, adds selector and crops.
     def createSelection(self, rect):
-        if self.doc == None: return
-
-        if (abs(rect.Width) < 1 and abs(rect.Height) < 1):
-            return False
-
-        # If width is negative then swap x and width.
-        if rect.Width < 0:
-            rect.Width = abs(rect.Width)
-            rect.X -= rect.Width
-
-        # If height is negative then swap y and height.
-        if rect.Height < 0:
-            rect.Height = abs(rect.Height)
-            rect.Y -= rect.Height
-
-        if rect.X + rect.Width > self.doc.cwImage.Width:
-            rect.Width = self.doc.cwImage.Width - rect.X
-        if rect.Y + rect.Height > self.doc.cwImage.Height:
-            rect.Height = self.doc.cwImage.Height - rect.Y
-
-        img = self.doc.cwImage.GetSubImage(rect)
-
-        # Returns the amount of pixels you must add/subtract to crop out the alpha.
-        def getCropAmount(yFirst, reverse):
-            out = 0
-            firstRange = range(img.Height if yFirst else img.Width)
-            if reverse: firstRange = reversed(firstRange)
-            for i in firstRange:
-                hasAlpha = True
-                for j in range(img.Width if yFirst else img.Height):
-                    if yFirst:
-                        y = i
-                        x = j
-                    else:
-                        x = i
-                        y = j
-                    hasAlpha = (img.GetAlpha(x, y) > 0)
-                    if hasAlpha: break
-                if hasAlpha: break
-                out += 1
-            if (yFirst and out >= img.Height) or (not yFirst and out >= img.Width):
-                out = 0
-            return out
-        left = getCropAmount(False, False)
-        top = getCropAmount(True, False)
-        right = getCropAmount(False, True)
-        bottom = getCropAmount(True, True)
-
-        rect = wx.Rect(rect.X + left, rect.Y + top, rect.Width - left - right, rect.Height - top - bottom)
-        slice = Slice(self.doc, rect)
+        slice = self.createSlice(rect)
+        if slice is None: return False
         self.doc.addSlices(slice)
-
         return True
 
+    # Creates a slice from a selection rect, cropped to the image and to its visible pixels. Returns None if the rect is empty.
+    def createSlice(self, rect):
+        slices = self.createSlices([rect])
+        return slices[0] if slices else None
+
+    # Same as createSlice for many rects, trimming them all in one pass over the image. Empty rects are skipped.
+    def createSlices(self, rects):
+        if self.doc == None: return []
+
+        selections = []
+        for rect in rects:
+            if (abs(rect.Width) < 1 and abs(rect.Height) < 1):
+                continue
+
+            # If width is negative then swap x and width.
+            if rect.Width < 0:
+                rect.Width = abs(rect.Width)
+                rect.X -= rect.Width
+
+            # If height is negative then swap y and height.
+            if rect.Height < 0:
+                rect.Height = abs(rect.Height)
+                rect.Y -= rect.Height
+            selections.append(rect)
+
+        trimmed = spritefinder.trimRects(self.doc.image, selections, self.doc.alphaThreshold, self.doc.colorKey)
+        return [Slice(self.doc, wx.Rect(*rect.Get())) for rect in trimmed if not rect.IsEmpty()]
+
     def onDocAddSlices(self, e):
         first = True
         for slice in e.slices:
@@ -255,16 +280,16 @@ class SpriteSheetPanel(wx.Panel):
             if first:
                 self.activeSelector = selector
                 first = False
-            self.selectors.append(selector)
+            self.selectors[slice] = selector
+            self.selectorIndex.insert(selector, slice.rect)
         self.Refresh()
         e.Skip()
 
     def onDocRemoveSlices(self, e):
         for slice in e.slices:
-            for sel in self.selectors:
-                if sel.slice == slice:
-                    self.selectors.remove(sel)
-                    break
+            sel = self.selectors.pop(slice, None)
+            if sel is not None:
+                self.selectorIndex.remove(sel)
         self.activeSelector = None
         self.Refresh()
         e.Skip()
@@ -290,7 +315,7 @@ class SpriteSheetPanel(wx.Panel):
         self.leftMouseHeld = True
         if self.gridSelection: return
 
-        for i, sel in enumerate(self.selectors):
+        for sel in self.selectorIndex.queryPoint(e.X / float(self.zoom), e.Y / float(self.zoom)):
             if sel.contains(e.X, e.Y, self.zoom):
                 self.activeSelector = sel
                 self.Refresh()
@@ -311,14 +336,31 @@ class SpriteSheetPanel(wx.Panel):
             self.Refresh()
 
         if self.resize:
+            wasEmpty = self.newSelection.IsEmpty()
+            damaged = self.getNewSelectionArea()
             self.newSelection.Width = e.X - self.newSelection.X
             self.newSelection.Height = e.Y - self.newSelection.Y
-            self.Refresh()
-
+            if wasEmpty != self.newSelection.IsEmpty():
+                self.Refresh() # The active selector is hidden or shown again.
+            else:
+                self.RefreshRect(damaged.Union(self.getNewSelectionArea()))
+
+    # Returns the panel area covered by the selection being dragged, including its outline.
+    def getNewSelectionArea(self):
+        rect = self.newSelection
+        margin = int(self.zoom) + 2
+        x = min(rect.X, rect.X + rect.Width)
+        y = min(rect.Y, rect.Y + rect.Height)
+        return wx.Rect(x - margin, y - margin, abs(rect.Width) + margin * 2, abs(rect.Height) + margin * 2)
+
+    @instrument.timed('paintSheet')
     def onPaint(self, e):
         if self.doc == None: return
 
         dc = wx.PaintDC(self)
+        # Only redraw the damaged part of the panel.
+        box = self.GetUpdateRegion().GetBox()
+        dc.SetClippingRegion(box.X, box.Y, box.Width, box.Height)
         dc.Clear()
         dc.SetUserScale(self.zoom, self.zoom)
 
@@ -330,19 +372,19 @@ class SpriteSheetPanel(wx.Panel):
             self.drawSelectorBack(dc, rect.X/self.zoom, rect.Y/self.zoom, rect.Width/self.zoom, rect.Height/self.zoom)
 
         if self.gridSelection:
+            dc.SetPen(self.gridPen)
+            dc.SetBrush(self.gridBrush)
             for x in range(0, self.horCells):
                 for y in range(0, self.verCells):
-                    #dc.BeginDrawing()
-                    dc.SetPen(wx.Pen(wx.Colour(20,20,80)))
-                    dc.SetBrush(wx.Brush(wx.Colour(70,70,150)))
                     dc.DrawRectangle(self.mouseX + (x * self.gridWidth), self.mouseY + (y * self.gridHeight), self.gridWidth, self.gridHeight)
-                    #dc.EndDrawing()
 
-        for sel in self.selectors:
+        # Only selectors inside the damaged area, found in image coordinates.
+        visible = self.selectorIndex.queryRect(box.X / self.zoom, box.Y / self.zoom, box.Width / self.zoom, box.Height / self.zoom)
+        for sel in visible:
             rect = sel.rect
             self.drawSelectorBack(dc, rect.X, rect.Y, rect.Width, rect.Height)
 
-        dc.DrawBitmap(self.doc.cwBitmap, 0, 0);
+        self.drawSheet(dc, box)
 
         if self.activeSelector and self.newSelection.IsEmpty():
             rect = self.activeSelector.rect
@@ -351,9 +393,68 @@ class SpriteSheetPanel(wx.Panel):
             rect = self.newSelection
             self.drawSelectorActive(dc, rect.X/self.zoom, rect.Y/self.zoom, rect.Width/self.zoom, rect.Height/self.zoom)
 
+    # Draws the sheet at the current zoom. Large sheets draw the pyramid tiles inside box, the damaged panel area.
+    # Others draw a copy scaled to the zoom, which is cached so it isn't rescaled on every paint.
+    def drawSheet(self, dc, box):
+        if self.tiles is not None:
+            self.drawTiles(dc, box)
+            return
+
+        scaled = self.getScaledSheet()
+        if scaled is None:
+            dc.DrawBitmap(self.doc.cwBitmap, 0, 0)
+            return
+        dc.SetUserScale(1, 1)
+        dc.DrawBitmap(scaled, 0, 0)
+        dc.SetUserScale(self.zoom, self.zoom)
+
+    # Draws the tiles inside box from the pyramid level nearest the zoom. Tiles that aren't built yet are drawn
+    # once onTileReady is called for them.
+    def drawTiles(self, dc, box):
+        level = self.tiles.getLevel(self.zoom)
+        scale = self.zoom * (1 << level)
+        dc.SetUserScale(scale, scale)
+        for key in self.tiles.getTileKeys(level, box.X / self.zoom, box.Y / self.zoom, box.Width / self.zoom, box.Height / self.zoom):
+            bitmap = self.getTileBitmap(key)
+            if bitmap is not None:
+                dc.DrawBitmap(bitmap, key[1] * tilecache.TILE_SIZE, key[2] * tilecache.TILE_SIZE)
+        dc.SetUserScale(self.zoom, self.zoom)
+
+    # Returns the bitmap of a pyramid tile, or None if the tile is still being built.
+    def getTileBitmap(self, key):
+        bitmap = self.tileBitmaps.lookup(key)
+        if bitmap is not None: return bitmap
+        pixels = self.tiles.getTile(key)
+        if pixels is None: return None
+        height, width = pixels.shape[:2]
+        if hasattr(wx.Bitmap, 'FromBufferRGBA'):
+            bitmap = wx.Bitmap.FromBufferRGBA(width, height, pixels.tobytes()) # wxPython Phoenix
+        else:
+            bitmap = wx.BitmapFromBufferRGBA(width, height, pixels.tobytes()) # wxPython Classic
+        self.tileBitmaps.put(key, bitmap, pixels.nbytes)
+        return bitmap
+
+    def onTileReady(self, key):
+        if self.tiles is None: return
+        level, column, row = key
+        if level != self.tiles.getLevel(self.zoom): return
+        span = (tilecache.TILE_SIZE << level) * self.zoom
+        self.RefreshRect(wx.Rect(int(column * span), int(row * span), int(span) + 1, int(span) + 1))
+
+    # Returns the sheet bitmap scaled to the current zoom, or None if it's unscaled or too large to cache.
+    def getScaledSheet(self):
+        if self.zoom == 1.0: return None
+        width = int(self.doc.image.Width * self.zoom)
+        height = int(self.doc.image.Height * self.zoom)
+        if width < 1 or height < 1 or width * height * 4 > SCALED_SHEET_CACHE_BYTES: return None
+
+        def create():
+            return self.doc.cwImage.Scale(width, height, wx.IMAGE_QUALITY_NORMAL).ConvertToBitmap()
+        return self.scaledSheets.get(self.zoom, create, lambda bitmap: bitmap.Width * bitmap.Height * 4)
+
     def setZoom(self, amount):
         self.zoom = amount
-        self.SetMinSize((self.doc.cwBitmap.Width * self.zoom, self.doc.cwBitmap.Height * self.zoom))
+        self.SetMinSize((self.doc.image.Width * self.zoom, self.doc.image.Height * self.zoom))
         self.GetParent().FitInside()
 
     def scaleRect(self, rect, scale):
@@ -367,14 +468,14 @@ class SpriteSheetPanel(wx.Panel):
     def drawSelectorBack(self, dc, x, y, w, h):
         #dc.BeginDrawing()
         dc.SetPen(wx.TRANSPARENT_PEN)
-        dc.SetBrush(wx.Brush(wx.Colour(90, 200, 90, 0)))
+        dc.SetBrush(self.selectorBackBrush)
         # set x, y, w, h for rectangle
         dc.DrawRectangle(x, y, w, h)
         #dc.EndDrawing()
 
     def drawSelectorActive(self, dc, x, y, w, h):
         #dc.BeginDrawing()
-        dc.SetPen(wx.Pen('red'))
+        dc.SetPen(self.selectorActivePen)
         dc.SetBrush(wx.TRANSPARENT_BRUSH)
         # set x, y, w, h for rectangle
         dc.DrawRectangle(x-1, y-1, w+2, h+2)
@@ -452,20 +553,39 @@ class AnimPanel(wx.Panel):
 
     def onEraseBack(self, e): pass # Do nothing, to avoid flashing on MSWin
 
+    @instrument.timed('paintAnimation')
     def onPaint(self, e):
         dc = wx.PaintDC(self.drawPanel)
         dc.Clear()
 
         if self.doc == None: return
         if len(self.doc.activeGroup.slices) > 0:
+            # Keep the frame being shown in the bitmap cache.
+            Slice.bitmapCache.setPinned([self.doc.activeGroup.slices[self.frame]], 'animation')
             slice = self.doc.activeGroup.slices[self.frame].bitmap
             dc.DrawBitmap(slice, (self.animWidth/2) - (slice.Width/2), (self.animHeight/2) - (slice.Height/2));
 
+# Slice thumbnails kept in the list's imageList at once. Only rows being shown need one.
+THUMBNAIL_SLOTS = 256
+
+# Virtual report list whose rows come from a SliceGroupPanel, so only visible rows are ever built.
+class SliceListCtrl(wx.ListCtrl):
+    def __init__(self, panel):
+        wx.ListCtrl.__init__(self, panel, style=wx.LC_REPORT|wx.LC_VIRTUAL|wx.BORDER_SUNKEN|wx.LC_SINGLE_SEL)
+        self.panel = panel
+
+    def OnGetItemText(self, item, column):
+        if column == 1: return str(item)
+        return ''
+
+    def OnGetItemImage(self, item):
+        return self.panel.getThumbnailIndex(item)
+
 class SliceGroupPanel(wx.Panel):
     def __init__(self, parent):
         wx.Panel.__init__(self, parent)
 
-        self.list = wx.ListCtrl(self, style=wx.LC_REPORT|wx.BORDER_SUNKEN|wx.LC_SINGLE_SEL)
+        self.list = SliceListCtrl(self)
         self.list.InsertColumn(0, 'slice')
         self.list.InsertColumn(1, 'name')
         self.list.SetColumnWidth(0, wx.LIST_AUTOSIZE_USEHEADER)
@@ -493,16 +613,26 @@ class SliceGroupPanel(wx.Panel):
 
         self.imageListScale = 0.5
         self.imageListSize = wx.Size(0, 0)
+        self.imageList = None
+        self.largestSize = wx.Size(0, 0) # Largest slice size seen, which the thumbnail cells are made to fit.
+        self.thumbnailSlots = OrderedDict() # slice: imageList index, least recently shown first.
+        self.freeSlots = []
 
         self.doc = None
 
     def setDocument(self, doc):
         self.doc = doc
-        self.slices = []
         self.doc.Bind(Document.EVT_ON_SLICES_ADD, self.onDocAddSlices)
         self.doc.Bind(Document.EVT_ON_SLICES_REMOVE, self.onDocRemoveSlices)
         self.doc.Bind(Document.EVT_ON_SLICE_SWAP, self.onDocSwapSlice)
-        self.list.DeleteAllItems()
+        self.doc.Bind(Document.EVT_ON_IMAGE_CHANGE, self.onDocImageChange)
+        self.largestSize = wx.Size(0, 0)
+        self.createImageList(self.largestSize)
+        self.list.SetItemCount(0)
+
+    # The slices shown, which are the document's active group.
+    def getSlices(self):
+        return self.doc.activeGroup.slices if self.doc != None else []
 
     def onDocAddSlices(self, e):
         self.addSlices(e.slices)
@@ -512,96 +642,124 @@ class SliceGroupPanel(wx.Panel):
         self.removeSlices(e.slices)
         e.Skip()
 
-    def onDocSwapSlice(self, e):
-        tmpBitmap = self.imageList.GetBitmap(e.indexA)
-        tmpSlice = self.slices[e.indexA]
-
-        # Swap slices array.
-        self.slices[e.indexA] = self.slices[e.indexB]
-        self.slices[e.indexB] = tmpSlice
-
-        # Swap image list bitmaps.
-        self.imageList.Replace(e.indexA, self.imageList.GetBitmap(e.indexB))
-        self.imageList.Replace(e.indexB, tmpBitmap)
+    def onDocImageChange(self, e):
+        # Any thumbnail may show pixels that changed.
+        self.createImageList(self.largestSize)
+        self.list.Refresh()
+        e.Skip()
 
-        # Update image list items.
-        self.list.SetStringItem(e.indexA, 0, '', e.indexA)
-        self.list.SetStringItem(e.indexB, 0, '', e.indexB)
+    def onDocSwapSlice(self, e):
+        # Thumbnails follow their slices, so only the two rows need redrawing.
+        self.list.RefreshItem(e.indexA)
+        self.list.RefreshItem(e.indexB)
         e.Skip()
 
-    # Creates and assigns a new imageList from the size specified. Adds sliced bitmaps.
+    # Returns a slice's thumbnail, scaled and padded to fit the imageList size. It's made from the slice's cached
+    # bitmap, so rows scrolled back into view after their thumbnail slot was reused aren't cropped again.
+    @instrument.timed('createThumbnail')
+    def createThumbnail(self, slice):
+        image = slice.bitmap.ConvertToImage()
+        newWidth = image.Width * self.imageListScale
+        newHeight = image.Height * self.imageListScale
+        if newWidth >= 1 and newHeight >= 1:
+            image = image.Scale(newWidth, newHeight, wx.IMAGE_QUALITY_HIGH)
+        image = image.Resize(self.imageListSize, (0, 0))
+        return image.ConvertToBitmap()
+
+    # Creates and assigns a new, empty imageList from the size specified. Thumbnails are added as rows are shown.
+    @instrument.timed('createImageList')
     def createImageList(self, size):
-        self.imageListSize = wx.Size(size.GetWidth() * self.imageListScale, size.GetHeight() * self.imageListScale)
-        self.imageList = wx.ImageList(self.imageListSize.GetWidth(), self.imageListSize.GetHeight(), len(self.slices))
-
-        # Add the images from the slices. Resize them to fit with the new imageList size.
-        for slice in self.slices:
-            image = slice.bitmap.ConvertToImage()
-            newWidth = image.Width * self.imageListScale
-            newHeight = image.Height * self.imageListScale
-            if newWidth >= 1 and newHeight >= 1:
-                image = image.Scale(newWidth, newHeight, wx.IMAGE_QUALITY_HIGH)
-            image = image.Resize(self.imageListSize, (0, 0))
-            self.imageList.Add(image.ConvertToBitmap())
-
+        self.imageListSize = wx.Size(max(1, int(size.GetWidth() * self.imageListScale)), max(1, int(size.GetHeight() * self.imageListScale)))
+        self.imageList = wx.ImageList(self.imageListSize.GetWidth(), self.imageListSize.GetHeight(), mask=True, initialCount=THUMBNAIL_SLOTS)
+        self.thumbnailSlots.clear()
+        self.freeSlots = []
         self.list.AssignImageList(self.imageList, wx.IMAGE_LIST_SMALL)
 
-    # Returns the largest width and height found from all sliced bitmaps.
-    def getLargestSize(self):
+    # Returns the imageList index of a row's thumbnail, creating it if needed. Once THUMBNAIL_SLOTS thumbnails
+    # exist, the least recently shown one is replaced.
+    def getThumbnailIndex(self, item):
+        slices = self.getSlices()
+        if item >= len(slices): return -1 # The document changed and the row count hasn't caught up yet.
+        slice = slices[item]
+        # Keep the bitmaps of the rows on screen, so scrolling doesn't evict and rebuild them.
+        top = self.list.GetTopItem()
+        Slice.bitmapCache.setPinned(slices[top:top + self.list.GetCountPerPage() + 1], 'list')
+        slot = self.thumbnailSlots.pop(slice, None)
+        if slot is None:
+            bitmap = self.createThumbnail(slice)
+            if self.freeSlots:
+                slot = self.freeSlots.pop()
+                self.imageList.Replace(slot, bitmap)
+            elif self.imageList.GetImageCount() < THUMBNAIL_SLOTS:
+                slot = self.imageList.Add(bitmap)
+            else:
+                slot = self.thumbnailSlots.popitem(last=False)[1]
+                self.imageList.Replace(slot, bitmap)
+        self.thumbnailSlots[slice] = slot
+        return slot
+
+    # Returns the largest width and height found from the given slices.
+    def getLargestSize(self, slices):
         width = 0
         height = 0
-        for slice in self.slices:
-            bitmap = slice.bitmap
-            if bitmap.Width > width: width = bitmap.Width
-            if bitmap.Height > height: height = bitmap.Height
+        for slice in slices:
+            rect = slice.rect
+            if rect.Width > width: width = rect.Width
+            if rect.Height > height: height = rect.Height
         return wx.Size(width, height)
 
     def addSlices(self, slices):
-        index = len(self.slices)
-
-        for slice in slices: self.slices.append(slice)
+        # Thumbnail cells only change when a new slice doesn't fit in the current ones.
+        addedSize = self.getLargestSize(slices)
+        if addedSize.Width > self.largestSize.Width or addedSize.Height > self.largestSize.Height:
+            self.largestSize = wx.Size(max(addedSize.Width, self.largestSize.Width), max(addedSize.Height, self.largestSize.Height))
+            self.createImageList(self.largestSize)
 
-        largestSize = self.getLargestSize()
-        self.createImageList(largestSize)
-
-        for slice in slices:
-            self.list.InsertStringItem(index, '', index)
-            self.list.SetStringItem(index, 1, str(index))
-            index += 1
+        self.list.SetItemCount(len(self.getSlices()))
+        self.list.Refresh()
 
     def removeSlices(self, slices):
-        self.list.DeleteAllItems()
-
         for slice in slices:
-            self.slices.remove(slice)
+            slot = self.thumbnailSlots.pop(slice, None)
+            if slot is not None: self.freeSlots.append(slot)
 
-        # Find largest size again, in case we deleted the largest slice.
-        largestSize = self.getLargestSize()
-        self.createImageList(largestSize)
-
-        for i in range(len(self.slices)):
-            self.list.InsertStringItem(i, '', long(i))
-            self.list.SetStringItem(i, 1, str(i))
+        self.list.SetItemCount(len(self.getSlices()))
+        self.list.Refresh()
 
     def onUpButton(self, e):
         if self.doc == None: return
         selectedIndex = self.list.GetFirstSelected()
         if (selectedIndex <= 0): return
-        self.doc.swapSlice(self.slices[selectedIndex-1], self.slices[selectedIndex])
+        slices = self.getSlices()
+        self.doc.swapSlice(slices[selectedIndex-1], slices[selectedIndex])
         self.list.Select(selectedIndex-1)
 
     def onDownButton(self, e):
         if self.doc == None: return
         selectedIndex = self.list.GetFirstSelected()
-        if (selectedIndex >= len(self.slices)-1): return
-        self.doc.swapSlice(self.slices[selectedIndex+1], self.slices[selectedIndex])
+        slices = self.getSlices()
+        if (selectedIndex >= len(slices)-1): return
+        self.doc.swapSlice(slices[selectedIndex+1], slices[selectedIndex])
         self.list.Select(selectedIndex+1)
 
     def onDeleteButton(self, e):
         if self.doc == None: return
         selectedIndex = self.list.GetFirstSelected()
         if selectedIndex < 0: return
-        self.doc.removeSlices(self.slices[selectedIndex])
+        self.doc.removeSlices(self.getSlices()[selectedIndex])
+
+# Milliseconds between checks of a watched sheet file.
+WATCH_INTERVAL = 1000
+
+# Packed pages are at most this many pixels a side, with this many between slices.
+PACK_MAX_SIZE = 4096
+PACK_PADDING = 2
+PACK_ROTATION = False
+
+# Background choices in the Edit menu. Faint pixels are those with alpha at or below FAINT_ALPHA_THRESHOLD, and
+# key colors match within COLOR_KEY_TOLERANCE per channel.
+FAINT_ALPHA_THRESHOLD = 32
+COLOR_KEY_TOLERANCE = 8
 
 class MainWindow(wx.Frame):
     def __init__(self, parent, title):
@@ -615,17 +773,38 @@ class MainWindow(wx.Frame):
         # File Menu
         # The ampersand is the acceleration key.
         menuOpen = fileMenu.Append(wx.ID_OPEN, 'Open...', 'Open image to edit.')
+        self.menuRawCache = fileMenu.AppendCheckItem(wx.NewId(), 'Cache Decoded Sheets', 'Keep decoded sheets on disk so reopening them is instant.')
+        menuReload = fileMenu.Append(wx.NewId(), '&Reload Sheet\tCtrl+R', 'Load the sheet again and update the slices of sprites that changed.')
+        self.menuWatch = fileMenu.AppendCheckItem(wx.NewId(), 'Watch Sheet File', 'Reload the sheet whenever it changes on disk.')
         fileMenu.AppendSeparator()
         menuImportJson = fileMenu.Append(wx.NewId(), 'Import JSON...', 'Create slices from JSON.')
         menuExportJson = fileMenu.Append(wx.NewId(), 'Export to &JSON...', 'Export slices to JSON.')
         menuExportPng = fileMenu.Append(wx.NewId(), 'Export to &PNG...', 'Export slices to PNG images.')
+        menuImportAtlas = fileMenu.Append(wx.NewId(), 'Import Atlas...', 'Create slices from a binary atlas.')
+        menuExportAtlas = fileMenu.Append(wx.NewId(), 'Export to &Atlas...', 'Export slices to a binary atlas.')
+        menuPack = fileMenu.Append(wx.NewId(), 'Pack Slices...', 'Pack slices into power of two PNG pages with JSON frames.')
+        self.menuDedupe = fileMenu.AppendCheckItem(wx.NewId(), 'Merge Duplicate Slices', 'Export and pack slices with the same pixels once, as aliases in the JSON.')
+        self.menuDedupeFlips = fileMenu.AppendCheckItem(wx.NewId(), 'Match Flipped Duplicates', 'Also merge slices that are flipped or rotated copies of another.')
+        self.menuFastPng = fileMenu.AppendCheckItem(wx.NewId(), 'Fast PNG Compression', 'Export PNGs quicker but bigger, for test builds.')
         fileMenu.AppendSeparator()
         menuExit = fileMenu.Append(wx.ID_EXIT, 'E&xit', 'Terminate program')
         # Edit Menu
         menuFindSprites = editMenu.Append(wx.NewId(), 'Find Sprites', 'Finds sprites and adds them as slices.')
         editMenu.AppendSeparator()
+        # (item, alpha threshold, color key) for each way of telling sprites from background.
+        self.backgroundItems = [
+            (editMenu.AppendRadioItem(wx.NewId(), 'Transparent Background', 'Sprites are the pixels that are not fully transparent.'), 0, None),
+            (editMenu.AppendRadioItem(wx.NewId(), 'Ignore Faint Pixels', 'Nearly transparent pixels, like anti-aliased haloes, are background too.'), FAINT_ALPHA_THRESHOLD, None),
+            (editMenu.AppendRadioItem(wx.NewId(), 'Magenta Background', 'Magenta pixels are background, for sheets without transparency.'), 0, colorkey.ColorKey(colorkey.MAGENTA, COLOR_KEY_TOLERANCE)),
+            (editMenu.AppendRadioItem(wx.NewId(), 'Corner Color Background', 'Pixels the color of the top left corner are background.'), 0, colorkey.CornerColorKey('top-left', COLOR_KEY_TOLERANCE)),
+        ]
+        editMenu.AppendSeparator()
         menuDeleteAll = editMenu.Append(wx.NewId(), 'Delete All Slices', 'Deletes all current slices.')
+        editMenu.AppendSeparator()
+        menuCacheStats = editMenu.Append(wx.NewId(), 'Cache Stats', 'Shows how often Find Sprites reused earlier results and slice bitmaps were reused.')
+        menuClearCache = editMenu.Append(wx.NewId(), 'Clear Detection Cache', 'Forgets the sprites found in earlier searches.')
         # Help Menu
+        self.menuTrace = helpMenu.AppendCheckItem(wx.NewId(), 'Record Performance Trace', 'Time loading, searching, drawing and exporting until unchecked, then save a trace.')
         menuAbout = helpMenu.Append(wx.ID_ABOUT, '&About', 'Info goes here')
 
         menuBar.Append(fileMenu, '&File')
@@ -634,13 +813,23 @@ class MainWindow(wx.Frame):
         self.SetMenuBar(menuBar)
 
         self.Bind(wx.EVT_MENU, self.onOpen, menuOpen)
+        self.Bind(wx.EVT_MENU, self.onReload, menuReload)
+        self.Bind(wx.EVT_MENU, self.onWatchToggle, self.menuWatch)
         self.Bind(wx.EVT_MENU, self.onAbout, menuAbout)
+        self.Bind(wx.EVT_MENU, self.onTraceToggle, self.menuTrace)
         self.Bind(wx.EVT_MENU, self.onExit, menuExit)
         self.Bind(wx.EVT_MENU, self.onImportJsonButton, menuImportJson)
         self.Bind(wx.EVT_MENU, self.onExportJsonButton, menuExportJson)
         self.Bind(wx.EVT_MENU, self.onExportSliceButton, menuExportPng)
+        self.Bind(wx.EVT_MENU, self.onImportAtlasButton, menuImportAtlas)
+        self.Bind(wx.EVT_MENU, self.onExportAtlasButton, menuExportAtlas)
+        self.Bind(wx.EVT_MENU, self.onPackButton, menuPack)
         self.Bind(wx.EVT_MENU, self.onFindSpritesButton, menuFindSprites)
+        for item, alphaThreshold, colorKey in self.backgroundItems:
+            self.Bind(wx.EVT_MENU, self.onBackgroundChange, item)
         self.Bind(wx.EVT_MENU, self.onDeleteAllButton, menuDeleteAll)
+        self.Bind(wx.EVT_MENU, self.onCacheStats, menuCacheStats)
+        self.Bind(wx.EVT_MENU, self.onClearCache, menuClearCache)
 
         self.sheetPanelSizer = wx.BoxSizer(wx.VERTICAL)
         self.sheetPanelScroller = wx.lib.scrolledpanel.ScrolledPanel(self)
@@ -695,6 +884,12 @@ class MainWindow(wx.Frame):
 
         self.doc = None
 
+        # Polls the sheet file while watching it. A change is only reloaded once the file has stopped changing
+        # between polls, so sheets still being written aren't read.
+        self.watchTimer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.onWatchTimer, self.watchTimer)
+        self.watchedStamp = None
+
         self.Show(True)
 
         self.sheetPanel.SetFocus()
@@ -704,11 +899,46 @@ class MainWindow(wx.Frame):
         if dlg.ShowModal() == wx.ID_OK:
             filePath = os.path.join(dlg.GetDirectory(), dlg.GetFilename())
             self.SetLabel(dlg.GetFilename())
-            self.doc = Document(filePath)
+            self.doc = Document(filePath, self.menuRawCache.IsChecked())
+            self.applyBackground()
             self.sheetPanel.setDocument(self.doc)
             self.sliceGroupPanel.setDocument(self.doc)
             self.animPanel.setDocument(self.doc)
 
+    # Sets the document's background to the one checked in the Edit menu.
+    def applyBackground(self):
+        for item, alphaThreshold, colorKey in self.backgroundItems:
+            if item.IsChecked():
+                self.doc.alphaThreshold = alphaThreshold
+                self.doc.colorKey = colorKey
+
+    def onBackgroundChange(self, e):
+        if self.doc == None: return
+        self.applyBackground()
+
+    def onReload(self, e):
+        if self.doc == None: return
+        self.doc.reload()
+
+    def onWatchToggle(self, e):
+        if self.menuWatch.IsChecked():
+            self.watchTimer.Start(WATCH_INTERVAL)
+        else:
+            self.watchTimer.Stop()
+
+    def onWatchTimer(self, e):
+        if self.doc == None: return
+        try:
+            if not self.doc.hasFileChanged(): return
+            stamp = model.getFileStamp(self.doc.fileName)
+        except OSError: return # Mid save.
+        if stamp != self.watchedStamp:
+            self.watchedStamp = stamp
+            return
+        try:
+            self.doc.reload()
+        except (IOError, ValueError): return # Not a complete image yet. Try again on the next poll.
+
     def onGridButton(self, e):
         self.sheetPanel.gridSelection = not self.sheetPanel.gridSelection
         self.sheetPanel.Refresh()
@@ -737,6 +967,11 @@ class MainWindow(wx.Frame):
             self.sheetPanel.Refresh()
         except ValueError: return
 
+    # Returns the dedup mode chosen in the File menu, or None to export every slice.
+    def getDedupeMode(self):
+        if not self.menuDedupe.IsChecked(): return None
+        return 'flips' if self.menuDedupeFlips.IsChecked() else 'exact'
+
     def onExportSliceButton(self, e):
         if self.doc == None: return
         dlg = wx.FileDialog(self, 'Export Slices', './', '', '*.png', wx.SAVE)
@@ -756,9 +991,15 @@ class MainWindow(wx.Frame):
                 warn.Destroy()
 
             if (write):
-                for i, slice in enumerate(self.doc.activeGroup.slices):
-                    filePath = os.path.join(dlg.GetDirectory(), filePaths[i])
-                    slice.bitmap.ConvertToImage().SaveFile(filePath, wx.BITMAP_TYPE_PNG)
+                rects = [slice.rect for slice in self.doc.activeGroup.slices]
+                dedupe = self.getDedupeMode()
+                if dedupe:
+                    unique = dedup.getUnique(dedup.findDuplicates(self.doc.image, rects, dedupe)) # Others are exported as their original.
+                    rects = [rects[i] for i in unique]
+                    filePaths = [filePaths[i] for i in unique]
+                level = exporter.FAST_LEVEL if self.menuFastPng.IsChecked() else exporter.DEFAULT_LEVEL
+                em = exportui.SliceExportModal(self, self.doc.image, rects, filePaths, level)
+                em.ShowModal()
 
         dlg.Destroy()
 
@@ -775,7 +1016,7 @@ class MainWindow(wx.Frame):
 
             if (write):
                 with open(filePath, 'w') as file:
-                    file.write(json.dumps(self.doc.exportJson()))
+                    file.write(json.dumps(self.doc.exportJson(self.getDedupeMode())))
 
         dlg.Destroy()
 
@@ -788,9 +1029,49 @@ class MainWindow(wx.Frame):
                 self.doc.importJson(file.read())
         dlg.Destroy()
 
+    def onExportAtlasButton(self, e):
+        if self.doc == None: return
+        dlg = wx.FileDialog(self, 'Export Atlas', './', '', '*.atlas', wx.SAVE)
+        if dlg.ShowModal() == wx.ID_OK:
+            filePath = os.path.join(dlg.GetDirectory(), dlg.GetFilename())
+            write = True
+            if (os.path.exists(filePath)):
+                warn = wx.MessageDialog(self, "This will overwrite the current file's data.", 'Warning')
+                write = (warn.ShowModal() == wx.ID_OK)
+                warn.Destroy()
+
+            if (write):
+                self.doc.exportAtlas(filePath)
+
+        dlg.Destroy()
+
+    def onImportAtlasButton(self, e):
+        if self.doc == None: return
+        dlg = wx.FileDialog(self, 'Import Atlas', './', '', '*.atlas', wx.FD_OPEN)
+        if dlg.ShowModal() == wx.ID_OK:
+            filePath = os.path.join(dlg.GetDirectory(), dlg.GetFilename())
+            self.doc.importAtlas(filePath)
+        dlg.Destroy()
+
+    def onPackButton(self, e):
+        if self.doc == None or not self.doc.activeGroup.slices: return
+        if packer.np is None:
+            dlg = wx.MessageDialog(self, 'Packing slices requires NumPy.', 'Pack Slices', wx.OK)
+            dlg.ShowModal()
+            dlg.Destroy()
+            return
+        dlg = wx.FileDialog(self, 'Pack Slices', './', '', '*.png', wx.SAVE)
+        if dlg.ShowModal() == wx.ID_OK:
+            filePath = os.path.join(dlg.GetDirectory(), dlg.GetFilename())
+            rects = [slice.rect for slice in self.doc.activeGroup.slices]
+            frames = packer.packImage(self.doc.image, rects, filePath, PACK_MAX_SIZE, PACK_PADDING, PACK_ROTATION, dedupe=self.getDedupeMode())
+            with open(os.path.splitext(filePath)[0] + '.json', 'w') as file:
+                file.write(json.dumps(frames))
+        dlg.Destroy()
+
     def onFindSpritesButton(self, e):
         if self.doc == None: return
-        fm = spritefinder.FinderModal(self, self.doc)
+        fm = finderui.FinderModal(self, self.doc)
         fm.ShowModal()
 
     def onDeleteAllButton(self, e):
@@ -799,6 +1080,34 @@ class MainWindow(wx.Frame):
         toRemove = list(self.doc.activeGroup.slices)
         self.doc.removeSlices(toRemove)
 
+    def onCacheStats(self, e):
+        stats = finderui.detectionCache.getStats()
+        message = 'Detection: %d hits, %d misses, %d evicted\n%d sheets cached in %.1f of %.1f MB' % (
+            stats['hits'], stats['misses'], stats['evictions'], stats['items'],
+            stats['bytes'] / 1048576.0, finderui.detectionCache.maxBytes / 1048576.0)
+        stats = Slice.bitmapCache.getStats()
+        message += '\n\nSlice bitmaps: %d hits, %d misses, %d evicted\n%d bitmaps cached in %.1f of %.1f MB' % (
+            stats['hits'], stats['misses'], stats['evictions'], stats['items'],
+            stats['bytes'] / 1048576.0, Slice.bitmapCache.maxBytes / 1048576.0)
+        dlg = wx.MessageDialog(self, message, 'Cache Stats', wx.OK)
+        dlg.ShowModal()
+        dlg.Destroy()
+
+    def onClearCache(self, e):
+        finderui.detectionCache.clear()
+
+    # Starts recording spans, or stops and saves them as a Chrome trace for chrome://tracing or Perfetto.
+    def onTraceToggle(self, e):
+        if self.menuTrace.IsChecked():
+            instrument.reset()
+            instrument.enable()
+            return
+        instrument.disable()
+        dlg = wx.FileDialog(self, 'Save Performance Trace', './', '', '*.json', wx.SAVE)
+        if dlg.ShowModal() == wx.ID_OK:
+            instrument.writeTrace(os.path.join(dlg.GetDirectory(), dlg.GetFilename()))
+        dlg.Destroy()
+
     def onAbout(self, e):
         dlg = wx.MessageDialog(self, 'This is where the about stuff goes', 'About this', wx.OK)
         dlg.ShowModal()
@@ -807,8 +1116,9 @@ class MainWindow(wx.Frame):
     def onExit(self, e):
         self.Close(True)
 
-app = wx.App(False)
+if __name__ == '__main__':
+    app = wx.App(False)
 
-frame = MainWindow(None, 'spri')
-app.MainLoop()
-app.Destroy()
+    frame = MainWindow(None, 'spri')
+    app.MainLoop()
+    app.Destroy()
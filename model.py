@@ -0,0 +1,217 @@
+import json
+import os
+import atlas
+import dedup
+import imagebackend
+import instrument
+import rawcache
+
+# Plain rectangle with the same attribute names as wx.Rect, so either can be used by the core.
+class Rect():
+    def __init__(self, x=0, y=0, width=0, height=0):
+        self.X = x
+        self.Y = y
+        self.Width = width
+        self.Height = height
+
+    def Get(self):
+        return (self.X, self.Y, self.Width, self.Height)
+
+    def IsEmpty(self):
+        return self.Width <= 0 or self.Height <= 0
+
+    def ContainsXY(self, x, y):
+        return self.X <= x < self.X + self.Width and self.Y <= y < self.Y + self.Height
+
+    def __eq__(self, other):
+        return isinstance(other, Rect) and self.Get() == other.Get()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.Get())
+
+    def __repr__(self):
+        return 'Rect(%d, %d, %d, %d)' % self.Get()
+
+class Slice():
+    def __init__(self, doc, sliceRect):
+        self.doc = doc
+        self.rect = sliceRect
+
+class SpriteGroup():
+    def __init__(self):
+        self.slices = []
+
+    def addSlice(self, slice):
+        self.slices.append(slice)
+
+    def removeSlice(self, slice):
+        self.slices.remove(slice)
+
+    # Removes many slices in one pass over the group.
+    def removeSlices(self, slices):
+        removed = set(slices)
+        self.slices = [slice for slice in self.slices if slice not in removed]
+
+    def swapSlice(self, sliceA, sliceB):
+        aIndex = self.slices.index(sliceA)
+        bIndex = self.slices.index(sliceB)
+        if aIndex < 0 or bIndex < 0: return False
+
+        self.slices[aIndex] = sliceB
+        self.slices[bIndex] = sliceA
+        return (aIndex, bIndex)
+
+# The slicing document without any UI. Listeners bound with bind() are called with the event's keyword arguments.
+class Document():
+    SLICES_ADD = 'slicesAdd' # slices
+    SLICES_REMOVE = 'slicesRemove' # slices
+    SLICE_SWAP = 'sliceSwap' # indexA, indexB
+    IMAGE_CHANGE = 'imageChange' # regions
+
+    # image is any image backend with Width, Height, HasAlpha and GetAlphaBuffer, such as imagebackend.RgbaImage
+    # or wx.Image. sliceClass builds the slices this document creates. With useRawCache the sheet is decoded once
+    # into rawcache and memory-mapped from there.
+    def __init__(self, fileName=None, image=None, sliceClass=Slice, useRawCache=False):
+        self.listeners = {}
+        self.sliceClass = sliceClass
+        self.useRawCache = useRawCache
+        # Which pixels searches and trimming treat as background: alpha at or below alphaThreshold, and the
+        # color of colorKey, a colorkey.ColorKey, if set.
+        self.alphaThreshold = 0
+        self.colorKey = None
+        self.fileName = fileName
+        if fileName is not None:
+            self.setCurrentWorkingGraphic(fileName)
+        else:
+            self.image = image
+
+        self.activeGroup = SpriteGroup()
+        self.spriteGroups = [self.activeGroup]
+
+    # Listeners can't be pickled, so documents sent to worker processes arrive without them. Sheets from the raw
+    # cache are sent as the path of their cache file and mapped again on arrival.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['listeners'] = {}
+        return state
+
+    def bind(self, event, listener):
+        self.listeners.setdefault(event, []).append(listener)
+
+    def notify(self, event, **kwargs):
+        for listener in self.listeners.get(event, []):
+            listener(**kwargs)
+
+    def addSlicesFromSpriteBounds(self, spriteBounds):
+        slices = []
+        for rect in spriteBounds:
+            slices.append(self.sliceClass(self, rect))
+        self.addSlices(slices)
+
+    def addSlices(self, slices):
+        if isinstance(slices, Slice): slices = [slices]
+        for slice in slices:
+            self.activeGroup.addSlice(slice)
+        self.notify(Document.SLICES_ADD, slices=slices)
+
+    def removeSlices(self, slices):
+        if isinstance(slices, Slice): slices = [slices]
+        self.activeGroup.removeSlices(slices)
+        self.notify(Document.SLICES_REMOVE, slices=slices)
+
+    def swapSlice(self, sliceA, sliceB):
+        indices = self.activeGroup.swapSlice(sliceA, sliceB)
+        if indices == False: return
+        self.notify(Document.SLICE_SWAP, indexA=indices[0], indexB=indices[1])
+
+    def setCurrentWorkingGraphic(self, fileName):
+        stamp = getFileStamp(fileName)
+        with instrument.span('load', file=os.path.basename(fileName)):
+            self.image = self.loadImage(fileName)
+        self.fileName = fileName
+        self.fileStamp = stamp
+
+    # Returns the sheet in fileName as an image backend. Subclasses can load it as another kind of image.
+    def loadImage(self, fileName):
+        if self.useRawCache: return rawcache.loadImage(fileName)
+        return imagebackend.loadImage(fileName)
+
+    # Returns True if the sheet file was changed since it was loaded.
+    def hasFileChanged(self):
+        return self.fileName is not None and getFileStamp(self.fileName) != self.fileStamp
+
+    # Loads the sheet file again and searches only the parts that changed. Slices of sprites that changed or
+    # went away are removed and new sprites are added at the end, while every other slice keeps its place.
+    # Returns the Rects of the regions that were searched.
+    def reload(self):
+        import sheetdiff # sheetdiff uses spritefinder, which needs Rect from this module.
+        oldImage = self.image
+        self.setCurrentWorkingGraphic(self.fileName)
+        slices = self.activeGroup.slices
+        regions, oldBounds, newBounds = sheetdiff.findChanges(oldImage, self.image, [slice.rect for slice in slices], self.alphaThreshold, self.colorKey)
+
+        oldSet = set(rect.Get() for rect in oldBounds)
+        newSet = set(rect.Get() for rect in newBounds)
+        existing = set(tuple(slice.rect.Get()) for slice in slices)
+        stale = [slice for slice in slices if tuple(slice.rect.Get()) in oldSet and tuple(slice.rect.Get()) not in newSet]
+        added = [rect for rect in newBounds if rect.Get() not in oldSet and rect.Get() not in existing]
+
+        if stale: self.removeSlices(stale)
+        if added: self.addSlicesFromSpriteBounds(added)
+        self.notify(Document.IMAGE_CHANGE, regions=regions)
+        return regions
+
+    # Adds a slice for every frame of a JSON string from exportJson. With trim, frames are first trimmed to the
+    # visible pixels inside them.
+    def importJson(self, jsonString, trim=False):
+        rects = framesFromJson(jsonString)
+        if trim:
+            import spritefinder # spritefinder needs Rect from this module.
+            rects = spritefinder.trimRects(self.image, rects, self.alphaThreshold, self.colorKey)
+        self.addSlicesFromSpriteBounds(rects)
+
+    # With a dedupe mode from dedup.MODES, frames whose pixels match an earlier frame are marked as its aliases.
+    def exportJson(self, dedupe=None):
+        rects = [slice.rect for slice in self.activeGroup.slices]
+        out = framesToJson(rects)
+        if dedupe: dedup.addAliases(out, dedup.findDuplicates(self.image, rects, dedupe))
+        return out
+
+    # Adds a slice for every frame of an atlas file from exportAtlas.
+    def importAtlas(self, fileName):
+        frames, names = atlas.readAtlas(fileName)
+        self.addSlicesFromSpriteBounds([Rect(*frame) for frame in frames])
+
+    # Writes the slices to a binary atlas file. See atlas for the format.
+    def exportAtlas(self, fileName):
+        return atlas.writeAtlas(fileName, [slice.rect for slice in self.activeGroup.slices])
+
+# Returns the (modification time, size) of a file, which changes whenever the file is saved.
+def getFileStamp(fileName):
+    stat = os.stat(fileName)
+    return (stat.st_mtime, stat.st_size)
+
+# Returns the JSON-ready frames dict for a list of rects, keyed by each rect's index.
+def framesToJson(rects):
+    out = {'frames': {}}
+    for i, rect in enumerate(rects):
+        out['frames'][str(i)] = {
+            'frame': {
+                'x': rect.X,
+                'y': rect.Y,
+                'w': rect.Width,
+                'h': rect.Height,
+            }
+        }
+    return out
+
+# Returns the rects of a JSON frames string from framesToJson, in frame order.
+def framesFromJson(jsonString):
+    sliceData = json.loads(jsonString)
+    frames = [None] * len(sliceData['frames'])
+    for key in sliceData['frames']:
+        frames[int(key)] = sliceData['frames'][key]['frame']
+    return [Rect(frame['x'], frame['y'], frame['w'], frame['h']) for frame in frames]
@@ -0,0 +1,431 @@
+import argparse
+import os
+import random
+import sys
+import time
+import dedup
+import imagebackend
+import instrument
+from model import Rect, framesToJson
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # Only the skyline heuristic can pack, and packed sheets can't be written.
+
+# Packs slices into atlas pages. Rects are placed largest first into pages of at most maxSize pixels a side,
+# opening a new page when one fills up, and each page is then cropped to the smallest power of two sizes that
+# hold what was placed on it, or to maxSize if that's smaller.
+
+HEURISTICS = ['maxrects-bssf', 'maxrects-baf', 'maxrects-bl', 'skyline']
+
+# MaxRects scores every free rect for every placement, which takes about a second for this many rects. Without
+# a heuristic, larger sets are packed with the skyline.
+MAXRECTS_MAX_RECTS = 10000
+
+# Free space of a MaxRects page: every maximal empty rect, kept in NumPy arrays of their left, top, right and
+# bottom edges so each placement scores and splits them all at once. Removed rects are left as empty holes that
+# new rects fill, and the arrays are compacted once they're mostly holes.
+class MaxRectsPage():
+    def __init__(self, width, height, heuristic='maxrects-bssf'):
+        self.width = width
+        self.height = height
+        self.heuristic = heuristic
+        self.left = np.zeros(64, np.int64)
+        self.top = np.zeros(64, np.int64)
+        self.right = np.zeros(64, np.int64)
+        self.bottom = np.zeros(64, np.int64)
+        self.right[0] = width
+        self.bottom[0] = height
+        self.count = 1 # Slots in use, holes included.
+        self.holes = []
+        self.minWidth = 1
+        self.minHeight = 1
+        self.usedWidth = 0
+        self.usedHeight = 0
+
+    # Sets the size of the smallest rect still to be placed. Free rects too thin for it are dropped, which
+    # keeps the free list short.
+    def setMinSize(self, minWidth, minHeight):
+        if (minWidth, minHeight) == (self.minWidth, self.minHeight): return
+        self.minWidth = minWidth
+        self.minHeight = minHeight
+        n = self.count
+        thin = (self.right[:n] - self.left[:n] < minWidth) | (self.bottom[:n] - self.top[:n] < minHeight)
+        self.remove(np.flatnonzero(thin & (self.right[:n] > self.left[:n])))
+
+    # Turns slots into holes.
+    def remove(self, indices):
+        self.left[indices] = 0
+        self.top[indices] = 0
+        self.right[indices] = 0
+        self.bottom[indices] = 0
+        self.holes.extend(indices.tolist())
+
+    def add(self, rects):
+        for rect in rects:
+            if self.holes:
+                i = self.holes.pop()
+            else:
+                if self.count == len(self.left): self.grow()
+                i = self.count
+                self.count += 1
+            self.left[i], self.top[i], self.right[i], self.bottom[i] = rect
+        if len(self.holes) > self.count // 2: self.compact()
+
+    def grow(self):
+        for name in ('left', 'top', 'right', 'bottom'):
+            edges = getattr(self, name)
+            setattr(self, name, np.concatenate([edges, np.zeros(len(edges), np.int64)]))
+
+    def compact(self):
+        n = self.count
+        used = np.flatnonzero(self.right[:n] > self.left[:n])
+        for name in ('left', 'top', 'right', 'bottom'):
+            edges = getattr(self, name)
+            edges[:len(used)] = edges[used]
+        self.count = len(used)
+        self.holes = []
+
+    # Returns the score of placing a w by h rect in each free slot, lower being better, or None if it fits in
+    # none of them.
+    def getScores(self, w, h):
+        n = self.count
+        leftoverW = self.right[:n] - self.left[:n] - w
+        leftoverH = self.bottom[:n] - self.top[:n] - h
+        fits = (leftoverW >= 0) & (leftoverH >= 0)
+        if not fits.any(): return None
+        if self.heuristic == 'maxrects-baf':
+            scores = ((leftoverW + w) * (leftoverH + h) - w * h) << 32
+            scores += np.minimum(leftoverW, leftoverH)
+        elif self.heuristic == 'maxrects-bl':
+            scores = (self.top[:n] + h) << 32
+            scores += self.left[:n]
+        else:
+            scores = np.minimum(leftoverW, leftoverH) << 32
+            scores += np.maximum(leftoverW, leftoverH)
+        scores[~fits] = np.iinfo(np.int64).max
+        return scores
+
+    # Returns (score, x, y, rotated) for the best place for a w by h rect, or None if it doesn't fit.
+    def findPosition(self, w, h, allowRotation):
+        best = None
+        for rotated, (rw, rh) in enumerate([(w, h), (h, w)] if allowRotation and w != h else [(w, h)]):
+            scores = self.getScores(rw, rh)
+            if scores is None: continue
+            i = int(scores.argmin())
+            if best is None or scores[i] < best[0]:
+                best = (scores[i], int(self.left[i]), int(self.top[i]), bool(rotated))
+        return best
+
+    def place(self, x, y, w, h):
+        right = x + w
+        bottom = y + h
+        n = self.count
+        left, top, freeRight, freeBottom = self.left[:n], self.top[:n], self.right[:n], self.bottom[:n]
+        hit = np.flatnonzero((left < right) & (freeRight > x) & (top < bottom) & (freeBottom > y))
+
+        # Every free rect the placed rect overlaps leaves up to four maximal rects around it.
+        created = []
+        minWidth = self.minWidth
+        minHeight = self.minHeight
+        for fl, ft, fr, fb in zip(left[hit].tolist(), top[hit].tolist(), freeRight[hit].tolist(), freeBottom[hit].tolist()):
+            if x - fl >= minWidth and fb - ft >= minHeight: created.append((fl, ft, x, fb))
+            if fr - right >= minWidth and fb - ft >= minHeight: created.append((right, ft, fr, fb))
+            if y - ft >= minHeight and fr - fl >= minWidth: created.append((fl, ft, fr, y))
+            if fb - bottom >= minHeight and fr - fl >= minWidth: created.append((fl, bottom, fr, fb))
+        self.remove(hit)
+
+        # Drop new rects inside another free rect. Old rects can't be inside new ones, since every new rect is
+        # inside an old rect that was itself maximal.
+        if created:
+            created = np.array(created, np.int64)
+            cl, ct, cr, cb = created.T[:, :, None]
+            # Only old rects reaching over the new ones' shared area can hold any of them.
+            near = np.flatnonzero((left <= cl.max()) & (top <= ct.max()) & (freeRight >= cr.min()) & (freeBottom >= cb.min()))
+            covered = ((left[near] <= cl) & (top[near] <= ct) & (freeRight[near] >= cr) & (freeBottom[near] >= cb)).any(axis=1)
+            # New rects inside other new ones. A rect is inside itself, and of identical ones only the first is kept.
+            ol, ot, orr, ob = created.T
+            inside = (ol <= cl) & (ot <= ct) & (orr >= cr) & (ob >= cb)
+            order = np.arange(len(created))
+            same = (ol == cl) & (ot == ct) & (orr == cr) & (ob == cb)
+            inside &= ~(same & (order[None, :] >= order[:, None]))
+            covered |= inside.any(axis=1)
+            created = created[~covered].tolist()
+        self.add(created)
+        self.usedWidth = max(self.usedWidth, right)
+        self.usedHeight = max(self.usedHeight, bottom)
+
+    # Places a w by h rect. Returns (x, y, rotated), or None if it doesn't fit.
+    def insert(self, w, h, allowRotation=False):
+        position = self.findPosition(w, h, allowRotation)
+        if position is None: return None
+        score, x, y, rotated = position
+        if rotated: w, h = h, w
+        self.place(x, y, w, h)
+        return (x, y, rotated)
+
+# Skyline bottom-left page. Keeps the top edge of what's been placed as [x, y, width] segments, so it's fast
+# but wastes the space under overhangs.
+class SkylinePage():
+    def __init__(self, width, height, heuristic='skyline'):
+        self.width = width
+        self.height = height
+        self.skyline = [[0, 0, width]]
+        self.usedWidth = 0
+        self.usedHeight = 0
+
+    def setMinSize(self, minWidth, minHeight): pass # The skyline has no free list to prune.
+
+    # Returns the y a w by h rect would rest at with its left edge on segment index, or None if it doesn't fit.
+    def getFitY(self, index, w, h):
+        x = self.skyline[index][0]
+        if x + w > self.width: return None
+        y = 0
+        remaining = w
+        while remaining > 0:
+            if index >= len(self.skyline): return None
+            segment = self.skyline[index]
+            if segment[1] > y: y = segment[1]
+            if y + h > self.height: return None
+            remaining -= segment[2] if segment[0] >= x else segment[0] + segment[2] - x
+            index += 1
+        return y
+
+    # Returns (bottom, x, y, index, rotated) for the lowest place for a w by h rect, or None.
+    def findPosition(self, w, h, allowRotation):
+        best = None
+        for rotated, (rw, rh) in enumerate([(w, h), (h, w)] if allowRotation and w != h else [(w, h)]):
+            for index in range(len(self.skyline)):
+                y = self.getFitY(index, rw, rh)
+                if y is None: continue
+                x = self.skyline[index][0]
+                if best is None or (y + rh, x) < best[:2]:
+                    best = (y + rh, x, y, index, bool(rotated))
+        return best
+
+    def place(self, index, x, y, w, h):
+        self.skyline.insert(index, [x, y + h, w])
+        # Cut the segments the new one covers.
+        i = index + 1
+        while i < len(self.skyline):
+            segment = self.skyline[i]
+            overlap = x + w - segment[0]
+            if overlap <= 0: break
+            if overlap >= segment[2]:
+                del self.skyline[i]
+                continue
+            segment[0] += overlap
+            segment[2] -= overlap
+            break
+        # Join neighbors at the same height.
+        i = 0
+        while i < len(self.skyline) - 1:
+            if self.skyline[i][1] == self.skyline[i + 1][1]:
+                self.skyline[i][2] += self.skyline[i + 1][2]
+                del self.skyline[i + 1]
+            else:
+                i += 1
+        self.usedWidth = max(self.usedWidth, x + w)
+        self.usedHeight = max(self.usedHeight, y + h)
+
+    def insert(self, w, h, allowRotation=False):
+        position = self.findPosition(w, h, allowRotation)
+        if position is None: return None
+        bottom, x, y, index, rotated = position
+        if rotated: w, h = h, w
+        self.place(index, x, y, w, h)
+        return (x, y, rotated)
+
+# The same skyline kept as a NumPy array of the height of every column, so each placement scores the rect on
+# every segment at once rather than walking them.
+class HeightMapPage(SkylinePage):
+    def __init__(self, width, height, heuristic='skyline'):
+        SkylinePage.__init__(self, width, height, heuristic)
+        self.heights = np.zeros(width + 1, np.int64) # One extra column, so a rect can end at the page edge.
+        self.isStart = np.zeros(width, bool) # Columns where a segment starts.
+        self.isStart[0] = True
+        self.starts = np.zeros(1, np.int64)
+
+    def findPosition(self, w, h, allowRotation):
+        best = None
+        for rotated, (rw, rh) in enumerate([(w, h), (h, w)] if allowRotation and w != h else [(w, h)]):
+            starts = self.starts[:np.searchsorted(self.starts, self.width - rw, 'right')]
+            if len(starts) == 0: continue
+            # The highest column under each place, from the max of every [start, start + rw) column range.
+            edges = np.repeat(starts, 2)
+            edges[1::2] += rw
+            bottoms = np.maximum.reduceat(self.heights, edges)[0::2] + rh
+            i = int((bottoms * (self.width + 1) + starts).argmin())
+            bottom, x = int(bottoms[i]), int(starts[i])
+            if bottom > self.height: continue # The lowest place is too high, so none fit.
+            if best is None or (bottom, x) < best[:2]:
+                best = (bottom, x, bottom - rh, None, bool(rotated))
+        return best
+
+    def place(self, index, x, y, w, h):
+        heights = self.heights
+        heights[x:x + w] = y + h
+        self.isStart[x + 1:x + w] = False
+        if x > 0: self.isStart[x] = heights[x - 1] != heights[x]
+        if x + w < self.width: self.isStart[x + w] = heights[x + w] != heights[x + w - 1]
+        self.starts = np.flatnonzero(self.isStart)
+        self.usedWidth = max(self.usedWidth, x + w)
+        self.usedHeight = max(self.usedHeight, y + h)
+
+# Returns the smallest power of two that is at least size.
+def nextPowerOfTwo(size):
+    power = 1
+    while power < size: power <<= 1
+    return power
+
+# Records that a w by h rect didn't fit in a page, dropping the failures it makes redundant. With rotation the
+# rect didn't fit either way around, so both are recorded.
+def addFailure(failures, w, h, allowRotation):
+    for size in ([(w, h), (h, w)] if allowRotation else [(w, h)]):
+        failures[:] = [failed for failed in failures if not (failed[0] >= size[0] and failed[1] >= size[1])]
+        failures.append(size)
+
+# Packs (w, h) sizes into pages. Returns (pages, placements) where pages are (width, height) power of two
+# sizes, capped at maxSize, and placements are (page, x, y, rotated) in the order of sizes. Rotated rects are
+# turned 90 degrees clockwise and take up h by w. padding is left between rects but not around the page edges.
+# heuristic is one of HEURISTICS, or None for maxrects-bssf up to MAXRECTS_MAX_RECTS rects and skyline past it.
+def packRects(sizes, maxSize=4096, padding=0, allowRotation=False, heuristic=None):
+    if heuristic is None:
+        heuristic = 'maxrects-bssf' if len(sizes) <= MAXRECTS_MAX_RECTS and np is not None else 'skyline'
+    if heuristic not in HEURISTICS:
+        raise ValueError('Unknown heuristic: ' + heuristic)
+    if heuristic != 'skyline':
+        pageClass = MaxRectsPage
+    else:
+        pageClass = SkylinePage if np is None else HeightMapPage
+    # Padding is added to every rect's right and bottom, and the page grows to match so the last ones still fit.
+    pageSize = maxSize + padding
+
+    order = sorted(range(len(sizes)), key=lambda i: (max(sizes[i]), min(sizes[i])), reverse=True)
+
+    # The smallest width and height still to come after each rect, which no free space thinner than is useful.
+    minSizes = [None] * len(order)
+    minWidth = minHeight = maxSize + padding
+    for position in range(len(order) - 1, -1, -1):
+        w, h = sizes[order[position]]
+        if allowRotation: w = h = min(w, h)
+        minWidth = min(minWidth, w + padding)
+        minHeight = min(minHeight, h + padding)
+        minSizes[position] = (minWidth, minHeight)
+
+    pages = []
+    failures = [] # Per page, the sizes that didn't fit in it.
+    placements = [None] * len(sizes)
+    for position, i in enumerate(order):
+        w, h = sizes[i]
+        if max(w, h) > maxSize:
+            raise ValueError('A %dx%d rect is larger than the %d page size' % (w, h, maxSize))
+        for page in pages:
+            page.setMinSize(*minSizes[position])
+        for pageIndex, page in enumerate(pages):
+            placed = None
+            # Pages only fill up, so a page that had no room for a smaller rect has none for this one either.
+            if not any(w >= failedW and h >= failedH for failedW, failedH in failures[pageIndex]):
+                placed = page.insert(w + padding, h + padding, allowRotation)
+            if placed is not None: break
+            addFailure(failures[pageIndex], w, h, allowRotation)
+        else:
+            pages.append(pageClass(pageSize, pageSize, heuristic))
+            failures.append([])
+            pages[-1].setMinSize(*minSizes[position])
+            pageIndex = len(pages) - 1
+            placed = pages[-1].insert(w + padding, h + padding, allowRotation)
+        placements[i] = (pageIndex, placed[0], placed[1], placed[2])
+
+    pageSizes = [(min(maxSize, nextPowerOfTwo(max(1, page.usedWidth - padding))), min(maxSize, nextPowerOfTwo(max(1, page.usedHeight - padding)))) for page in pages]
+    return pageSizes, placements
+
+# Returns the width and height each page's rects actually reach, without the padding after the last ones, from the
+# sizes and placements packRects returned.
+def getUsedSizes(sizes, placements, pageCount):
+    used = [[0, 0] for i in range(pageCount)]
+    for (w, h), (page, x, y, rotated) in zip(sizes, placements):
+        if rotated: w, h = h, w
+        used[page][0] = max(used[page][0], x + w)
+        used[page][1] = max(used[page][1], y + h)
+    return [tuple(size) for size in used]
+
+# Returns the fraction of the pages' area covered by rects. pages is a list of (width, height), either the page
+# sizes from packRects or the used sizes from getUsedSizes.
+def getOccupancy(sizes, pages):
+    area = sum(width * height for width, height in pages)
+    return sum(w * h for w, h in sizes) / float(area) if area else 0.0
+
+# Packs the pixels of rects in img into atlas pages. Page n is saved as fileName with n added before the
+# extension when there's more than one. Returns the frames dict of framesToJson with the rects in the pages,
+# plus each frame's page and whether it was rotated, and a meta entry listing the page files and sizes.
+# With a dedupe mode from dedup.MODES, slices that match an earlier one aren't packed again. Their frames
+# point at the earlier slice's pixels and are marked as aliases by dedup.addAliases.
+@instrument.timed('pack')
+def packImage(img, rects, fileName, maxSize=4096, padding=2, allowRotation=False, heuristic=None, dedupe=None):
+    if dedupe:
+        duplicates = dedup.findDuplicates(img, rects, dedupe)
+    else:
+        duplicates = [(i, 0, False) for i in range(len(rects))]
+    unique = dedup.getUnique(duplicates)
+    sizes = [(rects[i].Width, rects[i].Height) for i in unique]
+    pages, placements = packRects(sizes, maxSize, padding, allowRotation, heuristic)
+
+    source = imagebackend.getRgbaArray(img)
+    pixels = [np.zeros((height, width, 4), np.uint8) for width, height in pages]
+    packed = {}
+    for i, (page, x, y, rotated) in zip(unique, placements):
+        rect = rects[i]
+        sprite = source[rect.Y:rect.Y + rect.Height, rect.X:rect.X + rect.Width]
+        if rotated: sprite = np.rot90(sprite, -1) # Clockwise.
+        height, width = sprite.shape[:2]
+        pixels[page][y:y + height, x:x + width] = sprite
+        packed[i] = (Rect(x, y, width, height), page, rotated)
+
+    base, extension = os.path.splitext(fileName)
+    pageFiles = [fileName] if len(pages) == 1 else [base + str(i) + extension for i in range(len(pages))]
+    for pagePixels, pageFile in zip(pixels, pageFiles):
+        height, width = pagePixels.shape[:2]
+        imagebackend.RgbaImage(width, height, bytearray(pagePixels.tobytes())).SaveFile(pageFile)
+
+    out = framesToJson([packed[original][0] for original, turns, flip in duplicates])
+    for i, (original, turns, flip) in enumerate(duplicates):
+        out['frames'][str(i)]['page'] = packed[original][1]
+        out['frames'][str(i)]['rotated'] = packed[original][2]
+    dedup.addAliases(out, duplicates)
+    out['meta'] = {'pages': [{'image': os.path.basename(pageFile), 'size': {'w': width, 'h': height}}
+        for pageFile, (width, height) in zip(pageFiles, pages)]}
+    return out
+
+# Packs random sizes with every heuristic and prints the time and occupancy of each. Occupancy is given against the
+# power of two pages, which is what gets saved, and against the area the rects actually use, which is what tells
+# the heuristics apart since most of them round up to the same page sizes.
+def benchmark(count=50000, minSize=4, maxSize=64, seed=0, padding=0):
+    generator = random.Random(seed)
+    sizes = [(generator.randint(minSize, maxSize), generator.randint(minSize, maxSize)) for i in range(count)]
+    print('%d rects from %dx%d to %dx%d' % (count, minSize, minSize, maxSize, maxSize))
+    print('%-14s %-8s %6s %6s %9s %9s' % ('heuristic', 'rotation', 'pages', 'time', 'page fill', 'used fill'))
+    for heuristic in HEURISTICS:
+        if heuristic != 'skyline' and np is None: continue
+        for allowRotation in (False, True):
+            start = time.time()
+            pages, placements = packRects(sizes, padding=padding, allowRotation=allowRotation, heuristic=heuristic)
+            elapsed = time.time() - start
+            used = getUsedSizes(sizes, placements, len(pages))
+            print('%-14s %-8s %6d %5.2fs %8.1f%% %8.1f%%' % (heuristic, 'yes' if allowRotation else 'no', len(pages), elapsed,
+                getOccupancy(sizes, pages) * 100, getOccupancy(sizes, used) * 100))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the packing heuristics on random rects.')
+    parser.add_argument('-n', '--count', type=int, default=50000, help='rects to pack')
+    parser.add_argument('--min', type=int, default=4, help='smallest rect side')
+    parser.add_argument('--max', type=int, default=64, help='largest rect side')
+    parser.add_argument('--padding', type=int, default=0, help='pixels between rects')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args(argv)
+    benchmark(args.count, args.min, args.max, args.seed, args.padding)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
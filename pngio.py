@@ -0,0 +1,299 @@
+import struct
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # Rows are unfiltered one byte at a time instead.
+
+# Pure Python PNG reading and writing, used when no faster image library is installed.
+# Rows are decoded one at a time, or a batch at a time with NumPy, so a reader holds at most a batch of rows.
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+COLOR_GRAY = 0
+COLOR_RGB = 2
+COLOR_PALETTE = 3
+COLOR_GRAY_ALPHA = 4
+COLOR_RGBA = 6
+
+CHANNELS = {COLOR_GRAY: 1, COLOR_RGB: 3, COLOR_PALETTE: 1, COLOR_GRAY_ALPHA: 2, COLOR_RGBA: 4}
+
+# Image data is inflated at most this many bytes at a time, since one IDAT chunk can hold the whole image.
+INFLATE_BYTES = 256 * 1024
+# With NumPy, rows are unfiltered in batches of about this many bytes. Average and Paeth rows are unfiltered one
+# diagonal of pixels at a time across the batch, so bigger batches take fewer steps per row.
+UNFILTER_BATCH_BYTES = 8 * 1024 * 1024
+
+class PngReader():
+    def __init__(self, fileName):
+        self.file = open(fileName, 'rb')
+        if self.file.read(8) != PNG_SIGNATURE:
+            self.file.close()
+            raise ValueError('Not a PNG file: ' + fileName)
+
+        self.palette = None
+        self.transparency = None
+        self.firstDataLength = None
+
+        # Read every chunk before the image data.
+        while self.firstDataLength is None:
+            length, chunkType = struct.unpack('>I4s', self.file.read(8))
+            if chunkType == b'IDAT':
+                self.firstDataLength = length
+                break
+            data = self.file.read(length)
+            self.file.read(4) # CRC
+            if chunkType == b'IHDR':
+                self.Width, self.Height, self.bitDepth, self.colorType, _, _, interlace = struct.unpack('>IIBBBBB', data)
+                if interlace:
+                    self.file.close()
+                    raise ValueError('Interlaced PNGs are not supported: ' + fileName)
+            elif chunkType == b'PLTE':
+                self.palette = bytearray(data)
+            elif chunkType == b'tRNS':
+                self.transparency = bytearray(data)
+            elif chunkType == b'IEND':
+                self.file.close()
+                raise ValueError('PNG has no image data: ' + fileName)
+
+        self.channels = CHANNELS[self.colorType]
+        self.stride = (self.Width * self.channels * self.bitDepth + 7) // 8
+        self.pixelBytes = max(1, self.channels * self.bitDepth // 8)
+        self.hasAlpha = self.colorType in (COLOR_GRAY_ALPHA, COLOR_RGBA) or self.transparency is not None
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Yields the compressed image data, one IDAT chunk at a time.
+    def iterData(self):
+        length = self.firstDataLength
+        while True:
+            yield self.file.read(length)
+            self.file.read(4) # CRC
+            length, chunkType = struct.unpack('>I4s', self.file.read(8))
+            if chunkType != b'IDAT': return
+
+    # Yields the image data as bytearrays of up to batchLines whole lines, each a filter type byte followed by a
+    # filtered row, top to bottom.
+    def iterLines(self, batchLines):
+        decompressor = zlib.decompressobj()
+        lineLength = self.stride + 1
+        pending = bytearray()
+        y = 0
+        for data in self.iterData():
+            while True:
+                inflated = decompressor.decompress(data, INFLATE_BYTES)
+                data = decompressor.unconsumed_tail
+                pending += inflated
+                while y < self.Height:
+                    count = min(batchLines, self.Height - y)
+                    if len(pending) < count * lineLength: break
+                    yield pending[:count * lineLength]
+                    del pending[:count * lineLength]
+                    y += count
+                if y >= self.Height: return
+                if not data and len(inflated) < INFLATE_BYTES: break
+
+    # Yields each row as a bytearray of RGBA pixels, top to bottom.
+    def rows(self):
+        if np is None:
+            previous = bytearray(self.stride)
+            for line in self.iterLines(1):
+                previous = unfilter(line[0], line[1:], previous, self.pixelBytes)
+                yield self.toRgba(previous)
+            return
+
+        lineLength = self.stride + 1
+        previous = np.zeros(self.stride, np.uint8)
+        for batch in self.iterLines(max(1, UNFILTER_BATCH_BYTES // lineLength)):
+            lines = unfilterLines(np.frombuffer(batch, np.uint8).reshape(-1, lineLength), previous, self.pixelBytes)
+            for line in lines:
+                yield self.toRgba(bytearray(line.tobytes()))
+            previous = lines[-1]
+
+    # Converts one unfiltered row to RGBA.
+    def toRgba(self, line):
+        width = self.Width
+        if self.bitDepth == 16:
+            line = line[0::2] # Keep the high byte of every sample.
+        elif self.bitDepth < 8:
+            line = unpackBits(line, self.bitDepth, width)
+
+        rgba = bytearray(b'\xff') * (width * 4)
+        if self.colorType == COLOR_RGBA:
+            rgba[:] = line
+        elif self.colorType == COLOR_RGB:
+            rgba[0::4] = line[0::3]
+            rgba[1::4] = line[1::3]
+            rgba[2::4] = line[2::3]
+        elif self.colorType == COLOR_GRAY_ALPHA:
+            rgba[0::4] = rgba[1::4] = rgba[2::4] = line[0::2]
+            rgba[3::4] = line[1::2]
+        elif self.colorType == COLOR_GRAY:
+            if self.bitDepth < 8:
+                scale = 255 // ((1 << self.bitDepth) - 1)
+                line = bytearray(value * scale for value in line)
+            rgba[0::4] = rgba[1::4] = rgba[2::4] = line
+        elif self.colorType == COLOR_PALETTE:
+            tables = self.getPaletteTables()
+            for channel in range(4):
+                rgba[channel::4] = line.translate(tables[channel])
+
+        if self.transparency is not None and self.colorType in (COLOR_GRAY, COLOR_RGB):
+            self.applyColorKey(rgba)
+        return rgba
+
+    # Returns a 256 byte translation table per channel that maps palette indices to RGBA.
+    def getPaletteTables(self):
+        if not hasattr(self, 'paletteTables'):
+            palette = self.palette + bytearray(768 - len(self.palette))
+            alpha = bytearray(b'\xff') * 256
+            if self.transparency is not None:
+                alpha[:len(self.transparency)] = self.transparency
+            self.paletteTables = [bytes(palette[0::3]), bytes(palette[1::3]), bytes(palette[2::3]), bytes(alpha)]
+        return self.paletteTables
+
+    # Makes pixels matching the tRNS color key fully transparent.
+    def applyColorKey(self, rgba):
+        key = struct.unpack('>%dH' % (len(self.transparency) // 2), bytes(self.transparency))
+        if self.bitDepth == 16:
+            key = [value >> 8 for value in key]
+        elif self.bitDepth < 8:
+            key = [value * (255 // ((1 << self.bitDepth) - 1)) for value in key]
+        if len(key) == 1: key = key * 3
+        key = bytes(bytearray(key))
+        for i in range(0, len(rgba), 4):
+            if rgba[i:i + 3] == key:
+                rgba[i + 3] = 0
+
+# Reverses the PNG filter of one row in place. Returns the row.
+def unfilter(filterType, line, previous, pixelBytes):
+    length = len(line)
+    if filterType == 1: # Sub
+        for i in range(pixelBytes, length):
+            line[i] = (line[i] + line[i - pixelBytes]) & 0xff
+    elif filterType == 2: # Up
+        line[:] = bytearray((a + b) & 0xff for a, b in zip(line, previous))
+    elif filterType == 3: # Average
+        for i in range(length):
+            left = line[i - pixelBytes] if i >= pixelBytes else 0
+            line[i] = (line[i] + ((left + previous[i]) >> 1)) & 0xff
+    elif filterType == 4: # Paeth
+        for i in range(length):
+            if i >= pixelBytes:
+                a = line[i - pixelBytes]
+                c = previous[i - pixelBytes]
+            else:
+                a = c = 0
+            b = previous[i]
+            p = a + b - c
+            pa = abs(p - a)
+            pb = abs(p - b)
+            pc = abs(p - c)
+            if pa <= pb and pa <= pc: predictor = a
+            elif pb <= pc: predictor = b
+            else: predictor = c
+            line[i] = (line[i] + predictor) & 0xff
+    return line
+
+# Reverses the PNG filters of a (count, stride + 1) uint8 array of lines, where previous is the unfiltered row
+# above the first. Returns a (count, stride) uint8 array of the unfiltered rows.
+def unfilterLines(lines, previous, pixelBytes):
+    filters = lines[:, 0]
+    raw = lines[:, 1:]
+    count, stride = raw.shape
+    if filters.max() > 4:
+        raise ValueError('Unknown PNG filter type: %d' % filters.max())
+
+    # None, Sub and Up only depend on the row above as a whole, so they're unfiltered a row at a time.
+    if filters.max() <= 2:
+        out = np.empty_like(raw)
+        for i in range(count):
+            if filters[i] == 0:
+                out[i] = raw[i]
+            elif filters[i] == 1:
+                out[i] = raw[i].reshape(-1, pixelBytes).cumsum(axis=0, dtype=np.uint8).reshape(-1)
+            else:
+                out[i] = raw[i] + (out[i - 1] if i else previous)
+        return out
+
+    # Average and Paeth depend on the pixel to the left as well. Pixel x of line r, where line 0 is previous, is
+    # put in column x + r + 1 so that every pixel whose left, up and up-left neighbors are known is in the next
+    # column. Column 0 and the columns before each line start stay 0, which is what PNG uses left of the image.
+    pixels = stride // pixelBytes
+    skewedRaw = np.zeros((count + 1, pixels + count + 1, pixelBytes), np.uint8)
+    skewed = np.zeros(skewedRaw.shape, np.int16)
+    skewed[0, 1:pixels + 1] = previous.reshape(-1, pixelBytes)
+    for r in range(1, count + 1):
+        skewedRaw[r, r + 1:r + 1 + pixels] = raw[r - 1].reshape(-1, pixelBytes)
+    kinds = filters.astype(np.intp)[:, None]
+    kinds = np.r_[kinds[:1], kinds] # Indexed by line, like skewed.
+    single = filters.min() == filters.max()
+
+    for column in range(2, pixels + count + 1):
+        top = max(1, column - pixels)
+        bottom = min(count, column - 1) + 1
+        a = skewed[top:bottom, column - 1] # Left
+        b = skewed[top - 1:bottom - 1, column - 1] # Up
+        c = skewed[top - 1:bottom - 1, column - 2] # Up left
+        if single and filters[0] == 3:
+            predictor = (a + b) >> 1
+        else:
+            pa = np.abs(b - c)
+            pb = np.abs(a - c)
+            pc = np.abs(a + b - c - c)
+            predictor = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+            if not single:
+                predictor = np.choose(kinds[top:bottom], (a * 0, a, b, (a + b) >> 1, predictor))
+        skewed[top:bottom, column] = (skewedRaw[top:bottom, column] + predictor) & 0xff
+
+    out = np.empty_like(raw)
+    for r in range(1, count + 1):
+        out[r - 1] = skewed[r, r + 1:r + 1 + pixels].reshape(-1)
+    return out
+
+# Expands 1, 2 or 4 bit samples to one byte each.
+def unpackBits(line, bitDepth, count):
+    perByte = 8 // bitDepth
+    mask = (1 << bitDepth) - 1
+    out = bytearray(count)
+    for i in range(count):
+        byte = line[i // perByte]
+        shift = 8 - bitDepth * (i % perByte + 1)
+        out[i] = (byte >> shift) & mask
+    return out
+
+# Returns every row of a PNG as one RGBA bytearray, along with its size and whether it has alpha.
+def readPng(fileName):
+    with PngReader(fileName) as reader:
+        data = bytearray()
+        for row in reader.rows():
+            data += row
+        return reader.Width, reader.Height, data, reader.hasAlpha
+
+def writeChunk(file, chunkType, data):
+    file.write(struct.pack('>I', len(data)))
+    file.write(chunkType)
+    file.write(data)
+    file.write(struct.pack('>I', zlib.crc32(chunkType + data) & 0xffffffff))
+
+# Writes RGBA pixels as an 8-bit PNG. level is the zlib compression level, 0-9.
+def writePng(fileName, width, height, rgba, level=6):
+    rowLength = width * 4
+    raw = bytearray()
+    for y in range(height):
+        raw += b'\x00' # Unfiltered row.
+        raw += rgba[y * rowLength:(y + 1) * rowLength]
+
+    with open(fileName, 'wb') as file:
+        file.write(PNG_SIGNATURE)
+        writeChunk(file, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, COLOR_RGBA, 0, 0, 0))
+        writeChunk(file, b'IDAT', zlib.compress(bytes(raw), level))
+        writeChunk(file, b'IEND', b'')
@@ -0,0 +1,119 @@
+import hashlib
+import mmap
+import os
+import struct
+
+import diskcache
+import imagebackend
+
+# Decoded sheets are cached on disk as raw RGBA and memory-mapped when opened again, so reopening a sheet skips
+# PNG decoding and processes opening the same sheet share its pages. Entries are named by a hash of the sheet's
+# contents. A small ref file named by the sheet's path records the size and modification time it had and the
+# entry it points at, so an unchanged sheet is found without reading it. Only a new, moved or touched sheet is
+# hashed, which still finds its old entry if the contents are the same. Once entries add up to more than
+# maxBytes the least recently used are deleted.
+
+HEADER = struct.Struct('<4sIIB')
+MAGIC = b'SSR1'
+# Pixels start at a multiple of the mmap allocation granularity on every platform, so they can be mapped on their own.
+PIXELS_OFFSET = 65536
+MAX_BYTES = 4 * 1024 * 1024 * 1024
+
+# Returns the directory a cache of this name is kept in by default.
+def getDefaultCacheDir(name='raw'):
+    return diskcache.getDefaultCacheDir(name)
+
+# Returns a key naming a file's path, which its ref is saved under.
+def getPathKey(fileName):
+    path = os.path.abspath(fileName)
+    if not isinstance(path, bytes): path = path.encode('utf-8')
+    return hashlib.sha1(path).hexdigest()
+
+# Returns a string naming a file's size and modification time, which change whenever its contents may have.
+def getStatKey(fileName):
+    stat = os.stat(fileName)
+    return '%d:%r' % (stat.st_size, stat.st_mtime)
+
+# Returns a hash of a file's contents.
+def getContentKey(fileName):
+    digest = hashlib.sha1()
+    with open(fileName, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Returns the key of a file's entry in cacheDir, from its ref if the file hasn't changed since the ref was saved
+# and the entry is still there, or else by hashing its contents. A new ref then replaces the old one.
+def getCacheKey(fileName, cacheDir):
+    refPath = os.path.join(cacheDir, getPathKey(fileName) + '.ref')
+    statKey = getStatKey(fileName)
+    try:
+        with open(refPath, 'rb') as file:
+            refStatKey, key = file.read().decode('ascii').split(' ')
+        if refStatKey == statKey and len(key) == 40 and os.path.exists(os.path.join(cacheDir, key + '.rgba')): return key
+    except (IOError, OSError, UnicodeDecodeError, ValueError): pass
+    key = getContentKey(fileName)
+    diskcache.writeFile(refPath, [(statKey + ' ' + key).encode('ascii')])
+    return key
+
+# Returns the image as an RgbaImage whose pixels are memory-mapped from the cache, decoding and caching it first
+# if needed. An entry that can't be read as a cache file, such as one cut short by a crash, is decoded again.
+def loadImage(fileName, cacheDir=None, maxBytes=MAX_BYTES):
+    cacheDir = cacheDir or getDefaultCacheDir()
+    if not os.path.isdir(cacheDir): os.makedirs(cacheDir)
+    cachePath = os.path.join(cacheDir, getCacheKey(fileName, cacheDir) + '.rgba')
+    try:
+        img = mapCache(cachePath)
+        diskcache.touch(cachePath)
+        return img
+    except (IOError, OSError): pass # Not cached yet, or evicted by another process.
+    except ValueError:
+        diskcache.removeFile(cachePath)
+    writeCache(cachePath, imagebackend.loadImage(fileName))
+    evict(cacheDir, maxBytes, cachePath)
+    return mapCache(cachePath)
+
+# Writes an image to a cache file.
+def writeCache(cachePath, img):
+    header = HEADER.pack(MAGIC, img.Width, img.Height, 1 if img.HasAlpha() else 0)
+    diskcache.writeFile(cachePath, [header, bytearray(PIXELS_OFFSET - HEADER.size), img.data])
+
+# An RgbaImage whose pixels are mapped from a cache file. It's pickled as the file's path, so documents sent to
+# other processes map the same pages rather than copying them.
+class MappedImage(imagebackend.RgbaImage):
+    def __init__(self, cachePath, width, height, pixels, hasAlpha):
+        imagebackend.RgbaImage.__init__(self, width, height, pixels, hasAlpha)
+        self.cachePath = cachePath
+
+    def __getstate__(self):
+        return self.cachePath
+
+    def __setstate__(self, cachePath):
+        self.__dict__.update(mapCache(cachePath).__dict__)
+
+# Maps a cache file. Raises ValueError if it isn't one or is shorter than its header says.
+def mapCache(cachePath):
+    with open(cachePath, 'rb') as file:
+        header = file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError('Not a raw sheet cache file: ' + cachePath)
+        magic, width, height, hasAlpha = HEADER.unpack(header)
+        if magic != MAGIC or os.fstat(file.fileno()).st_size != PIXELS_OFFSET + width * height * 4:
+            raise ValueError('Not a raw sheet cache file: ' + cachePath)
+        pixels = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ, offset=PIXELS_OFFSET)
+    return MappedImage(cachePath, width, height, pixels, bool(hasAlpha))
+
+# Returns (last used time, size, path) for every entry in cacheDir.
+def getEntries(cacheDir):
+    return diskcache.getEntries(cacheDir, '.rgba')
+
+# Deletes the least recently used entries other than keep until the cache fits in maxBytes, then the refs
+# pointing at deleted entries.
+def evict(cacheDir, maxBytes=MAX_BYTES, keep=None):
+    diskcache.evict(cacheDir, '.rgba', maxBytes, keep)
+    for used, size, path in diskcache.getEntries(cacheDir, '.ref'):
+        try:
+            with open(path, 'rb') as file:
+                key = file.read().decode('ascii').split(' ')[-1]
+        except (IOError, OSError, UnicodeDecodeError): continue
+        if not os.path.exists(os.path.join(cacheDir, key + '.rgba')): diskcache.removeFile(path)
@@ -0,0 +1,103 @@
+import hashlib
+import imagebackend
+import spritefinder
+from model import Rect
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # Without NumPy every change is treated as a change to the whole sheet.
+
+# Sheets are compared in tiles of this many pixels a side. Regions also grow by this much at a time.
+TILE_SIZE = 64
+
+# Returns a (rows, columns) array with a digest of the RGBA pixels of every tile of an image.
+def getTileHashes(img):
+    rgba = imagebackend.getRgbaArray(img)
+    rows = (img.Height + TILE_SIZE - 1) // TILE_SIZE
+    columns = (img.Width + TILE_SIZE - 1) // TILE_SIZE
+    hashes = np.empty((rows, columns), 'S20')
+    for row in range(rows):
+        band = rgba[row * TILE_SIZE:(row + 1) * TILE_SIZE]
+        for column in range(columns):
+            tile = np.ascontiguousarray(band[:, column * TILE_SIZE:(column + 1) * TILE_SIZE])
+            hashes[row, column] = hashlib.sha1(tile.tobytes()).digest()
+    return hashes
+
+# Returns [left, top, right, bottom] pixel regions around each group of touching changed tiles.
+def findChangedRegions(oldImage, newImage):
+    changed = getTileHashes(oldImage) != getTileHashes(newImage)
+    regions = []
+    for x, y, w, h in spritefinder.findBounds(changed):
+        regions.append([x * TILE_SIZE, y * TILE_SIZE, min((x + w) * TILE_SIZE, newImage.Width), min((y + h) * TILE_SIZE, newImage.Height)])
+    return regions
+
+# Grows a region until no sprite in any of the masks crosses its edges. Returns True if it grew.
+def growRegion(region, masks):
+    height, width = masks[0].shape
+    grew = False
+    while True:
+        left, top, right, bottom = region
+        for mask in masks:
+            if left > 0 and mask[top:bottom, left].any(): region[0] = max(0, left - TILE_SIZE)
+            if top > 0 and mask[top, left:right].any(): region[1] = max(0, top - TILE_SIZE)
+            if right < width and mask[top:bottom, right - 1].any(): region[2] = min(width, right + TILE_SIZE)
+            if bottom < height and mask[bottom - 1, left:right].any(): region[3] = min(height, bottom + TILE_SIZE)
+        if region == [left, top, right, bottom]: return grew
+        grew = True
+
+def regionsOverlap(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+# Joins overlapping regions until none overlap.
+def mergeRegions(regions):
+    merged = []
+    for region in regions:
+        region = list(region)
+        i = 0
+        while i < len(merged):
+            if regionsOverlap(region, merged[i]):
+                other = merged.pop(i)
+                region = [min(region[0], other[0]), min(region[1], other[1]), max(region[2], other[2]), max(region[3], other[3])]
+                i = 0
+            else:
+                i += 1
+        merged.append(region)
+    return merged
+
+# Returns the sprite bounds found inside a region of a mask, in image coordinates.
+def findInRegion(mask, region):
+    left, top, right, bottom = region
+    return [(x + left, y + top, w, h) for x, y, w, h in spritefinder.findBounds(mask[top:bottom, left:right])]
+
+# Compares two versions of a sheet and finds the sprites in only the parts that changed. Changed tiles are grown
+# into regions that no sprite crosses, and that take in any knownRects they touch so sprites nested inside a
+# known slice fold the same way they did before. Returns (regions, oldBounds, newBounds) where regions are the
+# Rects searched and the bounds are the sprites found in them in each version. alphaThreshold and colorKey
+# choose the background as in spritefinder.find.
+def findChanges(oldImage, newImage, knownRects=(), alphaThreshold=0, colorKey=None):
+    if np is None or (oldImage.Width, oldImage.Height) != (newImage.Width, newImage.Height):
+        return ([Rect(0, 0, newImage.Width, newImage.Height)],
+            spritefinder.find(oldImage, alphaThreshold=alphaThreshold, colorKey=colorKey),
+            spritefinder.find(newImage, alphaThreshold=alphaThreshold, colorKey=colorKey))
+
+    masks = [spritefinder.getForegroundMask(image, alphaThreshold, colorKey) for image in (oldImage, newImage)]
+    knownRects = [(rect.X, rect.Y, rect.X + rect.Width, rect.Y + rect.Height) for rect in knownRects]
+    regions = findChangedRegions(oldImage, newImage)
+    changed = True
+    while changed:
+        changed = False
+        regions = mergeRegions(regions)
+        for region in regions:
+            if growRegion(region, masks): changed = True
+            for known in knownRects:
+                if regionsOverlap(region, known) and not (region[0] <= known[0] and region[1] <= known[1] and known[2] <= region[2] and known[3] <= region[3]):
+                    region[:] = [min(region[0], known[0]), min(region[1], known[1]), max(region[2], known[2]), max(region[3], known[3])]
+                    changed = True
+
+    oldBounds = []
+    newBounds = []
+    for region in regions:
+        oldBounds.extend(Rect(*bounds) for bounds in findInRegion(masks[0], region))
+        newBounds.extend(Rect(*bounds) for bounds in findInRegion(masks[1], region))
+    return [Rect(left, top, right - left, bottom - top) for left, top, right, bottom in regions], oldBounds, newBounds
@@ -0,0 +1,72 @@
+import math
+
+# Uniform grid over rects in image coordinates. Each item is stored in every cell its rect touches, so point and
+# rect queries only look at the items in nearby cells.
+class GridIndex():
+    def __init__(self, cellSize=64):
+        self.cellSize = cellSize
+        self.cells = {} # (column, row): set of items
+        self.rects = {} # item: (x, y, w, h)
+        self.order = {} # item: insertion number, so queries can return items in the order they were added.
+        self.inserted = 0
+
+    def __len__(self):
+        return len(self.rects)
+
+    def __contains__(self, item):
+        return item in self.rects
+
+    # Returns the (column, row) keys of every cell a rect touches.
+    def getCells(self, x, y, w, h):
+        size = self.cellSize
+        left = int(x // size)
+        top = int(y // size)
+        right = int(math.ceil((x + max(w, 1)) / float(size))) - 1
+        bottom = int(math.ceil((y + max(h, 1)) / float(size))) - 1
+        return [(column, row) for row in range(top, bottom + 1) for column in range(left, right + 1)]
+
+    def insert(self, item, rect):
+        if item in self.rects: self.remove(item)
+        bounds = (rect.X, rect.Y, rect.Width, rect.Height)
+        self.rects[item] = bounds
+        self.order[item] = self.inserted
+        self.inserted += 1
+        for key in self.getCells(*bounds):
+            self.cells.setdefault(key, set()).add(item)
+
+    def remove(self, item):
+        bounds = self.rects.pop(item, None)
+        if bounds is None: return
+        del self.order[item]
+        for key in self.getCells(*bounds):
+            cell = self.cells.get(key)
+            if cell is None: continue
+            cell.discard(item)
+            if not cell: del self.cells[key]
+
+    def clear(self):
+        self.cells.clear()
+        self.rects.clear()
+        self.order.clear()
+
+    # Returns the items whose rects contain the point, in insertion order.
+    def queryPoint(self, x, y):
+        size = self.cellSize
+        found = []
+        for item in self.cells.get((int(x // size), int(y // size)), ()):
+            rx, ry, rw, rh = self.rects[item]
+            if rx <= x < rx + rw and ry <= y < ry + rh:
+                found.append(item)
+        found.sort(key=self.order.get)
+        return found
+
+    # Returns the items whose rects intersect the rect, in insertion order.
+    def queryRect(self, x, y, w, h):
+        found = set()
+        for key in self.getCells(x, y, w, h):
+            for item in self.cells.get(key, ()):
+                if item in found: continue
+                rx, ry, rw, rh = self.rects[item]
+                if rx < x + w and x < rx + rw and ry < y + h and y < ry + rh:
+                    found.add(item)
+        return sorted(found, key=self.order.get)
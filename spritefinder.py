@@ -1,184 +1,679 @@
-import wx
+import hashlib
 from threading import Thread
-
-class Pixel():
-    def __init__(self, img, x, y):
-        self.x = x
-        self.y = y
-
-        # Is this pixel inside the image?
-        if self.x >= 0 and self.y >= 0 and self.x < img.Width and self.y < img.Height:
-            self.invisible = (img.GetAlpha(x, y) <= 0)
-            self.outOfBounds = False
-        else:
-            self.invisible = None
-            self.outOfBounds = True
-
-        self.img = img
-
-    # Returns neighbors from the 4 cardinal compass directions.
-    def getCardinalNeighbors(self):
-        return [
-            Pixel(self.img, self.x+1, self.y),
-            Pixel(self.img, self.x-1, self.y),
-            Pixel(self.img, self.x, self.y+1),
-            Pixel(self.img, self.x, self.y-1),
-        ]
-
-    # Returns neighbors from the corner directions.
-    def getCornerNeighbors(self):
-        return [
-            Pixel(self.img, self.x+1, self.y-1),
-            Pixel(self.img, self.x+1, self.y+1),
-            Pixel(self.img, self.x-1, self.y+1),
-            Pixel(self.img, self.x-1, self.y-1),
-        ]
-
-# Finds a sprite bounding box from a pixel. Returns wx.Rect
-def findFromPixel(img, x, y):
-    start = Pixel(img, x, y)
-
-    left = start.x
-    top = start.y
-    right = start.x+1
-    bottom = start.y+1
-
-    unvisited = []
-    visited = set() # Used for quick lookups.
-
-    unvisited.extend(start.getCardinalNeighbors())
-    unvisited.extend(start.getCornerNeighbors())
-
-    lastPixel = None # Last visited pixel
-
-    while unvisited:
-        pixel = unvisited.pop()
-        x = pixel.x
-        y = pixel.y
-
-        if (pixel.outOfBounds) or (pixel.invisible) or ((x, y) in visited):
+from multiprocessing import cpu_count
+from collections import OrderedDict
+import instrument
+from model import Rect
+from imagebackend import RgbaImage, getRgbaArray, toRgbaImage
+from pngio import PngReader
+
+try:
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+except ImportError:
+    ProcessPoolExecutor = None # Python 2 without the futures backport searches on a single thread.
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None # Before Python 3.8 bands are pickled to the workers instead.
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # Without NumPy the per-pixel finder is used.
+
+# Maps alpha values to 1 for visible pixels and 0 for fully transparent ones.
+FOREGROUND_TABLE = bytes(bytearray([0] + [1] * 255))
+
+# Returns a table mapping alpha values to 1 when they're above alphaThreshold and 0 otherwise.
+def getForegroundTable(alphaThreshold=0):
+    if alphaThreshold == 0: return FOREGROUND_TABLE
+    return bytes(bytearray([0] * (alphaThreshold + 1) + [1] * (255 - alphaThreshold)))
+
+# Returns a copy of an image's alpha channel as a bytearray, one byte per pixel.
+def getAlphaBytes(img):
+    if hasattr(img, 'GetAlphaBuffer'):
+        return bytearray(img.GetAlphaBuffer()) # RgbaImage and wxPython Phoenix
+    return bytearray(img.GetAlphaData()) # wxPython Classic
+
+# Returns a bytearray with one byte per pixel, 1 where the pixel's alpha is above alphaThreshold and 0 elsewhere.
+# With a colorkey.ColorKey, pixels of the key color are 0 too.
+def getForegroundBytes(img, alphaThreshold=0, colorKey=None):
+    if colorKey is not None:
+        return colorKey.getBytes(img, alphaThreshold)
+    if not img.HasAlpha():
+        return bytearray(img.Width * img.Height)
+    return getAlphaBytes(img).translate(getForegroundTable(alphaThreshold))
+
+# Scanline flood fill over a foreground buffer from getForegroundBytes. Visited pixels are set to 0 in the buffer,
+# so it doubles as the visited bitmap. Connectivity is 4 or 8. Returns the (x, y, w, h) bounds of the filled pixels.
+def fillSpans(pending, width, height, x, y, connectivity=8):
+    reach = 1 if connectivity == 8 else 0
+    left = right = x
+    top = bottom = y
+
+    seeds = [(x, y)]
+    while seeds:
+        sx, sy = seeds.pop()
+        row = sy * width
+        if not pending[row + sx]: continue
+
+        # Grow the seed into the full horizontal span of pending pixels.
+        x0 = pending.rfind(b'\x00', row, row + sx) + 1
+        if x0 == 0: x0 = row
+        x1 = pending.find(b'\x00', row + sx, row + width)
+        if x1 == -1: x1 = row + width
+        pending[x0:x1] = bytearray(x1 - x0)
+        x0 -= row
+        x1 -= row
+
+        if x0 < left: left = x0
+        if x1 - 1 > right: right = x1 - 1
+        if sy < top: top = sy
+        if sy > bottom: bottom = sy
+
+        # Seed every pending span on the rows above and below that touches this one.
+        scanStart = max(x0 - reach, 0)
+        scanEnd = min(x1 + reach, width)
+        for ny in (sy - 1, sy + 1):
+            if ny < 0 or ny >= height: continue
+            nrow = ny * width
+            pos = nrow + scanStart
+            end = nrow + scanEnd
+            while pos < end:
+                pos = pending.find(b'\x01', pos, end)
+                if pos == -1: break
+                seeds.append((pos - nrow, ny))
+                pos = pending.find(b'\x00', pos, end)
+                if pos == -1: break
+
+    return (left, top, right - left + 1, bottom - top + 1)
+
+# Finds a sprite bounding box from a pixel, with the background chosen as in find. Connectivity is 4 or 8.
+# To search one image from many pixels, build foreground once with getForegroundBytes and pass it in; it's copied
+# rather than consumed. Returns Rect, or None if the pixel is background.
+def findFromPixel(img, x, y, connectivity=8, alphaThreshold=0, colorKey=None, foreground=None):
+    if foreground is None:
+        pending = getForegroundBytes(img, alphaThreshold, colorKey)
+    elif foreground[y * img.Width + x]:
+        pending = bytearray(foreground)
+    else:
+        return None
+    if not pending[y * img.Width + x]: return None
+    return Rect(*fillSpans(pending, img.Width, img.Height, x, y, connectivity))
+
+# Marks an (x, y, w, h) section of a byte-per-pixel buffer one row slice at a time.
+# Returns False without marking anything if the section was already fully marked.
+def claimSection(claimed, width, bounds):
+    x, y, w, h = bounds
+    rows = range(y * width + x, (y + h) * width + x, width)
+    if all(claimed.find(b'\x00', row, row + w) == -1 for row in rows):
+        return False
+    filled = b'\x01' * w
+    for row in rows:
+        claimed[row:row + w] = filled
+    return True
+
+# Yields (index, bounds) for each sprite in a foreground buffer from getForegroundBytes, where index is the pixel
+# the sprite was found from. Sprites whose bounds are already covered by earlier bounds are skipped.
+# With a chunk size, (index, None) is also yielded after every chunk pixels searched without finding a sprite, so
+# callers get control back regularly over large transparent areas. The buffer is consumed by the search.
+def scanForeground(pending, width, height, connectivity=8, chunk=None):
+    claimed = bytearray(width * height)
+    size = width * height
+    index = 0
+    while index < size:
+        end = min(index + chunk, size) if chunk else size
+        found = pending.find(b'\x01', index, end)
+        if found == -1:
+            index = end
+            if chunk and index < size: yield index, None
             continue
-
-        visited.add((x, y))
-
-        if   x > right:  right  = x
-        elif x < left:   left   = x
-        if   y > bottom: bottom = y
-        elif y < top:    top    = y
-
-        # Figures out if we should use cardinal or corner directions.
-        neighbors = pixel.getCardinalNeighbors()
-        if all(p.invisible or p.outOfBounds or ((p.x, p.y) in visited) for p in neighbors):
-            # All cardinal neighbor pixels are fully transparent, non-existent, or have been visited. So attempt to use corners.
-            corners = pixel.getCornerNeighbors()
-            if lastPixel is not None and all(p.invisible or p.outOfBounds for p in corners):
-                # All corners are also fully transparent or don't exist. Go back to the last pixel and use its corners.
-                # TODO: This should probably also get the last pixel's cardinal neighbors?
-                unvisited.extend(lastPixel.getCornerNeighbors())
+        index = found
+        bounds = fillSpans(pending, width, height, index % width, index // width, connectivity)
+        if claimSection(claimed, width, bounds):
+            yield index, bounds
+
+# Finds the bounding boxes of sprites in an image with flood fills. Returns list of Rect
+def findPerPixel(img, connectivity=8, alphaThreshold=0, colorKey=None):
+    pending = getForegroundBytes(img, alphaThreshold, colorKey)
+    return [Rect(*bounds) for index, bounds in scanForeground(pending, img.Width, img.Height, connectivity)]
+
+# Yields the (start, end) of each run of set bytes in a foreground row. Ends are exclusive.
+def iterRowRuns(row):
+    start = row.find(b'\x01')
+    while start != -1:
+        end = row.find(b'\x00', start)
+        if end == -1: end = len(row)
+        yield start, end
+        start = row.find(b'\x01', end)
+
+# Yields the (x, y, w, h) bounds of the sprites in an image given one alpha row at a time, top to bottom.
+# Runs are labeled against the row above and a component closes on the first row without any of its runs,
+# so only one row of runs and the bounds of unfinished sprites are kept. Bounds come out in the same order
+# and with the same nested sprites dropped as findBounds, which means a sprite is held back until every
+# sprite starting before it has closed too.
+def scanRows(rows, width, connectivity=8):
+    reach = 1 if connectivity == 8 else 0
+    components = {} # label: [left, top, right, bottom, closed]
+    started = OrderedDict() # Unreported labels, in order of their first pixel.
+    claimed = [] # Rows of the claimed buffer the nested sprite fold uses, starting at row claimedTop.
+    claimedTop = 0
+    previous = [] # [start, end, label] of the runs on the row above.
+    nextLabel = 0
+    y = -1
+
+    for y, row in enumerate(rows):
+        row = bytearray(row).translate(FOREGROUND_TABLE)
+        parents = {} # Labels merged on this row: label: label it was merged into.
+
+        def getRoot(label):
+            while label in parents: label = parents[label]
+            return label
+
+        current = []
+        i = 0
+        for start, end in iterRowRuns(row):
+            while i < len(previous) and previous[i][1] + reach <= start: i += 1
+            label = None
+            j = i
+            while j < len(previous) and previous[j][0] < end + reach:
+                other = getRoot(previous[j][2])
+                if label is None:
+                    label = other
+                elif other != label:
+                    # Two components meet. Keep the one that started first.
+                    low, high = min(label, other), max(label, other)
+                    parents[high] = low
+                    merged = components.pop(high)
+                    del started[high]
+                    bounds = components[low]
+                    bounds[0] = min(bounds[0], merged[0])
+                    bounds[1] = min(bounds[1], merged[1])
+                    bounds[2] = max(bounds[2], merged[2])
+                    label = low
+                j += 1
+
+            if label is None:
+                label = nextLabel
+                nextLabel += 1
+                components[label] = [start, y, end, y, False]
+                started[label] = None
             else:
-                unvisited.extend(corners)
+                bounds = components[label]
+                if start < bounds[0]: bounds[0] = start
+                if end > bounds[2]: bounds[2] = end
+                bounds[3] = y
+            current.append([start, end, label])
+
+        for run in current: run[2] = getRoot(run[2])
+        openLabels = set(run[2] for run in current)
+        for run in previous:
+            label = getRoot(run[2])
+            if label not in openLabels: components[label][4] = True
+        previous = current
+
+        claimed.append(bytearray(width))
+        for bounds in reportClosed(components, started, claimed, claimedTop):
+            yield bounds
+
+        # Drop claimed rows above the first unreported sprite; nothing reported later can reach them.
+        firstTop = components[next(iter(started))][1] if started else y + 1
+        if firstTop > claimedTop:
+            del claimed[:firstTop - claimedTop]
+            claimedTop = firstTop
+
+    for bounds in components.values(): bounds[4] = True
+    for bounds in reportClosed(components, started, claimed, claimedTop):
+        yield bounds
+
+# Yields the bounds of closed components from the front of started, stopping at the first one still open.
+# Components covered by already claimed bounds are dropped, as in foldNestedBounds.
+def reportClosed(components, started, claimed, claimedTop):
+    while started:
+        label = next(iter(started))
+        left, top, right, bottom, closed = components[label]
+        if not closed: return
+        del started[label]
+        del components[label]
+
+        rows = claimed[top - claimedTop:bottom + 1 - claimedTop]
+        if all(row.find(b'\x00', left, right) == -1 for row in rows): continue
+        filled = b'\x01' * (right - left)
+        for row in rows:
+            row[left:right] = filled
+        yield (left, top, right - left, bottom - top + 1)
+
+# Finds the sprites in a PNG file while it's being decoded, without holding the whole image in memory.
+# Yields each sprite's Rect as soon as it's known, in the same order as find.
+def findStreaming(fileName, connectivity=8, alphaThreshold=0, colorKey=None):
+    with PngReader(fileName) as reader:
+        if colorKey is not None:
+            rows = colorKey.iterRowBytes(reader.rows(), reader.Width, alphaThreshold)
+        elif reader.hasAlpha:
+            table = getForegroundTable(alphaThreshold)
+            rows = (row[3::4].translate(table) for row in reader.rows())
+        else:
+            return
+        for bounds in scanRows(rows, reader.Width, connectivity):
+            yield Rect(*bounds)
+
+# Returns the alpha channel of an image as a (height, width) uint8 array. Images without alpha are fully transparent.
+def getAlphaArray(img):
+    if not img.HasAlpha():
+        return np.zeros((img.Height, img.Width), np.uint8)
+    if isinstance(img, RgbaImage):
+        return getRgbaArray(img)[:, :, 3] # A view, so memory-mapped sheets aren't copied.
+    if hasattr(img, 'GetAlphaBuffer'):
+        data = img.GetAlphaBuffer() # RgbaImage and wxPython Phoenix
+    else:
+        data = img.GetAlphaData() # wxPython Classic
+    return np.frombuffer(data, np.uint8, img.Width * img.Height).reshape(img.Height, img.Width)
+
+# Returns a (height, width) boolean array of the pixels whose alpha is above alphaThreshold and, with a
+# colorkey.ColorKey, whose color isn't the key color.
+def getForegroundMask(img, alphaThreshold=0, colorKey=None):
+    if colorKey is not None: return colorKey.getMask(img, alphaThreshold)
+    return getAlphaArray(img) > alphaThreshold
+
+# Returns the key detection results for an image are cached under: a hash of its size, its alpha channel (all of
+# its pixels with a color key) and the parameters used to find its sprites.
+def getDetectionKey(img, connectivity=8, alphaThreshold=0, colorKey=None):
+    digest = hashlib.sha1(('%d %d %d %d' % (img.Width, img.Height, connectivity, alphaThreshold)).encode('ascii'))
+    if colorKey is not None:
+        digest.update(colorKey.getKey().encode('ascii'))
+        if np is not None:
+            digest.update(np.ascontiguousarray(getRgbaArray(img)).tobytes())
+        else:
+            digest.update(bytes(toRgbaImage(img).data))
+    elif img.HasAlpha():
+        if np is not None:
+            digest.update(np.ascontiguousarray(getAlphaArray(img)).tobytes())
         else:
-            unvisited.extend(neighbors)
-
-        lastPixel = pixel
-
-    offset = 1 # All selections seem to be off by 1 pixel for the right and bottom.
-    return wx.Rect(left, top, right-left + offset, bottom-top + offset)
-
-# Sets alpha to 0 on all pixels in a selection.
-def clearImageSection(img, rect):
-    for y in range(rect.Y, rect.Y+rect.Height):
-        for x in range(rect.X, rect.X+rect.Width):
-            img.SetAlpha(x, y, 0)
-
-# Finds the bounding boxes of sprites in an image. Returns list of wx.Rect
-def find(img):
-    img = img.Copy()
-    spriteBounds = []
-    for y in range(img.Height):
-        for x in range(img.Width):
-            hasAlpha = (img.GetAlpha(x, y) > 0)
-            if hasAlpha:
-                bounding = findFromPixel(img, x, y)
-                spriteBounds.append(bounding)
-                clearImageSection(img, bounding)
-    return spriteBounds
-
-onSpritesFoundEvent, EVT_SPRITES_FOUND = wx.lib.newevent.NewEvent()
-onSpriteFinderUpdateEvent, EVT_SPRITE_FINDER_UPDATE= wx.lib.newevent.NewEvent()
-onSpriteFinderAbortEvent, EVT_SPRITE_FINDER_ABORT = wx.lib.newevent.NewEvent()
-
-class SpriteFinderThread(Thread):
-    def __init__(self, window, img):
-        Thread.__init__(self)
-        self.cwImage = img
-        self.window = window
-        self.abortStatus = False
-
-    def run(self):
-        img = self.cwImage.Copy()
-        spriteBounds = []
-        imgPixels = float(img.Width * img.Height)
-        for y in range(img.Height):
-            for x in range(img.Width):
-                hasAlpha = (img.GetAlpha(x, y) > 0)
-                if hasAlpha:
-                    if self.abortStatus == True:
-                        wx.PostEvent(self.window, onSpriteFinderAbortEvent())
-                        return
-
-                    bounding = findFromPixel(img, x, y)
-                    spriteBounds.append(bounding)
-                    clearImageSection(img, bounding)
-
-                    ratio = (x + (y * img.Width)) / imgPixels
-                    wx.PostEvent(self.window, onSpriteFinderUpdateEvent(ratio=ratio))
-
-        wx.PostEvent(self.window, onSpritesFoundEvent(spriteBounds=spriteBounds))
-
-    def abort(self): self.abortStatus = True
-
-class FinderModal(wx.Dialog):
-    def __init__(self, parent, doc):
-        wx.Dialog.__init__(self, parent=parent, title='Find Sprites', size=(320, 100))
-        self.doc = doc
-        self.img = doc.cwImage
-
-        panel = wx.Panel(self, style=wx.RAISED_BORDER)
-        self.infoText = wx.StaticText(panel, label='Finding sprites...')
-        self.progressBar = wx.Gauge(panel)
-
-        cancelButton = wx.Button(self, label='Cancel')
-        cancelButton.Bind(wx.EVT_BUTTON, self.onCancelButton)
-
-        self.Bind(wx.EVT_CLOSE, self.onCancelButton)
-        self.Bind(EVT_SPRITES_FOUND, self.onSpritesFound)
-        self.Bind(EVT_SPRITE_FINDER_UPDATE, self.onSpriteFinderUpdate)
-        self.Bind(EVT_SPRITE_FINDER_ABORT, self.onSpriteFinderAbort)
-
-        panelSizer = wx.BoxSizer(wx.VERTICAL)
-        panelSizer.Add(self.infoText)
-        panelSizer.Add(self.progressBar, 0, wx.EXPAND)
-        panel.SetSizer(panelSizer)
-
-        sizer = wx.BoxSizer(wx.VERTICAL)
-        sizer.Add(panel, 1, wx.EXPAND)
-        sizer.Add(cancelButton)
-        self.SetSizer(sizer)
-
-        self.finderThread = SpriteFinderThread(self, self.img)
-        self.finderThread.start()
-
-    def onCancelButton(self, e):
-        self.infoText.SetLabel('Aborting...')
-        self.finderThread.abort()
-
-    def onSpritesFound(self, e):
-        self.doc.addSlicesFromSpriteBounds(e.spriteBounds)
-        self.Destroy()
-
-    def onSpriteFinderAbort(self, e):
-        self.Destroy()
-
-    def onSpriteFinderUpdate(self, e):
-        self.progressBar.SetValue(e.ratio * 100)
+            digest.update(bytes(getAlphaBytes(img)))
+    return digest.hexdigest()
+
+# Returns the (x, y, w, h) of the visible pixels inside a rect of a (height, width) alpha array, or the rect
+# itself if none are visible. Only the rect's pixels are read.
+def trimBounds(alpha, x, y, w, h, alphaThreshold=0):
+    region = alpha[y:y + h, x:x + w] > alphaThreshold
+    rows = np.flatnonzero(region.any(axis=1))
+    if len(rows) == 0: return (x, y, w, h)
+    columns = np.flatnonzero(region[rows[0]:rows[-1] + 1].any(axis=0))
+    return (x + int(columns[0]), y + int(rows[0]), int(columns[-1] - columns[0]) + 1, int(rows[-1] - rows[0]) + 1)
+
+# Same as trimBounds, over a foreground buffer from getForegroundBytes.
+def trimBoundsInBytes(pending, width, x, y, w, h):
+    top = None
+    left = w
+    right = -1
+    for row in range(y, y + h):
+        start = row * width + x
+        first = pending.find(b'\x01', start, start + w)
+        if first == -1: continue
+        if top is None: top = row
+        bottom = row
+        left = min(left, first - start)
+        right = max(right, pending.rfind(b'\x01', start, start + w) - start)
+    if top is None: return (x, y, w, h)
+    return (x + left, top, right - left + 1, bottom - top + 1)
+
+# Clips rects to the image and trims each to the visible pixels inside it. Rects without visible pixels are
+# only clipped. The alpha channel, or the foreground mask with a color key, is fetched once for all of them.
+# Returns list of Rect
+def trimRects(img, rects, alphaThreshold=0, colorKey=None):
+    if np is not None and colorKey is not None:
+        mask = getForegroundMask(img, alphaThreshold, colorKey)
+        trim = lambda x, y, w, h: trimBounds(mask, x, y, w, h)
+    elif np is not None:
+        alpha = getAlphaArray(img)
+        trim = lambda x, y, w, h: trimBounds(alpha, x, y, w, h, alphaThreshold)
+    else:
+        pending = getForegroundBytes(img, alphaThreshold, colorKey)
+        trim = lambda x, y, w, h: trimBoundsInBytes(pending, img.Width, x, y, w, h)
+
+    trimmed = []
+    for rect in rects:
+        x = max(0, int(rect.X))
+        y = max(0, int(rect.Y))
+        right = min(img.Width, int(rect.X + rect.Width))
+        bottom = min(img.Height, int(rect.Y + rect.Height))
+        if right <= x or bottom <= y:
+            trimmed.append(Rect(x, y, max(0, right - x), max(0, bottom - y)))
+        else:
+            trimmed.append(Rect(*trim(x, y, right - x, bottom - y)))
+    return trimmed
+
+# Returns the horizontal runs of set pixels in a 2D boolean mask as (rows, starts, ends) arrays in raster order.
+# Ends are exclusive.
+def findRuns(mask):
+    height, width = mask.shape
+    padded = np.zeros((height, width + 2), np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1]
+    return rows, starts, ends
+
+# Returns index pairs (a, b) of runs that touch a run on the row above. Runs must be in raster order.
+def linkRuns(rows, starts, ends, width, connectivity=8):
+    # Keys that sort runs by row then column, with rows spaced far enough apart to never overlap.
+    stride = width + 1
+    startKeys = rows.astype(np.int64) * stride + starts
+    endKeys = rows.astype(np.int64) * stride + ends
+    above = (rows.astype(np.int64) - 1) * stride
+
+    # Runs above always touch when they overlap. With 8-connectivity they also touch when only their corners meet.
+    if connectivity == 8:
+        lo = np.searchsorted(endKeys, above + starts, 'left')
+        hi = np.searchsorted(startKeys, above + ends, 'right')
+    else:
+        lo = np.searchsorted(endKeys, above + starts, 'right')
+        hi = np.searchsorted(startKeys, above + ends, 'left')
+
+    counts = np.maximum(hi - lo, 0)
+    total = int(counts.sum())
+    a = np.repeat(np.arange(len(rows)), counts)
+    b = np.arange(total) + np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    return a, b
+
+# Union-find over linked pairs. Returns each item's label, which is the lowest index in its component.
+def resolveLabels(count, a, b):
+    labels = np.arange(count)
+    while True:
+        la = labels[a]
+        lb = labels[b]
+        if (la == lb).all(): break
+        low = np.minimum(la, lb)
+        # Hook both roots onto the lower one, then flatten the trees.
+        np.minimum.at(labels, la, low)
+        np.minimum.at(labels, lb, low)
+        while True:
+            parents = labels[labels]
+            if (parents == labels).all(): break
+            labels = parents
+    return labels
+
+# Returns the bounds of each labeled component as (x, y, w, h) arrays, ordered by each component's first pixel.
+def boundsFromRuns(rows, starts, ends, labels):
+    order = np.argsort(labels, kind='stable')
+    sortedLabels = labels[order]
+    firsts = np.flatnonzero(np.r_[True, sortedLabels[1:] != sortedLabels[:-1]])
+    left = np.minimum.reduceat(starts[order], firsts)
+    right = np.maximum.reduceat(ends[order], firsts)
+    top = rows[order][firsts] # The first run in a component is its top.
+    bottom = np.maximum.reduceat(rows[order], firsts) + 1
+    return left, top, right - left, bottom - top
+
+# Drops bounds that lie entirely within earlier bounds. The per-pixel finder clears each found rect,
+# so sprites nested inside another sprite's bounds are never reported.
+def foldNestedBounds(x, y, w, h, width, height):
+    keep = np.ones(len(x), bool)
+    if len(x) < 2: return keep
+
+    # Only bounds that share a grid cell with other bounds can be covered. Count bounds per cell to find them.
+    cell = 8
+    gridWidth = (width + cell - 1) // cell
+    gridHeight = (height + cell - 1) // cell
+    x0 = x // cell
+    y0 = y // cell
+    x1 = (x + w - 1) // cell + 1
+    y1 = (y + h - 1) // cell + 1
+    counts = np.zeros((gridHeight + 1, gridWidth + 1), np.int32)
+    np.add.at(counts, (y0, x0), 1)
+    np.add.at(counts, (y0, x1), -1)
+    np.add.at(counts, (y1, x0), -1)
+    np.add.at(counts, (y1, x1), 1)
+    shared = (counts.cumsum(0).cumsum(1) > 1)
+    summed = np.zeros((gridHeight + 2, gridWidth + 2), np.int64)
+    summed[1:, 1:] = shared.cumsum(0).cumsum(1)
+    sharedCells = summed[y1, x1] - summed[y0, x1] - summed[y1, x0] + summed[y0, x0]
+
+    candidates = np.flatnonzero(sharedCells > 0)
+    if len(candidates) == 0: return keep
+
+    claimed = np.zeros((height, width), bool)
+    for i in candidates:
+        region = claimed[y[i]:y[i] + h[i], x[i]:x[i] + w[i]]
+        if region.all():
+            keep[i] = False
+        else:
+            region[...] = True
+    return keep
+
+# Finds the bounds of the 8-connected sprites in a 2D boolean mask. Returns list of (x, y, w, h) tuples.
+def findBounds(mask, connectivity=8):
+    height, width = mask.shape
+    rows, starts, ends = findRuns(mask)
+    if len(rows) == 0: return []
+    a, b = linkRuns(rows, starts, ends, width, connectivity)
+    labels = resolveLabels(len(rows), a, b)
+    x, y, w, h = boundsFromRuns(rows, starts, ends, labels)
+    keep = foldNestedBounds(x, y, w, h, width, height)
+    return boundsToList(x, y, w, h, keep)
+
+# Converts bounds arrays to a list of (x, y, w, h) tuples, keeping only those marked in keep.
+def boundsToList(x, y, w, h, keep):
+    return list(zip(x[keep].tolist(), y[keep].tolist(), w[keep].tolist(), h[keep].tolist()))
+
+# Images with at least this many pixels are split into bands and searched across processes.
+TILED_MIN_PIXELS = 2048 * 2048
+# Bands are never shorter than this many rows.
+TILED_MIN_BAND_HEIGHT = 64
+
+# Returns the (top, bottom) rows of each horizontal band.
+def splitBands(height, count):
+    count = max(1, min(count, height // TILED_MIN_BAND_HEIGHT))
+    edges = [height * i // count for i in range(count + 1)]
+    return [(edges[i], edges[i + 1]) for i in range(count)]
+
+# Returns True if an image of this many pixels should be searched with findBoundsTiled.
+def shouldTile(pixels, workers):
+    return workers > 1 and ProcessPoolExecutor is not None and pixels >= TILED_MIN_PIXELS
+
+# Process pool worker. Labels the runs of one band of a mask held in shared memory, or of the band itself
+# when shared memory isn't available. Returns (rows, starts, ends, labels) with band-local labels.
+def labelBand(source, width, height, top, bottom, connectivity):
+    if isinstance(source, str):
+        try:
+            shm = shared_memory.SharedMemory(name=source, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=source) # Python < 3.13
+        band = np.ndarray((height, width), np.uint8, shm.buf)[top:bottom]
+        rows, starts, ends = findRuns(band)
+        del band # The view must be released before the shared memory can close.
+        shm.close()
+    else:
+        rows, starts, ends = findRuns(source)
+
+    a, b = linkRuns(rows, starts, ends, width, connectivity)
+    labels = resolveLabels(len(rows), a, b)
+    return rows + top, starts, ends, labels
+
+# Yields (top, bottom, labeled) for each (top, bottom) band of a mask, top to bottom, where labeled is labelBand's
+# result for the band. Bands are labeled in a pool of workers processes, or on this thread with one worker.
+# Closing the generator early cancels the bands that haven't started.
+def labelBands(mask, bands, workers=1, connectivity=8):
+    height, width = mask.shape
+    if workers <= 1 or ProcessPoolExecutor is None:
+        for top, bottom in bands:
+            yield top, bottom, labelBand(mask[top:bottom], width, height, top, bottom, connectivity)
+        return
+
+    shm = None
+    if shared_memory is not None:
+        shm = shared_memory.SharedMemory(create=True, size=max(1, width * height))
+        np.ndarray((height, width), np.uint8, shm.buf)[...] = mask
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for top, bottom in bands:
+                source = shm.name if shm is not None else np.ascontiguousarray(mask[top:bottom], np.uint8)
+                futures.append(executor.submit(labelBand, source, width, height, top, bottom, connectivity))
+            try:
+                for (top, bottom), future in zip(bands, futures):
+                    yield top, bottom, future.result()
+            finally:
+                for future in futures: future.cancel()
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+# Same as findBounds, but labels horizontal bands of the mask in a pool of worker processes and merges the
+# components that cross band seams. progress is called with the completed ratio after each band; if it returns
+# False the search is cancelled and None is returned.
+def findBoundsTiled(mask, workers=None, connectivity=8, progress=None):
+    height, width = mask.shape
+    workers = workers or cpu_count()
+    bands = splitBands(height, workers * 2)
+
+    results = []
+    labeled = labelBands(mask, bands, workers, connectivity)
+    try:
+        for top, bottom, result in labeled:
+            results.append(result)
+            if progress is not None and progress(len(results) / float(len(bands))) == False:
+                return None
+    finally:
+        labeled.close()
+
+    # Offset band-local labels so they index the concatenated runs.
+    offset = 0
+    for i, (rows, starts, ends, labels) in enumerate(results):
+        results[i] = (rows, starts, ends, labels + offset)
+        offset += len(rows)
+    rows, starts, ends, labels = [np.concatenate(parts) for parts in zip(*results)]
+    if len(rows) == 0: return []
+
+    # Link runs on either side of each seam, then merge them with the band labels.
+    a = [np.arange(len(rows))]
+    b = [labels]
+    for top, bottom in bands[1:]:
+        seam = np.flatnonzero((rows == top - 1) | (rows == top))
+        if len(seam) == 0: continue
+        seamA, seamB = linkRuns(rows[seam], starts[seam], ends[seam], width, connectivity)
+        a.append(seam[seamA])
+        b.append(seam[seamB])
+    labels = resolveLabels(len(rows), np.concatenate(a), np.concatenate(b))
+
+    x, y, w, h = boundsFromRuns(rows, starts, ends, labels)
+    keep = foldNestedBounds(x, y, w, h, width, height)
+    return boundsToList(x, y, w, h, keep)
+
+# Bands searched by findBoundsInBands hold about this many pixels, so each takes a few milliseconds.
+STREAM_BAND_PIXELS = 1024 * 1024
+
+# Joins bands labeled by labelBand, added top to bottom, into sprite bounds. add returns the bounds completed
+# by a band: those of every sprite that starts before the first sprite still open on the band's last row, in
+# the same order and with the same nested sprites dropped as findBounds. Between bands only the runs on the
+# last row and the bounds of unreported sprites are kept.
+class BandMerger():
+    def __init__(self, width, height, connectivity=8):
+        self.width = width
+        self.connectivity = connectivity
+        # Unreported components in order of their first pixel: left, top, exclusive right and bottom, and the
+        # raster index of the first pixel.
+        self.components = [np.zeros(0, np.int64)] * 5
+        # Runs on the last row added, and the index of the component each belongs to.
+        self.lastStarts = self.lastEnds = self.lastComponents = np.zeros(0, np.int64)
+        self.claimed = np.zeros((height, width), bool) # For dropping nested sprites, as in foldNestedBounds.
+
+    # Adds the band from row bandTop to bandBottom. Returns list of (x, y, w, h) tuples.
+    def add(self, bandTop, bandBottom, rows, starts, ends, labels):
+        count = len(self.components[0])
+        if count + len(rows) == 0: return []
+        rows = rows.astype(np.int64)
+        starts = starts.astype(np.int64)
+        ends = ends.astype(np.int64)
+
+        # Link the runs on the band's first row to those on the row above. Components are nodes 0 to count and
+        # the band's runs follow, so merged components keep the lowest index.
+        a = b = np.zeros(0, np.int64)
+        head = int(np.searchsorted(rows, bandTop, 'right'))
+        last = len(self.lastStarts)
+        if last and head:
+            seamRows = np.r_[np.full(last, bandTop - 1, np.int64), rows[:head]]
+            seamA, seamB = linkRuns(seamRows, np.r_[self.lastStarts, starts[:head]], np.r_[self.lastEnds, ends[:head]], self.width, self.connectivity)
+            a = count + labels[seamA - last]
+            b = self.lastComponents[seamB]
+        nodes = resolveLabels(count + len(rows), a, b)
+
+        # Bound each merged component over the components and runs in it.
+        runNodes = nodes[count + labels]
+        items = np.r_[nodes[:count], runNodes]
+        order = np.argsort(items, kind='stable')
+        firsts = np.flatnonzero(np.r_[True, items[order][1:] != items[order][:-1]])
+        groups = items[order][firsts]
+        parts = [(np.minimum, starts), (np.minimum, rows), (np.maximum, ends), (np.maximum, rows + 1), (np.minimum, rows * self.width + starts)]
+        merged = [ufunc.reduceat(np.r_[old, new][order], firsts) for old, (ufunc, new) in zip(self.components, parts)]
+
+        # Components with a run on the band's last row may still grow, unless it's the mask's last row. Every
+        # component before the first of them in order of first pixels is complete, since later bands only start
+        # components after it.
+        byFirst = np.argsort(merged[4], kind='stable')
+        rank = np.empty(len(byFirst), np.int64)
+        rank[byFirst] = np.arange(len(byFirst))
+        lastRuns = np.flatnonzero(rows == bandBottom - 1)
+        lastComponents = rank[np.searchsorted(groups, runNodes[lastRuns])]
+        isOpen = np.zeros(len(byFirst), bool)
+        isOpen[lastComponents] = True
+        openAt = np.flatnonzero(isOpen)
+        done = int(openAt[0]) if len(openAt) and bandBottom < len(self.claimed) else len(byFirst)
+
+        merged = [values[byFirst] for values in merged]
+        self.components = [values[done:] for values in merged]
+        self.lastStarts = starts[lastRuns]
+        self.lastEnds = ends[lastRuns]
+        self.lastComponents = lastComponents - done
+        return self.report(*[values[:done].tolist() for values in merged[:4]])
+
+    # Returns the bounds of complete components in order, dropping those covered by bounds reported earlier.
+    def report(self, lefts, tops, rights, bottoms):
+        found = []
+        for left, top, right, bottom in zip(lefts, tops, rights, bottoms):
+            region = self.claimed[top:bottom, left:right]
+            if region.all(): continue
+            region[...] = True
+            found.append((left, top, right - left, bottom - top))
+        return found
+
+# Same as findBounds, but searches the mask in horizontal bands, in a pool of workers processes when workers is
+# above 1. Yields (rows, bounds) after each band, where rows is the number of rows searched so far and bounds is a
+# list of the (x, y, w, h) tuples completed by the band, so callers can show sprites and cancel while searching.
+def findBoundsInBands(mask, workers=1, connectivity=8):
+    height, width = mask.shape
+    bands = splitBands(height, max(workers * 2 if workers > 1 else 1, mask.size // STREAM_BAND_PIXELS))
+    merger = BandMerger(width, height, connectivity)
+    labeled = labelBands(mask, bands, workers, connectivity)
+    try:
+        for top, bottom, (rows, starts, ends, labels) in labeled:
+            yield bottom, merger.add(top, bottom, rows, starts, ends, labels)
+    finally:
+        labeled.close()
+
+# Finds the bounding boxes of sprites in an image. Large images are searched across workers processes when
+# workers is above 1. Results are looked up in and saved to cache, a detectcache.DetectionCache, when given.
+# Pixels are part of a sprite if their alpha is above alphaThreshold and, with a colorkey.ColorKey, their color
+# isn't the key. Returns list of Rect
+def find(img, workers=1, connectivity=8, alphaThreshold=0, cache=None, colorKey=None):
+    if cache is not None:
+        key = getDetectionKey(img, connectivity, alphaThreshold, colorKey)
+        spriteBounds = cache.get(key)
+        if spriteBounds is not None:
+            instrument.count('detectCacheHits')
+            return [Rect(*bounds) for bounds in spriteBounds]
+
+    with instrument.span('detect', width=img.Width, height=img.Height):
+        if np is None:
+            spriteBounds = [rect.Get() for rect in findPerPixel(img, connectivity, alphaThreshold, colorKey)]
+        else:
+            mask = getForegroundMask(img, alphaThreshold, colorKey)
+            if shouldTile(mask.size, workers):
+                spriteBounds = findBoundsTiled(mask, workers, connectivity)
+            else:
+                spriteBounds = findBounds(mask, connectivity)
+    instrument.count('spritesFound', len(spriteBounds))
+
+    if cache is not None: cache.put(key, spriteBounds)
+    return [Rect(*bounds) for bounds in spriteBounds]
@@ -0,0 +1,189 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pngio
+import spritefinder
+from imagebackend import RgbaImage
+
+# Pins what the sprite finder reports since it moved to connected-component labeling. The old finder reported
+# one pixel wide sprites as two pixels wide, and split sprites whose pixels only touch at their corners.
+
+# Returns rows of text with a random scattering of opaque pixels.
+def makeRandomRows(width, height, density, seed):
+    generator = random.Random(seed)
+    return [''.join('#' if generator.random() < density else '.' for x in range(width)) for y in range(height)]
+
+# Returns an RgbaImage from rows of text, where '#' is an opaque pixel and anything else is transparent.
+def makeImage(rows):
+    width, height = len(rows[0]), len(rows)
+    data = bytearray(width * height * 4)
+    for y, row in enumerate(rows):
+        for x, char in enumerate(row):
+            if char == '#': data[(y * width + x) * 4:(y * width + x + 1) * 4] = b'\xff\xff\xff\xff'
+    return RgbaImage(width, height, data)
+
+class SpriteFinderTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    # Returns the bounds every backend finds in rows, after checking they all agree.
+    def findAll(self, rows, connectivity=8):
+        img = makeImage(rows)
+        found = [[rect.Get() for rect in spritefinder.findPerPixel(img, connectivity)]]
+
+        fileName = os.path.join(self.tempDir, 'sheet.png')
+        pngio.writePng(fileName, img.Width, img.Height, img.data)
+        found.append([rect.Get() for rect in spritefinder.findStreaming(fileName, connectivity)])
+
+        if spritefinder.np is not None:
+            mask = spritefinder.getForegroundMask(img)
+            found.append(spritefinder.findBounds(mask, connectivity))
+            banded = []
+            for rows, bounds in spritefinder.findBoundsInBands(mask, 1, connectivity):
+                banded.extend(bounds)
+            found.append(banded)
+            found.append([rect.Get() for rect in spritefinder.find(img, connectivity=connectivity)])
+            for bandHeight in (1, 2, 3):
+                found.extend(self.findSplit(mask, bandHeight, connectivity))
+
+        for other in found[1:]:
+            self.assertEqual(other, found[0])
+        return found[0]
+
+    # Returns the bounds findBoundsInBands and findBoundsTiled find when the mask is split into bands of
+    # bandHeight rows, so every seam between them is crossed. Bands are labeled on this thread.
+    def findSplit(self, mask, bandHeight, connectivity=8):
+        height, width = mask.shape
+        saved = (spritefinder.STREAM_BAND_PIXELS, spritefinder.TILED_MIN_BAND_HEIGHT, spritefinder.ProcessPoolExecutor)
+        spritefinder.STREAM_BAND_PIXELS = width * bandHeight
+        spritefinder.TILED_MIN_BAND_HEIGHT = bandHeight
+        spritefinder.ProcessPoolExecutor = None
+        try:
+            banded = []
+            for rows, bounds in spritefinder.findBoundsInBands(mask, 1, connectivity):
+                banded.extend(bounds)
+            tiled = spritefinder.findBoundsTiled(mask, height, connectivity)
+        finally:
+            spritefinder.STREAM_BAND_PIXELS, spritefinder.TILED_MIN_BAND_HEIGHT, spritefinder.ProcessPoolExecutor = saved
+        return [banded, tiled]
+
+    def testSinglePixel(self):
+        self.assertEqual(self.findAll(['...', '.#.', '...']), [(1, 1, 1, 1)])
+
+    def testOnePixelWideLines(self):
+        self.assertEqual(self.findAll([
+            '#....',
+            '#.###',
+            '#....',
+        ]), [(0, 0, 1, 3), (2, 1, 3, 1)])
+
+    def testDiagonalIsOneSprite(self):
+        rows = [
+            '#...',
+            '.#..',
+            '..#.',
+            '...#',
+        ]
+        self.assertEqual(self.findAll(rows), [(0, 0, 4, 4)])
+        self.assertEqual(self.findAll(rows, 4), [(0, 0, 1, 1), (1, 1, 1, 1), (2, 2, 1, 1), (3, 3, 1, 1)])
+
+    def testCrossIsOneSprite(self):
+        self.assertEqual(self.findAll([
+            '#...#',
+            '.#.#.',
+            '..#..',
+            '.#.#.',
+            '#...#',
+        ]), [(0, 0, 5, 5)])
+
+    def testCornerTouchingShapesJoin(self):
+        self.assertEqual(self.findAll([
+            '##....',
+            '##....',
+            '..##..',
+            '..##..',
+            '......',
+            '.....#',
+        ]), [(0, 0, 4, 4), (5, 5, 1, 1)])
+
+    def testNestedSpriteIsDropped(self):
+        self.assertEqual(self.findAll([
+            '#####.',
+            '#...#.',
+            '#.#.#.',
+            '#...#.',
+            '#####.',
+            '......',
+        ]), [(0, 0, 5, 5)])
+
+    def testOrderedByFirstPixel(self):
+        self.assertEqual(self.findAll([
+            '....#',
+            '#...#',
+            '#....',
+            '...#.',
+        ]), [(4, 0, 1, 2), (0, 1, 1, 2), (3, 3, 1, 1)])
+
+    def testUShapesJoinBelowSeams(self):
+        self.assertEqual(self.findAll([
+            '#..#.#...#',
+            '#..#.#...#',
+            '#..#.#.#.#',
+            '####.#.#.#',
+            '.....#.#.#',
+            '.....#####',
+        ]), [(0, 0, 4, 4), (5, 0, 5, 6)])
+
+    def testArchSplitsBelowSeams(self):
+        self.assertEqual(self.findAll([
+            '######..',
+            '#....#..',
+            '#....#.#',
+            '#....#.#',
+            '#......#',
+        ]), [(0, 0, 6, 5), (7, 2, 1, 3)])
+
+    def testDiagonalContactsAcrossSeams(self):
+        rows = [
+            '#.....#.',
+            '.#...#..',
+            '..#.#...',
+            '...#....',
+            '..#.#..#',
+            '.#...##.',
+        ]
+        self.assertEqual(self.findAll(rows), [(0, 0, 8, 6)])
+        self.assertEqual(len(self.findAll(rows, 4)), 12)
+
+    def testRandomSheets(self):
+        for seed in range(20):
+            rows = makeRandomRows(23, 17, 0.45, seed)
+            self.findAll(rows)
+            self.findAll(rows, 4)
+
+    @unittest.skipIf(spritefinder.np is None or spritefinder.ProcessPoolExecutor is None, 'needs NumPy and a process pool')
+    def testTiledWithWorkers(self):
+        img = makeImage(makeRandomRows(97, 64, 0.4, 1))
+        expected = [rect.Get() for rect in spritefinder.findPerPixel(img)]
+        saved = spritefinder.TILED_MIN_BAND_HEIGHT
+        spritefinder.TILED_MIN_BAND_HEIGHT = 4
+        try:
+            found = spritefinder.findBoundsTiled(spritefinder.getForegroundMask(img), 2)
+        finally:
+            spritefinder.TILED_MIN_BAND_HEIGHT = saved
+        self.assertEqual(found, expected)
+
+    def testEmptySheet(self):
+        self.assertEqual(self.findAll(['....', '....']), [])
+
+if __name__ == '__main__':
+    unittest.main()
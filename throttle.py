@@ -0,0 +1,18 @@
+import time
+
+# Progress is reported at most this many times a second, about as often as the screen can show it.
+MAX_REPORTS_PER_SECOND = 30
+
+# Limits how often something happens to once per interval seconds.
+class Throttle():
+    def __init__(self, interval=1.0 / MAX_REPORTS_PER_SECOND, clock=time.time):
+        self.interval = interval
+        self.clock = clock
+        self.last = None
+
+    # Returns True, at most once per interval. The first call always does.
+    def ready(self):
+        now = self.clock()
+        if self.last is not None and now - self.last < self.interval: return False
+        self.last = now
+        return True
@@ -0,0 +1,128 @@
+import threading
+from lrucache import LruCache
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue # Python 2
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # Without NumPy sheets are drawn by scaling the whole bitmap.
+
+TILE_SIZE = 256
+
+# Sheet pixels split into TILE_SIZE tiles, with each level half the size of the one below it like a map viewer.
+# Level 0 is full size. Tiles are built on a background thread when first asked for, and kept in a cache bounded
+# by bytes. onTileReady(key) is called from that thread when a requested tile is built.
+class TilePyramid():
+    def __init__(self, rgba, maxBytes=256 * 1024 * 1024, onTileReady=None):
+        self.rgba = rgba # (height, width, 4) uint8 array
+        self.height, self.width = rgba.shape[:2]
+        self.onTileReady = onTileReady
+        self.cache = LruCache(maxBytes)
+        self.lock = threading.Lock()
+
+        self.levels = 1
+        while max(self.getLevelSize(self.levels - 1)) > TILE_SIZE:
+            self.levels += 1
+
+        # Most recently requested tiles are built first, since they're what is on screen now.
+        self.requests = queue.LifoQueue()
+        self.pending = set()
+        self.running = True
+        self.thread = threading.Thread(target=self.buildRequested)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.requests.put(None)
+
+    # Returns the (width, height) of the whole sheet at a level.
+    def getLevelSize(self, level):
+        scale = 1 << level
+        return ((self.width + scale - 1) // scale, (self.height + scale - 1) // scale)
+
+    # Returns the level that best fits a zoom: the smallest one that is still at least as detailed as the zoom.
+    def getLevel(self, zoom):
+        level = 0
+        while level + 1 < self.levels and (1 << (level + 1)) * zoom <= 1.0:
+            level += 1
+        return level
+
+    # Returns the (level, column, row) keys of the tiles covering an area given in sheet pixels.
+    def getTileKeys(self, level, x, y, w, h):
+        span = TILE_SIZE << level
+        levelWidth, levelHeight = self.getLevelSize(level)
+        columns = (levelWidth + TILE_SIZE - 1) // TILE_SIZE
+        rows = (levelHeight + TILE_SIZE - 1) // TILE_SIZE
+        left = max(0, int(x // span))
+        top = max(0, int(y // span))
+        right = min(columns - 1, int((x + w) // span))
+        bottom = min(rows - 1, int((y + h) // span))
+        return [(level, column, row) for row in range(top, bottom + 1) for column in range(left, right + 1)]
+
+    # Returns a tile's (height, width, 4) pixels if built, otherwise queues it to be built and returns None.
+    def getTile(self, key):
+        with self.lock:
+            tile = self.cache.lookup(key)
+            if tile is not None: return tile
+            if key not in self.pending:
+                self.pending.add(key)
+                self.requests.put(key)
+        return None
+
+    def buildRequested(self):
+        while self.running:
+            key = self.requests.get()
+            if key is None or not self.running: return
+            self.buildTile(key)
+            with self.lock:
+                self.pending.discard(key)
+            if self.onTileReady is not None: self.onTileReady(key)
+
+    # Builds a tile and the tiles it's made from, using cached ones where possible. Returns its pixels.
+    def buildTile(self, key):
+        with self.lock:
+            tile = self.cache.lookup(key)
+        if tile is not None: return tile
+
+        level, column, row = key
+        if level == 0:
+            tile = np.ascontiguousarray(self.rgba[row * TILE_SIZE:(row + 1) * TILE_SIZE, column * TILE_SIZE:(column + 1) * TILE_SIZE])
+        else:
+            # Join the four tiles below this one, then halve them.
+            below = []
+            for childRow in (row * 2, row * 2 + 1):
+                parts = [self.buildTile((level - 1, childColumn, childRow)) for childColumn in (column * 2, column * 2 + 1) if self.hasTile((level - 1, childColumn, childRow))]
+                if parts: below.append(np.concatenate(parts, axis=1))
+            tile = downsample(np.concatenate(below, axis=0))
+
+        with self.lock:
+            self.cache.put(key, tile, tile.nbytes)
+        return tile
+
+    def hasTile(self, key):
+        level, column, row = key
+        levelWidth, levelHeight = self.getLevelSize(level)
+        return column * TILE_SIZE < levelWidth and row * TILE_SIZE < levelHeight
+
+# Halves an RGBA array in each direction, averaging every 2x2 block with alpha weighting so transparent pixels
+# don't darken the edges of sprites. Odd sizes repeat their last row or column.
+def downsample(pixels):
+    height, width = pixels.shape[:2]
+    if height % 2: pixels = np.concatenate([pixels, pixels[-1:]], axis=0)
+    if width % 2: pixels = np.concatenate([pixels, pixels[:, -1:]], axis=1)
+
+    pixels = pixels.astype(np.uint32)
+    alpha = pixels[:, :, 3:4]
+    weighted = np.concatenate([pixels[:, :, :3] * alpha, alpha], axis=2)
+    summed = weighted[0::2, 0::2] + weighted[1::2, 0::2] + weighted[0::2, 1::2] + weighted[1::2, 1::2]
+
+    out = np.empty(summed.shape, np.uint8)
+    totalAlpha = summed[:, :, 3:4]
+    out[:, :, :3] = np.where(totalAlpha > 0, summed[:, :, :3] // np.maximum(totalAlpha, 1), 0)
+    out[:, :, 3] = summed[:, :, 3] // 4
+    return out